@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Samsara endpoints the data handler uses, serving a synthetic fleet.
+
+Run it and point the handler at it with SAMSARA_BASE_URL, e.g.
+    python benchmarks/mock_samsara.py --vehicles 50 --sensors-per-vehicle 4 --port 8090
+    SAMSARA_BASE_URL=http://localhost:8090 python data_handler/src/get_data_main.py
+"""
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timezone
+from typing import Any
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import argparse
+import json
+import random
+import threading
+import time
+
+DAY_MS = 86_400_000
+# door sensors open for DOOR_OPEN_MS once every DOOR_CYCLE_MS, staggered per sensor
+DOOR_CYCLE_MS = 4 * 3_600_000
+DOOR_OPEN_MS = 2_700_000
+
+
+class SyntheticFleet:
+    """N vehicles with M sensors each, every reading a deterministic function of sensor and time.
+
+    Even sensors of a vehicle report temperature, odd ones door state, so the same
+    fleet and time range always give the same payloads and benchmark runs compare.
+    """
+
+    def __init__(self, num_vehicles: int, sensors_per_vehicle: int, reading_interval_ms: int = 60_000) -> None:
+        """Configure the fleet.
+
+        Args:
+            num_vehicles: vehicles returned by /fleet/vehicles.
+            sensors_per_vehicle: sensors assigned to each vehicle.
+            reading_interval_ms: how often the latest reading of a sensor moves on.
+        """
+        self.num_vehicles = num_vehicles
+        self.sensors_per_vehicle = sensors_per_vehicle
+        self.reading_interval_ms = reading_interval_ms
+
+    @property
+    def num_sensors(self) -> int:
+        return self.num_vehicles * self.sensors_per_vehicle
+
+    def vehicle_id(self, vehicle_index: int) -> int:
+        return 100_000 + vehicle_index
+
+    def sensor_vehicle_id(self, sensor_id: int) -> int:
+        return self.vehicle_id(sensor_id // self.sensors_per_vehicle)
+
+    def is_door(self, sensor_id: int) -> bool:
+        return (sensor_id % self.sensors_per_vehicle) % 2 == 1
+
+    def vehicle(self, vehicle_index: int) -> dict[str, Any]:
+        """One /fleet/vehicles entry."""
+        vehicle_id = self.vehicle_id(vehicle_index)
+        return {
+            "id": str(vehicle_id),
+            "name": f"Truck {vehicle_index}",
+            "make": "Freightliner",
+            "model": "Cascadia",
+            "year": str(2015 + vehicle_index % 10),
+            "serial": f"G{vehicle_id}",
+            "vin": f"1FUJGLDR{vehicle_id:09d}",
+            "vehicleRegulationMode": "regulated",
+            "createdAtTime": "2024-01-01T00:00:00Z",
+            "updatedAtTime": "2024-01-01T00:00:00Z",
+            "attributes": [],
+            "externalIds": {"samsara.serial": f"G{vehicle_id}", "samsara.vin": f"1FUJGLDR{vehicle_id:09d}"},
+            "gateway": {"serial": f"GW-{vehicle_id}", "model": "VG54"},
+            "sensorConfiguration": {"areas": []},
+        }
+
+    def sensor(self, sensor_id: int) -> dict[str, Any]:
+        """One /v1/sensors/list entry."""
+        return {"id": sensor_id, "name": f"EM{sensor_id:04d}-SYN-{sensor_id % 997:03d}", "macAddress": f"mac-{sensor_id:06d}"}
+
+    @staticmethod
+    def temperatures(sensor_ids: np.ndarray, time_ms: np.ndarray) -> np.ndarray:
+        """Ambient temperature in millidegrees Celsius, a daily cycle plus a little hashed noise."""
+        phase = 2 * np.pi * (time_ms[..., None] % DAY_MS) / DAY_MS + sensor_ids * 0.7
+        noise = (time_ms[..., None] // 60_000 * 2654435761 + sensor_ids * 97) % 1000 - 500
+        return (4000 + 2000 * np.sin(phase) + noise).astype(np.int64)
+
+    @staticmethod
+    def _door_cycle_offset_ms(sensor_ids: np.ndarray) -> np.ndarray:
+        return sensor_ids * 600_007 % DOOR_CYCLE_MS
+
+    @classmethod
+    def doors_closed(cls, sensor_ids: np.ndarray, time_ms: np.ndarray) -> np.ndarray:
+        """1 while the door is closed, it opens for DOOR_OPEN_MS in every DOOR_CYCLE_MS."""
+        cycle_ms = (time_ms[..., None] + cls._door_cycle_offset_ms(sensor_ids)) % DOOR_CYCLE_MS
+        return (cycle_ms >= DOOR_OPEN_MS).astype(np.int64)
+
+    @classmethod
+    def door_changed_ms(cls, sensor_ids: np.ndarray, time_ms: int) -> np.ndarray:
+        """When each door last opened or closed, at or before time_ms."""
+        cycle_ms = (time_ms + cls._door_cycle_offset_ms(sensor_ids)) % DOOR_CYCLE_MS
+        return time_ms - np.where(cycle_ms >= DOOR_OPEN_MS, cycle_ms - DOOR_OPEN_MS, cycle_ms)
+
+    def latest_time_ms(self) -> int:
+        """Time of the newest reading, it only moves on once per reading interval."""
+        now_ms = int(time.time() * 1000)
+        return now_ms - now_ms % self.reading_interval_ms
+
+
+class FaultInjection:
+    """Latency, server errors and rate limiting applied to every request."""
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        latency_jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after_s: float = 0.1,
+        seed: int = 0,
+    ) -> None:
+        """Configure the faults.
+
+        Args:
+            latency_ms: fixed delay before every response.
+            latency_jitter_ms: extra uniformly distributed delay on top.
+            error_rate: share of requests answered with a 500.
+            rate_limit_rate: share of requests answered with a 429.
+            retry_after_s: Retry-After sent with every 429.
+            seed: seed of the fault draws, so runs see the same sequence.
+        """
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_s = retry_after_s
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> tuple[float, int | None]:
+        """Delay in seconds and the error status to answer with, None for a normal response."""
+        with self._lock:
+            delay_s = (self.latency_ms + self._random.uniform(0, self.latency_jitter_ms)) / 1000
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return delay_s, 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return delay_s, 500
+        return delay_s, None
+
+
+class MockSamsaraServer(ThreadingHTTPServer):
+    """Threaded http server answering like the Samsara api for a synthetic fleet."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], fleet: SyntheticFleet, faults: FaultInjection | None = None) -> None:
+        super().__init__(address, _MockRequestHandler)
+        self.fleet = fleet
+        self.faults = faults if faults is not None else FaultInjection()
+        self.request_counts: dict[str, int] = {}
+        self._counts_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{'localhost' if host in ('0.0.0.0', '') else host}:{port}"
+
+    def count_request(self, path: str, status: int) -> None:
+        with self._counts_lock:
+            key = f"{path} {status}"
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+
+    def start_in_thread(self) -> MockSamsaraServer:
+        """Serve from a daemon thread, e.g. inside a benchmark run."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _MockRequestHandler(BaseHTTPRequestHandler):
+    """GET /fleet/vehicles, POST /v1/sensors/{list,temperature,door,history}."""
+
+    protocol_version = "HTTP/1.1"
+    server: MockSamsaraServer
+
+    def _send_json(self, status_code: int, body: Any, headers: dict[str, str] | None = None) -> None:
+        payload = json.dumps(body, separators=(",", ":")).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        self.server.count_request(urlparse(self.path).path, status_code)
+
+    def _apply_faults(self) -> bool:
+        """Sleep and maybe answer with an error, True if the request was answered."""
+        delay_s, status_code = self.server.faults.draw()
+        if delay_s > 0:
+            time.sleep(delay_s)
+        if status_code == 429:
+            self._send_json(429, {"message": "rate limit exceeded"}, {"Retry-After": str(self.server.faults.retry_after_s)})
+            return True
+        if status_code is not None:
+            self._send_json(status_code, {"message": "injected server error"})
+            return True
+        return False
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path != "/fleet/vehicles":
+            self._send_json(404, {"message": "unknown route"})
+            return
+        if self._apply_faults():
+            return
+        params = parse_qs(url.query)
+        fleet = self.server.fleet
+        limit = int(params.get("limit", ["100"])[0])
+        first = int(params.get("after", ["0"])[0] or 0)
+        last = min(first + limit, fleet.num_vehicles)
+        self._send_json(200, {
+            "data": [fleet.vehicle(vehicle_index) for vehicle_index in range(first, last)],
+            "pagination": {"endCursor": str(last) if last < fleet.num_vehicles else "", "hasNextPage": last < fleet.num_vehicles},
+        })
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        routes = {
+            "/v1/sensors/list": self._sensor_list,
+            "/v1/sensors/temperature": self._latest_temperature,
+            "/v1/sensors/door": self._latest_door,
+            "/v1/sensors/history": self._history,
+        }
+        if url.path not in routes:
+            self._send_json(404, {"message": "unknown route"})
+            return
+        if self._apply_faults():
+            return
+        self._send_json(200, routes[url.path](body))
+
+    def _sensor_list(self, body: dict[str, Any]) -> dict[str, Any]:
+        fleet = self.server.fleet
+        return {"sensors": [fleet.sensor(sensor_id) for sensor_id in range(fleet.num_sensors)]}
+
+    def _known_sensor_ids(self, body: dict[str, Any], door: bool) -> list[int]:
+        fleet = self.server.fleet
+        return [
+            int(sensor_id) for sensor_id in body.get("sensors", [])
+            if 0 <= int(sensor_id) < fleet.num_sensors and fleet.is_door(int(sensor_id)) == door
+        ]
+
+    def _latest_temperature(self, body: dict[str, Any]) -> dict[str, Any]:
+        fleet = self.server.fleet
+        sensor_ids = self._known_sensor_ids(body, door=False)
+        time_ms = fleet.latest_time_ms()
+        values = fleet.temperatures(np.asarray(sensor_ids, dtype=np.int64), np.asarray(time_ms))
+        reading_time = _iso_time(time_ms)
+        return {"groupId": 1, "sensors": [
+            {"id": sensor_id, "name": fleet.sensor(sensor_id)["name"], "vehicleId": fleet.sensor_vehicle_id(sensor_id),
+             "ambientTemperature": int(value), "ambientTemperatureTime": reading_time}
+            for sensor_id, value in zip(sensor_ids, values)
+        ]}
+
+    def _latest_door(self, body: dict[str, Any]) -> dict[str, Any]:
+        fleet = self.server.fleet
+        sensor_ids = self._known_sensor_ids(body, door=True)
+        time_ms = fleet.latest_time_ms()
+        sensor_id_array = np.asarray(sensor_ids, dtype=np.int64)
+        values = fleet.doors_closed(sensor_id_array, np.asarray(time_ms))
+        # the status time is when the door last changed, like the real endpoint reports it
+        changed_ms = fleet.door_changed_ms(sensor_id_array, time_ms)
+        return {"groupId": 1, "sensors": [
+            {"id": sensor_id, "name": fleet.sensor(sensor_id)["name"], "vehicleId": fleet.sensor_vehicle_id(sensor_id),
+             "doorClosed": bool(value), "doorStatusTime": _iso_time(int(status_ms))}
+            for sensor_id, value, status_ms in zip(sensor_ids, values, changed_ms)
+        ]}
+
+    def _history(self, body: dict[str, Any]) -> dict[str, Any]:
+        fleet = self.server.fleet
+        time_ms = np.arange(int(body["startMs"]), int(body["endMs"]), int(body["stepMs"]), dtype=np.int64)
+        series = body.get("series", [])
+        sensor_ids = np.asarray([int(entry["widgetId"]) for entry in series], dtype=np.int64)
+        is_door = np.asarray([entry["field"] == "doorClosed" for entry in series], dtype=bool)
+        values = np.where(is_door, fleet.doors_closed(sensor_ids, time_ms), fleet.temperatures(sensor_ids, time_ms))
+        return {"results": [
+            {"timeMs": int(timestamp), "series": row}
+            for timestamp, row in zip(time_ms.tolist(), values.tolist())
+        ]}
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def _iso_time(epoch_ms: int) -> str:
+    return datetime.fromtimestamp(epoch_ms / 1000, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def main():
+    """Serve a synthetic fleet until interrupted."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default="0.0.0.0")
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--vehicles', type=int, default=10)
+    parser.add_argument('--sensors-per-vehicle', type=int, default=2)
+    parser.add_argument('--reading-interval-ms', type=int, default=60_000)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--latency-jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after-s', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fleet = SyntheticFleet(args.vehicles, args.sensors_per_vehicle, args.reading_interval_ms)
+    faults = FaultInjection(
+        args.latency_ms, args.latency_jitter_ms, args.error_rate, args.rate_limit_rate, args.retry_after_s, args.seed,
+    )
+    server = MockSamsaraServer((args.host, args.port), fleet, faults)
+    print(f"[MOCK] Serving {fleet.num_vehicles} vehicles x {fleet.sensors_per_vehicle} sensors on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[MOCK] Stopped.")
+
+
+if __name__ == "__main__":
+    """execute only if run as a script"""
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""Repeatable performance numbers for ingestion, the warehouse write and the dashboard, run against the mock api.
+
+Run from the repository root with the handler importable, e.g.
+    PYTHONPATH=data_handler:data_handler/src python benchmarks/run_benchmarks.py \
+        --vehicles 50 --sensors-per-vehicle 4 --timestamps 480 --output bench.json
+
+Dashboard latencies are only measured when --server-url points at a running data server.
+Everything else writes to a scratch directory, never to /data_handler/data. That includes
+the history backfill checkpoints, which live under each run's scratch history cache.
+"""
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+import numpy as np
+import pandas as pd
+import argparse
+import asyncio
+import httpx
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mock_samsara import SyntheticFleet, FaultInjection, MockSamsaraServer  # noqa: E402
+from src.api_handler import URLRequestHandler  # noqa: E402
+from src.change_feed import ChangeNotifier  # noqa: E402
+from src.constants import HISTORY_STEP_MS  # noqa: E402
+from src.data_store import PartitionedParquetStore  # noqa: E402
+from src.dimensions import VehicleDimension, SensorDimension  # noqa: E402
+from src.get_data_main import (  # noqa: E402
+    update_data_warehouse,
+    update_data_warehouse_from_latest,
+    update_data_warehouse_from_time_range,
+)
+from src.history_cache import HistoryCache  # noqa: E402
+from src.ingest_index import IngestIndex  # noqa: E402
+from src.rollups import RollupStore  # noqa: E402
+
+# history ranges start here, fixed so every run requests the same payloads
+BENCH_START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+INPUT_DATETIME_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def latency_summary(samples_s: list[float]) -> dict[str, float]:
+    """Count, mean and tail percentiles of latency samples, in seconds."""
+    if not samples_s:
+        return {"count": 0}
+    samples = np.asarray(samples_s, dtype=np.float64)
+    return {
+        "count": len(samples),
+        "mean": round(float(samples.mean()), 6),
+        "p50": round(float(np.percentile(samples, 50)), 6),
+        "p90": round(float(np.percentile(samples, 90)), 6),
+        "p99": round(float(np.percentile(samples, 99)), 6),
+        "max": round(float(samples.max()), 6),
+    }
+
+
+async def _closing_session(coroutine: Any) -> Any:
+    """Await an ingestion, closing the pooled client before its event loop goes away."""
+    try:
+        return await coroutine
+    finally:
+        await URLRequestHandler.close_session()
+
+
+def bench_range_ingest(work_dir: str, fleet: SyntheticFleet, num_timestamps: int, repeats: int) -> dict[str, Any]:
+    """Cold history ingestion of num_timestamps steps for the whole fleet, a fresh cache and checkpoints every repeat."""
+    end = BENCH_START + timedelta(milliseconds=HISTORY_STEP_MS * num_timestamps)
+    start_time, end_time = BENCH_START.strftime(INPUT_DATETIME_FORMAT), end.strftime(INPUT_DATETIME_FORMAT)
+    runs = []
+    for repeat in range(repeats):
+        run_dir = os.path.join(work_dir, f"range_{repeat}")
+        save_path = os.path.join(run_dir, "sensor_history_data.parquet")
+        started = time.perf_counter()
+        timings = asyncio.run(_closing_session(update_data_warehouse_from_time_range(
+            start_time, end_time, HISTORY_STEP_MS,
+            history_cache=HistoryCache(cache_dir=os.path.join(run_dir, "history_cache")),
+            vehicle_dimension=VehicleDimension(os.path.join(run_dir, "vehicles.parquet")),
+            sensor_dimension=SensorDimension(os.path.join(run_dir, "sensors.parquet")),
+            save_path=save_path,
+        )))
+        seconds = time.perf_counter() - started
+        rows = len(pd.read_parquet(save_path)) if os.path.exists(save_path) else 0
+        runs.append({"seconds": round(seconds, 6), "rows_stored": rows, "timings": {k: round(v, 6) for k, v in timings.items()}})
+    readings = fleet.num_sensors * num_timestamps
+    seconds = [run["seconds"] for run in runs]
+    return {
+        "readings_requested": readings,
+        "latency": latency_summary(seconds),
+        "readings_per_s": round(readings / float(np.median(seconds)), 1),
+        "runs": runs,
+    }
+
+
+def bench_latest_ingest(work_dir: str, fleet: SyntheticFleet, polls: int) -> dict[str, Any]:
+    """Repeated latest polls into one store, as the worker runs them."""
+    run_dir = os.path.join(work_dir, "latest")
+    store = PartitionedParquetStore(os.path.join(run_dir, "sensor_data"))
+    rollups = RollupStore(os.path.join(run_dir, "rollups"))
+    vehicle_dimension = VehicleDimension(os.path.join(run_dir, "vehicles.parquet"))
+    sensor_dimension = SensorDimension(os.path.join(run_dir, "sensors.parquet"))
+    ingest_index = IngestIndex(os.path.join(run_dir, "ingest_index.json"))
+    change_notifier = ChangeNotifier(os.path.join(run_dir, "sensor_data_changes.json"))
+    seconds, stage_timings = [], []
+    for _ in range(polls):
+        started = time.perf_counter()
+        stage_timings.append(asyncio.run(_closing_session(update_data_warehouse_from_latest(
+            store, rollups, vehicle_dimension, sensor_dimension, ingest_index, change_notifier,
+        ))))
+        seconds.append(time.perf_counter() - started)
+    return {
+        "sensors_polled": fleet.num_sensors,
+        "latency": latency_summary(seconds),
+        "sensors_per_s": round(fleet.num_sensors / float(np.median(seconds)), 1),
+        "rows_stored": len(store.read_all()),
+        "first_poll_timings": {k: round(v, 6) for k, v in stage_timings[0].items()} if stage_timings else {},
+    }
+
+
+def bench_warehouse_growth(work_dir: str, fleet: SyntheticFleet, num_timestamps: int, steps: int) -> dict[str, Any]:
+    """Cost of update_data_warehouse appending the same sized batch to an ever larger history file."""
+    save_path = os.path.join(work_dir, "growth", "sensor_history_data.parquet")
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    sensor_ids = np.arange(fleet.num_sensors, dtype=np.int64)
+    start_ms = int(BENCH_START.timestamp() * 1000)
+    points = []
+    stored_rows = 0
+    for step in range(steps):
+        # consecutive time ranges, so every batch adds rows instead of replacing them
+        time_ms = start_ms + (step * num_timestamps + np.arange(num_timestamps, dtype=np.int64)) * HISTORY_STEP_MS
+        batch_df = pd.DataFrame({
+            "sensor_id": np.tile(sensor_ids, num_timestamps),
+            "ts": pd.to_datetime(np.repeat(time_ms, len(sensor_ids)), unit="ms", utc=True).as_unit("ms"),
+            "value": np.where(
+                np.tile(sensor_ids, num_timestamps) % 2 == 0,
+                SyntheticFleet.temperatures(sensor_ids, time_ms).ravel() * 0.0018 + 32,
+                SyntheticFleet.doors_closed(sensor_ids, time_ms).ravel(),
+            ).astype(np.float64),
+        })
+        started = time.perf_counter()
+        update_data_warehouse(batch_df, save_path, overwrite=step == 0)
+        points.append({"stored_rows_before": stored_rows, "batch_rows": len(batch_df), "seconds": round(time.perf_counter() - started, 6)})
+        stored_rows += len(batch_df)
+    return {"points": points, "file_bytes": os.path.getsize(save_path)}
+
+
+def bench_dashboard(server_url: str, requests: int, update_requests: int, timeout_s: float) -> dict[str, Any]:
+    """Latency percentiles of the main page and of a range update from submit until its series is ready."""
+    index_s, update_s, failures = [], [], 0
+    end = BENCH_START + timedelta(days=1)
+    form = {"start_time": BENCH_START.strftime("%Y-%m-%dT%H:%M"), "end_time": end.strftime("%Y-%m-%dT%H:%M")}
+    with httpx.Client(base_url=server_url, timeout=timeout_s) as client:
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.get("/")
+            index_s.append(time.perf_counter() - started)
+            failures += response.status_code != 200
+        for _ in range(update_requests):
+            started = time.perf_counter()
+            response = client.post("/api/update_plot", data=form)
+            if response.status_code != 202:
+                failures += 1
+                continue
+            status_url = response.json()["status_url"]
+            while (response := client.get(status_url)).status_code == 202:
+                if time.perf_counter() - started > timeout_s:
+                    break
+                time.sleep(0.05)
+            update_s.append(time.perf_counter() - started)
+            failures += response.status_code != 200
+    return {"index": latency_summary(index_s), "update_plot": latency_summary(update_s), "failures": failures}
+
+
+def _timed_section(name: str, run: Callable[[], dict[str, Any]]) -> dict[str, Any]:
+    print(f"[BENCH] Running {name}...")
+    result = run()
+    print(f"[BENCH] {name}: {json.dumps({k: v for k, v in result.items() if k not in ('runs', 'points')})}")
+    return result
+
+
+def main():
+    """Start the mock api, run every benchmark and write the results as json."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vehicles', type=int, default=10)
+    parser.add_argument('--sensors-per-vehicle', type=int, default=2)
+    parser.add_argument('--timestamps', type=int, default=48, help="history steps per sensor")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--polls', type=int, default=5)
+    parser.add_argument('--growth-steps', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--latency-jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--client-rate-limit-per-s', type=float, default=None, help="override the handler's client side limit")
+    parser.add_argument('--mock-url', type=str, default=None, help="use an already running mock instead of starting one")
+    parser.add_argument('--server-url', type=str, default=None, help="data server to measure / and /api/update_plot on")
+    parser.add_argument('--dashboard-requests', type=int, default=50)
+    parser.add_argument('--update-requests', type=int, default=5)
+    parser.add_argument('--timeout-s', type=float, default=300.0)
+    parser.add_argument('--work-dir', type=str, default=None, help="scratch directory, a temporary one is removed afterwards")
+    parser.add_argument('--output', type=str, default=None, help="json results file, printed if not given")
+    args = parser.parse_args()
+
+    fleet = SyntheticFleet(args.vehicles, args.sensors_per_vehicle)
+    mock_server = None
+    if args.mock_url is None:
+        faults = FaultInjection(args.latency_ms, args.latency_jitter_ms, args.error_rate, args.rate_limit_rate, seed=args.seed)
+        mock_server = MockSamsaraServer(("127.0.0.1", 0), fleet, faults).start_in_thread()
+    URLRequestHandler.SAMSARA_BASE_URL = args.mock_url or mock_server.base_url
+    if args.client_rate_limit_per_s is not None:
+        burst = max(1, int(args.client_rate_limit_per_s))
+        URLRequestHandler.configure_session(rate_limit_per_s=args.client_rate_limit_per_s, rate_limit_burst=burst)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="samsara_bench_")
+    try:
+        results: dict[str, Any] = {
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "work_dir")},
+            "range_ingest": _timed_section("range_ingest", lambda: bench_range_ingest(work_dir, fleet, args.timestamps, args.repeats)),
+            "latest_ingest": _timed_section("latest_ingest", lambda: bench_latest_ingest(work_dir, fleet, args.polls)),
+            "warehouse_growth": _timed_section(
+                "warehouse_growth", lambda: bench_warehouse_growth(work_dir, fleet, args.timestamps, args.growth_steps),
+            ),
+        }
+        if args.server_url:
+            results["dashboard"] = _timed_section("dashboard", lambda: bench_dashboard(
+                args.server_url, args.dashboard_requests, args.update_requests, args.timeout_s,
+            ))
+        if mock_server is not None:
+            results["mock_requests"] = dict(sorted(mock_server.request_counts.items()))
+    finally:
+        if mock_server is not None:
+            mock_server.shutdown()
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output)
+        print(f"[BENCH] Results written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    """execute only if run as a script"""
+    main()
@@ -2,34 +2,62 @@
 """This file handles loading api token from the container."""
 from __future__ import annotations
 from src.data_model import Vehicle, Sensor, GroupedTemperatureSensor, GroupedDoorSensor
-from src.constants import SamsaraEndpoints, SensorSerialNums, API_TOKEN_LOCATION
-from pydantic import BaseModel, Field
-from typing import Any
+from src.constants import SamsaraEndpoints, SensorKinds, SAMSARA_BASE_URL, VEHICLE_PAGE_LIMIT, HISTORY_STEP_MS
+from src.client_session import SamsaraClientSession, get_api_token  # noqa: F401
+from src.request_scheduler import SensorRequestScheduler
+from src.metrics import metrics
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, AsyncIterator
 import httpx
-from datetime import datetime
+import io
+import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.json as pa_json
+from datetime import datetime, timezone
 
 INPUT_DATETIME_FORMAT = '%Y-%m-%d %H:%M'
 
- # helper funciton to load secret API token
-def get_api_token() -> str | None:
-    """Helper to get secret API token."""
-    try:
-        with open(API_TOKEN_LOCATION, "r", encoding="ASCII") as token:
-            return token.read().strip()
-    except FileNotFoundError as exc:
-        print(f"[SETUP ERROR]:{exc} Could not find API token at {API_TOKEN_LOCATION}")
-        return None
-
 # helper function to convert datetime to epoch millis
-def _convert_datetime_to_epoch_millis(dt_str: str) -> int:
-    """Convert datetime to millis timestamp."""
-    dt_object = datetime.strptime(dt_str, INPUT_DATETIME_FORMAT)
+def convert_datetime_to_epoch_millis(dt_str: str) -> int:
+    """Convert a UTC datetime string to millis timestamp, independent of the container's local time."""
+    dt_object = datetime.strptime(dt_str, INPUT_DATETIME_FORMAT).replace(tzinfo=timezone.utc)
     return int(dt_object.timestamp() * 1000)
 
 # === Request Handler ===
 class URLRequestHandler:
     """Main handler for getting url requests."""
-    SAMSARA_BASE_URL: str = "https://api.samsara.com"
+    SAMSARA_BASE_URL: str = SAMSARA_BASE_URL
+    _session: SamsaraClientSession | None = None
+
+    @classmethod
+    def get_session(cls) -> SamsaraClientSession:
+        """Get the shared client session, creating one with default settings if needed.
+
+        Returns:
+            long-lived session owning the connection pool and api token.
+        """
+        if URLRequestHandler._session is None:
+            URLRequestHandler._session = SamsaraClientSession()
+        return URLRequestHandler._session
+
+    @classmethod
+    def configure_session(cls, **session_kwargs: Any) -> SamsaraClientSession:
+        """Replace the shared session with one using custom pool limits and timeouts.
+
+        Args:
+            session_kwargs: forwarded to SamsaraClientSession.
+        Returns:
+            the newly configured session.
+        """
+        URLRequestHandler._session = SamsaraClientSession(**session_kwargs)
+        return URLRequestHandler._session
+
+    @classmethod
+    async def close_session(cls) -> None:
+        """Close the shared session's connection pool."""
+        if URLRequestHandler._session is not None:
+            await URLRequestHandler._session.aclose()
 
     @classmethod
     def get_request_url(cls, end_point_list: list[str]) -> str:
@@ -50,11 +78,34 @@ class URLRequestHandler:
         Returns:
             dictionary containing head and authorization token.
         """
-        api_token = get_api_token()
-        header = {
-            "Authorization": f"Bearer {api_token}",
-        }
-        return header
+        return URLRequestHandler.get_session().authorization_header
+
+    @classmethod
+    async def _send_request(cls, method: str, request_url: str, **kwargs: Any) -> bytes | None:
+        """Send a request over the shared session.
+
+        Args:
+            method: http method, e.g. 'POST'.
+            request_url: full request url.
+            kwargs: forwarded to httpx, e.g. json payload.
+        Returns:
+            raw json body of requested data, if successful, left for the response models to decode.
+        """
+        endpoint = request_url.removeprefix(cls.SAMSARA_BASE_URL)
+        try:
+            with metrics.timer("http_fetch", endpoint=endpoint):
+                response = await URLRequestHandler.get_session().request(method, request_url, **kwargs)
+            metrics.count("http_responses", endpoint=endpoint, status=response.status_code)
+            metrics.count("http_bytes_received", len(response.content), endpoint=endpoint)
+            response.raise_for_status()
+            print(f"[REQUEST] Status: {request_url}={response.status_code}")
+            return response.content
+        except httpx.HTTPStatusError as status_error:
+            print(f"[REQUEST] HTTP error occured: {status_error}")
+        except httpx.RequestError as request_error:
+            metrics.count("http_errors", endpoint=endpoint, error=type(request_error).__name__)
+            print(f"[REQUEST] Error occured during request: {request_error}")
+        return None
 
     @classmethod
     async def fetch_data_httpx(cls, suffix: str, asset_suffix: str) -> dict[str, Any] | None:
@@ -66,85 +117,119 @@ class URLRequestHandler:
         Returns:
             json of requested data, if successful.
         """
-        # get url and authorization header
         request_url = URLRequestHandler.get_request_url(end_point_list=[suffix, asset_suffix])
-        authorization_header = URLRequestHandler.get_authorization_header()
-        # use httpx to connect with Samsara api
-        async with httpx.AsyncClient(headers=authorization_header) as client:
-            try:
-                response = await client.get(request_url)
-                response.raise_for_status()
-                print(f"[REQUEST] Status: {request_url}={response.status_code}")
-                return response.json()
-            except httpx.HTTPStatusError as status_error:
-                print(f"[REQUEST] HTTP error occured: {status_error}")
-            except httpx.RequestError as request_error:
-                print(f"[REQUEST] Error occured during request: {request_error}")
+        response = await URLRequestHandler._send_request("GET", request_url)
+        return json.loads(response) if response is not None else None
         
     @classmethod
-    async def get_sensor_list(cls) -> dict[str, Any] | None:
+    async def iter_vehicle_pages(cls, limit: int = VEHICLE_PAGE_LIMIT) -> AsyncIterator[VehicleAPIResponse]:
+        """Follow the /fleet/vehicles pagination cursors, one page at a time.
+
+        Args:
+            limit: vehicles requested per page.
+        Returns:
+            async iterator over vehicle pages, stops early if a page request fails.
+        """
+        request_url = URLRequestHandler.get_request_url([SamsaraEndpoints.FLEET, SamsaraEndpoints.VEHICLES])
+        params: dict[str, Any] = {"limit": limit}
+        while True:
+            response = await URLRequestHandler._send_request("GET", request_url, params=params)
+            if response is None:
+                print("[API VEHICLE WRAPPER] Pagination stopped on an empty response.")
+                return
+            vehicle_page = VehicleAPIResponse.from_json(response)
+            yield vehicle_page
+            if not vehicle_page.has_next_page:
+                return
+            params = {"limit": limit, "after": vehicle_page.end_cursor}
+
+    @classmethod
+    async def get_sensor_list(cls) -> bytes | None:
         """Grab all available sensors.
         
         Returns:
-            json of requested data, if successful.
+            raw json of requested data, if successful.
         """
-        # get url and authorization header
         request_url = URLRequestHandler.get_request_url(
             [SamsaraEndpoints.V1, SamsaraEndpoints.SENSORS, SamsaraEndpoints.LIST]
         )
-        authorization_header = URLRequestHandler.get_authorization_header()
-        async with httpx.AsyncClient(headers=authorization_header) as client:
-            try:
-                response = await client.post(request_url)
-                response.raise_for_status()
-                print(f"[REQUEST] Status: {request_url}={response.status_code}")
-                return response.json()
-            except httpx.HTTPStatusError as status_error:
-                print(f"[REQUEST] HTTP error occured: {status_error}")
-            except httpx.RequestError as request_error:
-                print(f"[REQUEST] Error occured during request: {request_error}")
+        return await URLRequestHandler._send_request("POST", request_url)
+
+    @classmethod
+    async def _post_sensor_batch(cls, sensor_endpoint: str, batch_ids: list[int]) -> bytes | None:
+        """Request the latest readings of a batch of sensors from one endpoint, e.g. 'door'."""
+        request_url = URLRequestHandler.get_request_url(
+            [SamsaraEndpoints.V1, SamsaraEndpoints.SENSORS, sensor_endpoint],
+        )
+        payload = {
+            "sensors": batch_ids
+        }
+        return await URLRequestHandler._send_request("POST", request_url, json=payload)
+
+    @classmethod
+    async def get_sensor_kinds(
+        cls, sensor_ids: list[int], scheduler: SensorRequestScheduler | None = None,
+        ) -> dict[int, str]:
+        """Find the kind of reading each sensor reports, by asking every sensor endpoint about them.
+
+        Only needed for sensors that are not in the sensor dimension yet.
+
+        Args:
+            sensor_ids: sensors of unknown kind.
+            scheduler: batch size and concurrency settings, defaults used if not given.
+        Returns:
+            sensor id -> SensorKinds value, sensors no endpoint reports a reading for are left out.
+        """
+        scheduler = scheduler if scheduler is not None else SensorRequestScheduler()
+        reported_fields = {SensorKinds.TEMPERATURE: "ambientTemperature", SensorKinds.DOOR: "doorClosed"}
+        batches = []
+        for sensor_kind in reported_fields:
+            batches += scheduler.build_batches([sensor_kind] * len(sensor_ids), sensor_ids)
+        batch_responses = await scheduler.run(batches, URLRequestHandler._post_sensor_batch)
+
+        sensor_kinds: dict[int, str] = {}
+        for (sensor_kind, _), response in zip(batches, batch_responses):
+            if response is None:
+                continue
+            for sensor in json.loads(response).get("sensors", []):
+                if sensor.get(reported_fields[sensor_kind]) is not None:
+                    sensor_kinds[int(sensor["id"])] = sensor_kind
+        return sensor_kinds
 
     @classmethod
     async def get_sensor_data(
-        cls, sensor_list_response: SensorListAPIResponse
+        cls, sensor_list_response: SensorListAPIResponse,
+        scheduler: SensorRequestScheduler | None = None,
         ) -> list[TemperatureSensorAPIResponse | DoorSensorAPIResponse] | None:
-        """Grab all available sensor data.
-        
+        """Grab all available sensor data, batched per endpoint and fetched concurrently.
+
+        Args:
+            sensor_list_response: sensors to get the latest readings for.
+            scheduler: batch size and concurrency settings, defaults used if not given.
         Returns:
-            json of requested data, if successful.
+            one response per sensor, in sensor list order, if successful.
         """
         sensor_endpoints, sensor_ids = sensor_list_response.parse_sensor_list_response()
+        scheduler = scheduler if scheduler is not None else SensorRequestScheduler()
+        batches = scheduler.build_batches(sensor_endpoints, sensor_ids)
+        batch_responses = await scheduler.run(batches, URLRequestHandler._post_sensor_batch)
+
+        # split the batched responses back out into one response per sensor
+        responses_by_id: dict[int, TemperatureSensorAPIResponse | DoorSensorAPIResponse] = {}
+        for (sensor_endpoint, _), response in zip(batches, batch_responses):
+            if response is None:
+                continue
+            if sensor_endpoint == SamsaraEndpoints.DOOR:
+                batch_response = DoorSensorAPIResponse.from_json(response)
+            else:
+                batch_response = TemperatureSensorAPIResponse.from_json(response)
+            for sensor in batch_response.sensors:
+                responses_by_id[sensor.id] = batch_response.model_copy(update={"sensors": [sensor]})
 
-        sensor_data_responses: list[Any] = []
-        for sensor_endpoint, sensor_id in zip(sensor_endpoints, sensor_ids):
-            # get url and authorization header
-            request_url = URLRequestHandler.get_request_url(
-                [SamsaraEndpoints.V1, SamsaraEndpoints.SENSORS, sensor_endpoint],
-            )
-            payload = {
-                "sensors": [sensor_id]
-            }
-            authorization_header = URLRequestHandler.get_authorization_header()
-            async with httpx.AsyncClient(headers=authorization_header) as client:
-                try:
-                    response = await client.post(request_url, json=payload)
-                    response.raise_for_status()
-                    print(f"[REQUEST] Status: {request_url}={response.status_code}")
-                    sensor_data_responses.append(response.json())
-                except httpx.HTTPStatusError as status_error:
-                    print(f"[REQUEST] HTTP error occured: {status_error}")
-                    sensor_data_responses.append(None)
-                except httpx.RequestError as request_error:
-                    print(f"[REQUEST] Error occured during request: {request_error}")
-                    sensor_data_responses.append(None)
-        
         output: list[Any] = []
-        for response, sensor_endpoint in zip(sensor_data_responses, sensor_endpoints):
-            if response is not None:
-                if sensor_endpoint == SamsaraEndpoints.DOOR:
-                    output.append(DoorSensorAPIResponse.from_json(response))
-                else:
-                    output.append(TemperatureSensorAPIResponse.from_json(response))
+        for sensor_id, sensor_endpoint in zip(sensor_ids, sensor_endpoints):
+            if sensor_id in responses_by_id:
+                output.append(responses_by_id[sensor_id])
             else:
                 print(f"[API SENSOR WRAPPER] Response empty for type {sensor_endpoint}.")
 
@@ -155,13 +240,37 @@ class URLRequestHandler:
         cls, sensor_list_response: SensorListAPIResponse, 
         start_time: str, 
         end_time: str,
-    ) ->  dict[str, Any] | None | None:
+        step_ms: int = HISTORY_STEP_MS,
+    ) -> bytes | None:
         """Grab all available within a set time frame sensor data.
         
         Returns:
-            json of requested data, if successful.
+            raw json of requested data, if successful.
+        """
+        return await URLRequestHandler.get_sensor_history_window(
+            sensor_list_response,
+            start_ms=convert_datetime_to_epoch_millis(start_time),
+            end_ms=convert_datetime_to_epoch_millis(end_time),
+            step_ms=step_ms,
+        )
+
+    @classmethod
+    async def get_sensor_history_window(
+        cls, sensor_list_response: SensorListAPIResponse,
+        start_ms: int,
+        end_ms: int,
+        step_ms: int = HISTORY_STEP_MS,
+    ) -> bytes | None:
+        """Grab sensor history for a window given in epoch millis.
+
+        Args:
+            sensor_list_response: sensors to request a series for.
+            start_ms: window start, epoch millis.
+            end_ms: window end, epoch millis.
+            step_ms: resolution of the returned series.
+        Returns:
+            raw json of requested data, if successful, decode with SensorHistoryAPIResponse.from_json.
         """
-        
         # parse sensor list response to get sensor ids and types
         sensor_endpoints, sensor_ids = sensor_list_response.parse_sensor_list_response()
 
@@ -176,34 +285,29 @@ class URLRequestHandler:
         # construct payload for all the sensors within the time range
         payload = {
             "fillMissing": "withPrevious",
-            "endMs": _convert_datetime_to_epoch_millis(end_time),
-            "startMs": _convert_datetime_to_epoch_millis(start_time),
-            "stepMs": 1800000, # 30 min intervals
+            "endMs": end_ms,
+            "startMs": start_ms,
+            "stepMs": step_ms,
             "series": series_paylod,
         }
         
-        # get url and authorization header
         request_url = URLRequestHandler.get_request_url([SamsaraEndpoints.V1, SamsaraEndpoints.SENSORS, SamsaraEndpoints.HISTORY])
-        authorization_header = URLRequestHandler.get_authorization_header()
-        async with httpx.AsyncClient(headers=authorization_header) as client:
-            try:
-                response = await client.post(request_url, json=payload)
-                response.raise_for_status()
-                print(f"[REQUEST] Status: {request_url}={response.status_code}")
-                return response.json()
-            except httpx.HTTPStatusError as status_error:
-                print(f"[REQUEST] HTTP error occured: {status_error}")
-                return None
-            except httpx.RequestError as request_error:
-                print(f"[REQUEST] Error occured during request: {request_error}")
-                return None
+        return await URLRequestHandler._send_request("POST", request_url, json=payload)
 
 
 # === API Response Data Models ===
 class BaseAPIResponse(BaseModel):
     """Base wrapper for API response"""
     @classmethod
-    def from_json(cls, json_data: dict[str, Any]):
+    def from_json(cls, json_data: bytes | str | dict[str, Any]):
+        with metrics.timer("decode", model=cls.__name__):
+            return cls._decode(json_data)
+
+    @classmethod
+    def _decode(cls, json_data: bytes | str | dict[str, Any]):
+        # raw bodies are parsed and validated in one pass, without building python dicts first
+        if isinstance(json_data, (bytes, str)):
+            return cls.model_validate_json(json_data)
         return cls.model_validate(json_data)
 
 
@@ -212,9 +316,15 @@ class VehicleAPIResponse(BaseAPIResponse):
     data: list[Vehicle]
     pagination: dict[str, Any]
 
-    @classmethod
-    def from_json(cls, json_data: dict[str, Any]):
-        return cls.model_validate(json_data)
+    @property
+    def has_next_page(self) -> bool:
+        """Whether another page follows this one."""
+        return bool(self.pagination.get("hasNextPage")) and bool(self.pagination.get("endCursor"))
+
+    @property
+    def end_cursor(self) -> str | None:
+        """Cursor to pass as 'after' for the next page."""
+        return self.pagination.get("endCursor")
 
 
 class SensorListAPIResponse(BaseAPIResponse):
@@ -222,16 +332,24 @@ class SensorListAPIResponse(BaseAPIResponse):
     sensors: list[Sensor]
 
     def parse_sensor_list_response(self):
-        """Helper to determine sensor id and what type based on serial number."""
-        sensor_serial_nums: list[str] = [sensor.name for sensor in self.sensors]
-        sensor_ids: list[int] = [sensor.id for sensor in self.sensors]
-        sensor_endpoints = [
-            SamsaraEndpoints.DOOR if (
-                sensor_id == SensorSerialNums.DOOR
-            ) else SamsaraEndpoints.TEMPERATUER for sensor_id in sensor_serial_nums
-        ]
+        """Helper to get the endpoint and id of every sensor of known kind."""
+        known_sensors = [sensor for sensor in self.sensors if sensor.kind is not None]
+        sensor_ids: list[int] = [sensor.id for sensor in known_sensors]
+        # the kind of a sensor is the endpoint its readings come from
+        sensor_endpoints: list[str] = [sensor.kind for sensor in known_sensors]
         return sensor_endpoints, sensor_ids
 
+    def with_kinds(self, sensor_kinds: dict[int, str]) -> SensorListAPIResponse:
+        """Copy of this response with each sensor's kind filled in, sensors of unknown kind are dropped."""
+        return self.model_copy(update={"sensors": [
+            sensor.model_copy(update={"kind": sensor_kinds[sensor.id]}) for sensor in self.sensors if sensor.id in sensor_kinds
+        ]})
+
+    def subset(self, sensor_ids: list[int]) -> SensorListAPIResponse:
+        """Copy of this response restricted to the given sensor ids, e.g. one vehicle's sensors."""
+        wanted_ids = set(sensor_ids)
+        return self.model_copy(update={"sensors": [sensor for sensor in self.sensors if sensor.id in wanted_ids]})
+
 
 class DoorSensorAPIResponse(BaseAPIResponse):
     """Wrapper for sensor request response."""
@@ -246,10 +364,93 @@ class TemperatureSensorAPIResponse(BaseAPIResponse):
 
 
 class SeriesData(BaseModel):
-    time_ms: datetime = Field(alias="timeMs")
+    # kept as the epoch millis the api sends, never turned into datetime objects
+    time_ms: int = Field(alias="timeMs")
     values: list[int] = Field(alias="series")
 
 
-class SensorHistoryAPIResponse(BaseAPIResponse):
-    """Wrapper for sensor history request. Only returns timestamps and values"""
+class SensorHistoryRows(BaseModel):
+    """Row by row model of a history response, only used for bodies the columnar decoder rejects."""
     results: list[SeriesData] = Field()
+
+
+# layout of a history body, decoded by arrow straight into int64 buffers
+HISTORY_JSON_SCHEMA = pa.schema([
+    ("results", pa.list_(pa.struct([("timeMs", pa.int64()), ("series", pa.list_(pa.int64()))]))),
+])
+
+
+def decode_history_arrays(json_data: bytes) -> tuple[np.ndarray, np.ndarray]:
+    """Decode a raw history body into arrays, without a python object per timestamp.
+
+    Args:
+        json_data: body of a /v1/sensors/history response.
+    Returns:
+        (time_ms int64 of shape (time,), values int64 of shape (time, series)).
+    Raises:
+        ValueError: if a timestamp or value is missing or the series differ in length.
+    """
+    # one block for the whole body, the response is a single json object
+    history_table = pa_json.read_json(
+        io.BytesIO(json_data),
+        read_options=pa_json.ReadOptions(block_size=len(json_data) + 1),
+        parse_options=pa_json.ParseOptions(explicit_schema=HISTORY_JSON_SCHEMA, newlines_in_values=True),
+    )
+    if history_table.num_rows != 1 or history_table.column("results").null_count:
+        raise ValueError("[API] History response has no results list.")
+    results = history_table.column("results").combine_chunks().flatten()
+    time_ms, series = results.field("timeMs"), results.field("series")
+    if time_ms.null_count or series.null_count:
+        raise ValueError("[API] History result is missing timeMs or series.")
+    series_lengths = series.value_lengths().to_numpy()
+    num_series = int(series_lengths[0]) if len(series_lengths) else 0
+    if (series_lengths != num_series).any():
+        raise ValueError("[API] History results hold a different number of series.")
+    values = series.flatten()
+    if values.null_count:
+        raise ValueError("[API] History series holds a null value.")
+    return (
+        time_ms.to_numpy(zero_copy_only=False).astype(np.int64, copy=False),
+        values.to_numpy(zero_copy_only=False).astype(np.int64, copy=False).reshape(len(time_ms), num_series),
+    )
+
+
+class SensorHistoryAPIResponse(BaseAPIResponse):
+    """Wrapper for sensor history request. Only returns timestamps and values, held as arrays."""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    time_ms: np.ndarray
+    values: np.ndarray
+
+    @classmethod
+    def from_arrays(cls, time_ms: np.ndarray, values: np.ndarray) -> SensorHistoryAPIResponse:
+        """Wrap (time,) timestamps and (time, series) values, float with NaN where a series has no reading."""
+        values = np.asarray(values)
+        if values.dtype.kind != "f":
+            values = values.astype(np.int64)
+        return cls(time_ms=np.asarray(time_ms, dtype=np.int64), values=values)
+
+    @classmethod
+    def _decode(cls, json_data: bytes | str | dict[str, Any]) -> SensorHistoryAPIResponse:
+        if isinstance(json_data, str):
+            json_data = json_data.encode()
+        if isinstance(json_data, bytes):
+            try:
+                return cls.from_arrays(*decode_history_arrays(json_data))
+            except pa.ArrowInvalid:
+                # e.g. floats written as 20000.0, the row model accepts what it always has
+                rows = SensorHistoryRows.model_validate_json(json_data)
+        else:
+            rows = SensorHistoryRows.model_validate(json_data)
+        num_series = len(rows.results[0].values) if rows.results else 0
+        return cls.from_arrays(
+            np.fromiter((result.time_ms for result in rows.results), dtype=np.int64, count=len(rows.results)),
+            np.array([result.values for result in rows.results], dtype=np.int64).reshape(len(rows.results), num_series),
+        )
+
+    def to_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """Columnar view of the results.
+
+        Returns:
+            (time_ms int64 of shape (time,), values int64 of shape (time, series)).
+        """
+        return self.time_ms, self.values
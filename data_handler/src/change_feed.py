@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""This file holds the change notification the data server watches for newly stored readings."""
+from __future__ import annotations
+from src.constants import LOCAL_CHANGE_FEED_FILE
+import numpy as np
+import pandas as pd
+import json
+import os
+import time
+
+
+class ChangeNotifier:
+    """Announces stored readings by rewriting one small json file in the shared data directory.
+
+    The file holds a sequence number that goes up with every notification, with the
+    time range and count of the readings written. The server only has to watch this
+    one file to know when to look for new readings, rather than scanning the store.
+    """
+
+    def __init__(self, notify_path: str = LOCAL_CHANGE_FEED_FILE) -> None:
+        """Configure the notifier.
+
+        Args:
+            notify_path: json file the server watches.
+        """
+        self.notify_path = notify_path
+
+    def _last_seq(self) -> int:
+        if not os.path.exists(self.notify_path):
+            return 0
+        with open(self.notify_path, "r", encoding="utf-8") as notify_file:
+            return int(json.load(notify_file)["seq"])
+
+    def notify(self, fact_df: pd.DataFrame) -> int:
+        """Announce readings that were just stored, written then renamed so it is never half written.
+
+        Args:
+            fact_df: the stored readings, with a ts column.
+        Returns:
+            sequence number of the notification.
+        """
+        epoch_millis = pd.to_datetime(fact_df["ts"], utc=True).to_numpy(dtype="datetime64[ms]").astype(np.int64)
+        change = {
+            "seq": self._last_seq() + 1,
+            "written_at_ms": int(time.time() * 1000),
+            "rows": len(fact_df),
+            "min_ts_ms": int(epoch_millis.min()) if len(epoch_millis) else None,
+            "max_ts_ms": int(epoch_millis.max()) if len(epoch_millis) else None,
+        }
+        os.makedirs(os.path.dirname(self.notify_path), exist_ok=True)
+        tmp_path = f"{self.notify_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as notify_file:
+            json.dump(change, notify_file)
+        os.replace(tmp_path, self.notify_path)
+        return change["seq"]
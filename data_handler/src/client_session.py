@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""This file holds the shared, pooled http session used for all Samsara requests."""
+from __future__ import annotations
+from src.constants import (
+    API_TOKEN_LOCATION,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY_S,
+    HTTP_TIMEOUT_S,
+    HTTP_CONNECT_TIMEOUT_S,
+    HTTP_RATE_LIMIT_PER_S,
+    HTTP_RATE_LIMIT_BURST,
+    HTTP_MAX_RETRIES,
+    HTTP_RETRY_BACKOFF_S,
+)
+from src.request_scheduler import TokenBucket, parse_retry_after
+from typing import Any
+import asyncio
+import httpx
+
+# http/2 needs the optional h2 package, fall back to http/1.1 keep-alive without it
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+ # helper funciton to load secret API token
+def get_api_token() -> str | None:
+    """Helper to get secret API token."""
+    try:
+        with open(API_TOKEN_LOCATION, "r", encoding="ASCII") as token:
+            return token.read().strip()
+    except FileNotFoundError as exc:
+        print(f"[SETUP ERROR]:{exc} Could not find API token at {API_TOKEN_LOCATION}")
+        return None
+
+
+class SamsaraClientSession:
+    """Long-lived client session owning a keep-alive connection pool and the api token."""
+
+    def __init__(
+        self,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections: int = HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY_S,
+        timeout: float = HTTP_TIMEOUT_S,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT_S,
+        http2: bool = True,
+        rate_limit_per_s: float = HTTP_RATE_LIMIT_PER_S,
+        rate_limit_burst: int = HTTP_RATE_LIMIT_BURST,
+        max_retries: int = HTTP_MAX_RETRIES,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        """Configure the session, the client itself is created lazily on first use.
+
+        Args:
+            max_connections: upper bound on open connections in the pool.
+            max_keepalive_connections: idle connections kept open for reuse.
+            keepalive_expiry: seconds an idle connection is kept alive.
+            timeout: default read/write/pool timeout in seconds.
+            connect_timeout: timeout for establishing a connection in seconds.
+            http2: use http/2 when the h2 package is installed.
+            rate_limit_per_s: sustained requests per second allowed by the limiter.
+            rate_limit_burst: requests allowed back to back before limiting kicks in.
+            max_retries: retries for a request answered with 429.
+            transport: optional custom transport, e.g. for a local stand-in api.
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.transport = transport
+        self.rate_limiter = TokenBucket(rate=rate_limit_per_s, capacity=rate_limit_burst)
+        self.max_retries = max_retries
+        self._api_token: str | None = None
+        self._client: httpx.AsyncClient | None = None
+        self._client_loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def api_token(self) -> str | None:
+        """Api token, read from disk once and then kept in memory."""
+        if self._api_token is None:
+            self._api_token = get_api_token()
+        return self._api_token
+
+    @property
+    def authorization_header(self) -> dict[str, str]:
+        """Authorization header built from the cached api token."""
+        return {"Authorization": f"Bearer {self.api_token}"}
+
+    def get_client(self) -> httpx.AsyncClient:
+        """Get the pooled client, creating it for the running event loop if needed.
+
+        Returns:
+            the shared httpx client.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            # connections are bound to the loop they were opened on, so a new loop needs a new pool
+            self._client = httpx.AsyncClient(
+                headers=self.authorization_header,
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2,
+                transport=self.transport,
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a request over the pooled client, waiting on the rate limiter first.
+
+        Args:
+            method: http method, e.g. 'GET'.
+            url: full request url.
+            kwargs: forwarded to httpx, e.g. json payload or params.
+        Returns:
+            the http response, the last 429 is returned once retries run out.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            response = await self.get_client().request(method, url, **kwargs)
+            if response.status_code != httpx.codes.TOO_MANY_REQUESTS or attempt == self.max_retries:
+                return response
+            # back off every request sharing this session, not just this one
+            delay = parse_retry_after(
+                response.headers.get("Retry-After"), default=HTTP_RETRY_BACKOFF_S * 2 ** attempt
+            )
+            print(f"[REQUEST] Rate limited: {url}, retrying in {delay:.2f}s")
+            self.rate_limiter.pause(delay)
+        return response
+
+    async def aclose(self) -> None:
+        """Close the pooled client and release its connections."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
+
+    async def __aenter__(self) -> SamsaraClientSession:
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
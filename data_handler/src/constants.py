@@ -1,12 +1,76 @@
 #!/usr/bin/env python3
 """This file will hold constants used in the demo."""
 
+import os
 from typing import Final
 
+# api the handler talks to, point it at a local mock server for benchmarks
+SAMSARA_BASE_URL: Final = os.environ.get("SAMSARA_BASE_URL", "https://api.samsara.com")
 # location where the api token is loaded from local to container
 API_TOKEN_LOCATION: Final = "/data_handler/secrets/api_token.txt"
-LOCAL_TIME_SERIES_STORAGE_FILE: Final = "/data_handler/data/sensor_data.parquet"
+LOCAL_TIME_SERIES_STORAGE_DIR: Final = "/data_handler/data/sensor_data"
+# single file the readings were kept in before the partitioned store, migrated into it once
+LOCAL_LEGACY_TIME_SERIES_STORAGE_FILE: Final = "/data_handler/data/sensor_data.parquet"
 LOCAL_HISTORY_TIME_SERIES_STORAGE_FILE: Final = "/data_handler/data/sensor_history_data.parquet"
+# dimension tables the readings refer to by id, one row per vehicle and per sensor
+LOCAL_VEHICLE_DIMENSION_FILE: Final = "/data_handler/data/vehicles.parquet"
+LOCAL_SENSOR_DIMENSION_FILE: Final = "/data_handler/data/sensors.parquet"
+# newest stored reading and value per sensor, polled readings at or before it are repeats
+LOCAL_INGEST_INDEX_FILE: Final = "/data_handler/data/ingest_index.json"
+# rewritten after every poll that stores readings, the server watches it to push them to the dashboard
+LOCAL_CHANGE_FEED_FILE: Final = "/data_handler/data/sensor_data_changes.json"
+
+# connection pool configuration for the shared http client session
+HTTP_MAX_CONNECTIONS: Final = 20
+HTTP_MAX_KEEPALIVE_CONNECTIONS: Final = 10
+HTTP_KEEPALIVE_EXPIRY_S: Final = 60.0
+HTTP_TIMEOUT_S: Final = 30.0
+HTTP_CONNECT_TIMEOUT_S: Final = 10.0
+
+# request scheduling - batching, concurrency cap and client side rate limit
+SENSOR_BATCH_SIZE: Final = 50
+SENSOR_MAX_CONCURRENCY: Final = 8
+HTTP_RATE_LIMIT_PER_S: Final = 20.0
+HTTP_RATE_LIMIT_BURST: Final = 20
+HTTP_MAX_RETRIES: Final = 5
+HTTP_RETRY_BACKOFF_S: Final = 1.0
+
+# page size when following the /fleet/vehicles pagination cursors
+VEHICLE_PAGE_LIMIT: Final = 100
+
+# history backfill - step resolution, window sizing and resume checkpoints
+HISTORY_STEP_MS: Final = 1800000 # 30 min intervals
+HISTORY_MAX_POINTS_PER_REQUEST: Final = 5000
+HISTORY_MAX_CONCURRENT_WINDOWS: Final = 4
+LOCAL_BACKFILL_CHECKPOINT_DIR: Final = "/data_handler/data/backfill_checkpoints"
+
+# range-aware history cache - interval index and stored spans
+LOCAL_HISTORY_CACHE_DIR: Final = "/data_handler/data/history_cache"
+HISTORY_CACHE_MAX_ROWS: Final = 5_000_000
+
+# append-only store - row group size and small file compaction thresholds
+STORE_ROW_GROUP_SIZE: Final = 100_000
+STORE_COMPACTION_MIN_FILES: Final = 8
+STORE_COMPACTION_SMALL_FILE_ROWS: Final = 10_000
+
+# rollup tables kept next to the raw store, tier name -> bucket width
+LOCAL_ROLLUP_DIR: Final = "/data_handler/data/rollups"
+ROLLUP_TIERS: Final = {"hourly": 3_600_000, "daily": 86_400_000}
+# each tier is a directory of files per UTC day or month of bucket starts, a poll rewrites only the files it touches
+ROLLUP_PARTITION_FORMATS: Final = {"hourly": "%Y-%m-%d", "daily": "%Y-%m"}
+
+# long-running ingestion worker - job endpoint and poll schedule
+# loopback unless told otherwise, start_worker.sh listens on the docker network it shares with the server only
+WORKER_HOST: Final = os.environ.get("WORKER_HOST", "127.0.0.1")
+# shared secret every job request must carry, jobs spend paid api calls
+WORKER_TOKEN_LOCATION: Final = "/data_handler/secrets/worker_token.txt"
+WORKER_PORT: Final = 8081
+WORKER_POLL_INTERVAL_S: Final = 60.0
+WORKER_JOB_WAIT_TIMEOUT_S: Final = 300.0
+WORKER_MAX_FINISHED_JOBS: Final = 200
+
+# prefix of the exported timing and counter names
+METRICS_NAMESPACE: Final = "samsara_handler"
 
 # some type definitions for different samsara api integrations
 class SamsaraEndpoints:
@@ -19,7 +83,10 @@ class SamsaraEndpoints:
     DOOR: str = "door"
     HISTORY: str = "history"
 
-# keeping track of serial nums here for ease of access
-class SensorSerialNums:
-    TEMP: str = "W7NP-RJ8-6VE"
-    DOOR: str = "WM5D-K78-KN7"
+# kind of reading a sensor reports, named after the endpoint polled for it
+class SensorKinds:
+    TEMPERATURE: str = SamsaraEndpoints.TEMPERATUER
+    DOOR: str = SamsaraEndpoints.DOOR
+
+# binary sensors that rarely change are stored as (ts, new state) change events, not one row per step
+CHANGE_EVENT_KINDS: Final = (SensorKinds.DOOR,)
@@ -1,9 +1,22 @@
 #!/usr/bin/env python3
 """This file holds data models for the Vehicles, requests."""
 
-from pydantic import BaseModel, Field
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, BeforeValidator, Field
+from typing import Annotated, Any, Optional
+from datetime import datetime, timedelta, timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def _to_epoch_millis(value: Any) -> Any:
+    """Api reading times are RFC 3339 strings, kept as UTC epoch millis like history timeMs, naive times are UTC."""
+    if not isinstance(value, str):
+        return value
+    dt_object = datetime.fromisoformat(value)
+    if dt_object.tzinfo is None:
+        dt_object = dt_object.replace(tzinfo=timezone.utc)
+    return (dt_object - EPOCH) // timedelta(milliseconds=1)
+
+EpochMillis = Annotated[int, BeforeValidator(_to_epoch_millis)]
 
 # === Vehicle Request Response Data Models ===
 class TemperatureSensor(BaseModel):
@@ -56,6 +69,8 @@ class Sensor(BaseModel):
     id: int
     name: str
     mac_address: str = Field(alias="macAddress")
+    # not part of the response, filled in from the sensor dimension or by probing the endpoints
+    kind: Optional[str] = None
 
 class GroupedSensor(BaseModel):
     id: int
@@ -64,9 +79,9 @@ class GroupedSensor(BaseModel):
 
 class GroupedTemperatureSensor(GroupedSensor):
     ambient_temperature: int = Field(alias="ambientTemperature")
-    ambient_temperature_time: datetime = Field(alias="ambientTemperatureTime")
+    ambient_temperature_time_ms: EpochMillis = Field(alias="ambientTemperatureTime")
 
 class GroupedDoorSensor(GroupedSensor):
     door_closed: bool = Field(alias="doorClosed")
-    door_status_time: datetime = Field(alias="doorStatusTime")
+    door_status_time_ms: EpochMillis = Field(alias="doorStatusTime")
 
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""This file holds the append-only, partitioned parquet store for polled sensor data."""
+from __future__ import annotations
+from src.constants import (
+    LOCAL_TIME_SERIES_STORAGE_DIR,
+    STORE_COMPACTION_MIN_FILES,
+    STORE_COMPACTION_SMALL_FILE_ROWS,
+    STORE_ROW_GROUP_SIZE,
+)
+from src.metrics import metrics
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pandas as pd
+import numpy as np
+import os
+import time
+import uuid
+
+PARTITION_DATE_KEY = "date"
+PARTITION_VEHICLE_KEY = "vehicle"
+VEHICLE_ID_COLUMN = "vehicle_id"
+SENSOR_ID_COLUMN = "sensor_id"
+TIMESTAMP_COLUMN = "ts"
+VALUE_COLUMN = "value"
+SORT_COLUMN = TIMESTAMP_COLUMN
+# every stored timestamp is int64 epoch millis, tagged as UTC
+TIMESTAMP_TYPE = pa.timestamp("ms", tz="UTC")
+# one reading per row, vehicle and sensor details live in the dimension tables
+FACT_SCHEMA = pa.schema([
+    (SENSOR_ID_COLUMN, pa.int64()),
+    (TIMESTAMP_COLUMN, TIMESTAMP_TYPE),
+    (VALUE_COLUMN, pa.float64()),
+])
+# rewritten after every change to the stored files, readers check this one file instead of listing the store
+GENERATION_MARKER = "_generation"
+
+
+def epoch_millis_to_timestamps(epoch_millis) -> pd.DatetimeIndex:
+    """Wrap epoch millis as UTC timestamps at millisecond resolution, written as timestamp[ms, tz=UTC]."""
+    return pd.to_datetime(np.asarray(epoch_millis, dtype=np.int64), unit="ms", utc=True).as_unit("ms")
+
+def normalize_timestamp_columns(row_data_df: pd.DataFrame) -> pd.DataFrame:
+    """Bring the timestamp column to UTC millis in place, naive values and strings are taken as UTC."""
+    row_data_df[TIMESTAMP_COLUMN] = pd.to_datetime(row_data_df[TIMESTAMP_COLUMN], utc=True).dt.as_unit("ms")
+    return row_data_df
+
+
+
+def bump_generation(root_dir: str) -> None:
+    """Announce a change to a dataset directory by replacing its generation marker, a new file every time."""
+    marker_path = os.path.join(root_dir, GENERATION_MARKER)
+    tmp_path = f"{marker_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as marker_file:
+        marker_file.write(str(time.time_ns()))
+    os.replace(tmp_path, marker_path)
+
+
+class PartitionedParquetStore:
+    """Append-only parquet dataset of readings laid out as <root>/date=YYYY-MM-DD/vehicle=<id>/part-*.parquet.
+
+    Each append writes new small files and never rewrites existing ones, so the
+    cost of an append does not depend on how much history is stored. compact()
+    later merges the small files of a partition into one file with large row groups.
+    A reading is filed under the UTC date of its own timestamp, so readers can prune
+    partitions by both ends of a time window.
+    """
+
+    def __init__(
+        self,
+        root_dir: str = LOCAL_TIME_SERIES_STORAGE_DIR,
+        row_group_size: int = STORE_ROW_GROUP_SIZE,
+        compaction_min_files: int = STORE_COMPACTION_MIN_FILES,
+        small_file_rows: int = STORE_COMPACTION_SMALL_FILE_ROWS,
+    ) -> None:
+        """Configure the store.
+
+        Args:
+            root_dir: dataset root directory.
+            row_group_size: rows per row group in compacted files.
+            compaction_min_files: small files a partition needs before it is compacted.
+            small_file_rows: files with fewer rows than this are merged during compaction.
+        """
+        self.root_dir = root_dir
+        self.row_group_size = row_group_size
+        self.compaction_min_files = compaction_min_files
+        self.small_file_rows = small_file_rows
+
+    def _partition_dir(self, date: str, vehicle_id: str) -> str:
+        return os.path.join(self.root_dir, f"{PARTITION_DATE_KEY}={date}", f"{PARTITION_VEHICLE_KEY}={vehicle_id}")
+
+    @staticmethod
+    def _new_file_name(prefix: str) -> str:
+        return f"{prefix}-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+
+    def append(self, row_data_df: pd.DataFrame, batch_name: str | None = None) -> list[str]:
+        """Write new readings as one small file per (date, vehicle) partition.
+
+        Args:
+            row_data_df: readings to add, sensor_id, ts and value plus the vehicle_id they are partitioned by.
+            batch_name: fixed file name for a one-off import, so writing the same batch again
+                replaces its files rather than storing its readings twice.
+        Returns:
+            paths of the files written.
+        """
+        row_data_df = normalize_timestamp_columns(row_data_df.copy())
+
+        # late and backfilled readings go to the date they were taken, not the date they arrived
+        reading_dates = row_data_df[TIMESTAMP_COLUMN].dt.strftime("%Y-%m-%d")
+        written_paths = []
+        for (date, vehicle_id), vehicle_df in row_data_df.groupby([reading_dates, VEHICLE_ID_COLUMN], sort=False):
+            partition_dir = self._partition_dir(date, str(vehicle_id))
+            os.makedirs(partition_dir, exist_ok=True)
+            file_name = f"{batch_name}.parquet" if batch_name is not None else self._new_file_name("part")
+            file_path = os.path.join(partition_dir, file_name)
+            # write under an ignored name and rename, readers never see a partial file
+            tmp_path = os.path.join(partition_dir, f"_{os.path.basename(file_path)}")
+            # the vehicle is in the partition path, the file only holds the fact columns
+            with metrics.timer("parquet_write", target="store"):
+                pq.write_table(
+                    pa.Table.from_pandas(vehicle_df, schema=FACT_SCHEMA, preserve_index=False),
+                    tmp_path,
+                    compression="snappy",
+                    write_statistics=True,
+                )
+            metrics.count("bytes_written", os.path.getsize(tmp_path), target="store")
+            os.replace(tmp_path, file_path)
+            written_paths.append(file_path)
+        if written_paths:
+            bump_generation(self.root_dir)
+        metrics.count("rows_written", len(row_data_df), target="store")
+        print(f"[DATASTORE] Appended {len(row_data_df)} rows in {len(written_paths)} files.")
+        return written_paths
+
+    def read_all(self) -> pd.DataFrame:
+        """Read every stored reading."""
+        if not os.path.isdir(self.root_dir):
+            return FACT_SCHEMA.empty_table().to_pandas()
+        with metrics.timer("parquet_read", target="store"):
+            return ds.dataset(self.root_dir, schema=FACT_SCHEMA, format="parquet").to_table().to_pandas()
+
+    def _partition_dirs(self) -> list[str]:
+        if not os.path.isdir(self.root_dir):
+            return []
+        partition_dirs = []
+        for date_dir in sorted(os.listdir(self.root_dir)):
+            date_path = os.path.join(self.root_dir, date_dir)
+            if not date_dir.startswith(f"{PARTITION_DATE_KEY}=") or not os.path.isdir(date_path):
+                continue
+            for vehicle_dir in sorted(os.listdir(date_path)):
+                if vehicle_dir.startswith(f"{PARTITION_VEHICLE_KEY}="):
+                    partition_dirs.append(os.path.join(date_path, vehicle_dir))
+        return partition_dirs
+
+    def compact_partition(self, partition_dir: str) -> int:
+        """Merge the small files of one partition into a single file.
+
+        Returns:
+            number of files merged, zero if the partition was left alone.
+        """
+        small_files = []
+        for file_name in sorted(os.listdir(partition_dir)):
+            file_path = os.path.join(partition_dir, file_name)
+            if file_name.endswith(".parquet") and not file_name.startswith(("_", ".")):
+                if pq.ParquetFile(file_path).metadata.num_rows < self.small_file_rows:
+                    small_files.append(file_path)
+        if len(small_files) < self.compaction_min_files:
+            return 0
+
+        merged_df = ds.dataset(small_files, schema=FACT_SCHEMA, format="parquet").to_table().to_pandas()
+        # repeats polled before the ingest index existed are dropped, sorted rows give each
+        # row group a narrow timestamp range for readers to prune on
+        merged_df = merged_df.drop_duplicates([SENSOR_ID_COLUMN, TIMESTAMP_COLUMN]).sort_values(SORT_COLUMN, kind="stable")
+        merged_table = pa.Table.from_pandas(merged_df, schema=FACT_SCHEMA, preserve_index=False)
+        compacted_path = os.path.join(partition_dir, self._new_file_name("compacted"))
+        tmp_path = os.path.join(partition_dir, f"_{os.path.basename(compacted_path)}")
+        with metrics.timer("parquet_write", target="compaction"):
+            pq.write_table(
+                merged_table, tmp_path, row_group_size=self.row_group_size, compression="snappy", write_statistics=True,
+            )
+        metrics.count("bytes_written", os.path.getsize(tmp_path), target="compaction")
+        os.replace(tmp_path, compacted_path)
+        for file_path in small_files:
+            os.remove(file_path)
+        bump_generation(self.root_dir)
+        return len(small_files)
+
+    def compact(self) -> int:
+        """Compact every partition holding enough small files.
+
+        Returns:
+            total number of files merged.
+        """
+        num_merged = sum(self.compact_partition(partition_dir) for partition_dir in self._partition_dirs())
+        if num_merged:
+            print(f"[DATASTORE] Compacted {num_merged} small files.")
+        return num_merged
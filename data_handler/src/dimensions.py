@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""This file holds the vehicle and sensor dimension tables the stored readings refer to by id."""
+from __future__ import annotations
+from src.constants import LOCAL_VEHICLE_DIMENSION_FILE, LOCAL_SENSOR_DIMENSION_FILE
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import os
+
+VEHICLE_DIMENSION_SCHEMA = pa.schema([
+    ("vehicle_id", pa.string()),
+    ("name", pa.string()),
+    ("make", pa.string()),
+    ("model", pa.string()),
+    ("year", pa.string()),
+    ("gateway_sn", pa.string()),
+])
+SENSOR_DIMENSION_SCHEMA = pa.schema([
+    ("sensor_id", pa.int64()),
+    ("vehicle_id", pa.string()),
+    ("name", pa.string()),
+    ("mac", pa.string()),
+    ("kind", pa.string()),
+])
+
+
+class DimensionTable:
+    """Small parquet table holding one row per key, rewritten only when a row is added or changes.
+
+    Dimensions change rarely compared to readings, so the file is usually left alone
+    and readers can look rows up by key without scanning any readings.
+    """
+
+    def __init__(self, path: str, key: str, schema: pa.Schema) -> None:
+        """Configure the table.
+
+        Args:
+            path: parquet file holding the table.
+            key: column identifying a row.
+            schema: columns of the table.
+        """
+        self.path = path
+        self.key = key
+        self.schema = schema
+
+    def read(self) -> pd.DataFrame:
+        """Every row of the table, an empty frame with the table's columns if nothing was written yet."""
+        if not os.path.exists(self.path):
+            return self.schema.empty_table().to_pandas()
+        return pq.read_table(self.path, schema=self.schema).to_pandas()
+
+    def upsert(self, rows: pd.DataFrame) -> int:
+        """Add new rows and replace changed ones, keyed on the key column.
+
+        Args:
+            rows: rows with the table's columns, later rows win on repeated keys.
+        Returns:
+            number of rows added or changed, zero if the file was left alone.
+        """
+        rows = pa.Table.from_pandas(
+            rows[self.schema.names].drop_duplicates(self.key, keep="last"), schema=self.schema, preserve_index=False,
+        ).to_pandas()
+        stored = self.read()
+        changed = rows.merge(stored, how="left", indicator=True)["_merge"].to_numpy() == "left_only"
+        if not changed.any():
+            return 0
+        merged = pd.concat([stored[~stored[self.key].isin(rows[self.key])], rows], ignore_index=True)
+        tmp_path = os.path.join(os.path.dirname(self.path), f"_{os.path.basename(self.path)}")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        pq.write_table(
+            pa.Table.from_pandas(merged.sort_values(self.key), schema=self.schema, preserve_index=False),
+            tmp_path, compression="snappy",
+        )
+        os.replace(tmp_path, self.path)
+        print(f"[DIMENSIONS] Upserted {int(changed.sum())} rows into {os.path.basename(self.path)}.")
+        return int(changed.sum())
+
+
+class VehicleDimension(DimensionTable):
+    """One row per vehicle: make, model, year and gateway serial."""
+
+    def __init__(self, path: str = LOCAL_VEHICLE_DIMENSION_FILE) -> None:
+        super().__init__(path, "vehicle_id", VEHICLE_DIMENSION_SCHEMA)
+
+
+class SensorDimension(DimensionTable):
+    """One row per sensor: the vehicle it reports for, serial number, MAC and the kind of reading."""
+
+    def __init__(self, path: str = LOCAL_SENSOR_DIMENSION_FILE) -> None:
+        super().__init__(path, "sensor_id", SENSOR_DIMENSION_SCHEMA)
+
+    def kinds(self) -> dict[int, str]:
+        """Sensor id -> SensorKinds value of every known sensor."""
+        sensors = self.read()
+        return dict(zip(sensors["sensor_id"].tolist(), sensors["kind"].tolist()))
@@ -4,160 +4,483 @@
 from __future__ import annotations
 import os
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import time
 import asyncio
 import argparse
-from typing import Any
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, TypeVar
 from src.api_handler import (
     URLRequestHandler, 
-    VehicleAPIResponse, 
     SensorListAPIResponse, 
     TemperatureSensorAPIResponse, 
     DoorSensorAPIResponse, 
-    SensorHistoryAPIResponse
+    SensorHistoryAPIResponse,
+    convert_datetime_to_epoch_millis,
 )
-from src.constants import SamsaraEndpoints, SensorSerialNums
+from src.history_cache import HistoryCache
+from src.constants import SensorKinds, CHANGE_EVENT_KINDS, HISTORY_STEP_MS, STORE_ROW_GROUP_SIZE
 from src.data_model import Vehicle, Sensor
-from constants import LOCAL_TIME_SERIES_STORAGE_FILE, LOCAL_HISTORY_TIME_SERIES_STORAGE_FILE
+from src.data_store import PartitionedParquetStore, FACT_SCHEMA, SORT_COLUMN, epoch_millis_to_timestamps, normalize_timestamp_columns
+from src.dimensions import VehicleDimension, SensorDimension
+from src.ingest_index import IngestIndex
+from src.change_feed import ChangeNotifier
+from src.rollups import RollupStore
+from src.metrics import metrics, log_event
+from constants import LOCAL_HISTORY_TIME_SERIES_STORAGE_FILE, LOCAL_LEGACY_TIME_SERIES_STORAGE_FILE
 
+T = TypeVar("T")
 
 
-def get_vehicle_data() -> VehicleAPIResponse | None:
-    """Helper function to grab fleet vehicle data."""
-    vehicle_response = asyncio.run(URLRequestHandler.fetch_data_httpx(suffix=SamsaraEndpoints.FLEET, asset_suffix=SamsaraEndpoints.VEHICLES))
-    if vehicle_response is not None:
-        return VehicleAPIResponse.from_json(vehicle_response)
-    else:
-        print("[API VEHICLE WRAPPER] Response empty.")
-        return None
+class StageTimer:
+    """Collects wall-clock timings for each stage of an ingestion run, summed over repeats.
+
+    Every timing is also recorded in the process metrics, labelled with its stage.
+    """
+
+    def __init__(self) -> None:
+        self.timings: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a synchronous block, e.g. conversion or writing."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            metrics.observe("ingest_stage", elapsed, stage=name)
+
+    async def timed(self, name: str, awaitable: Awaitable[T]) -> T:
+        """Await and time a single coroutine, e.g. an api request."""
+        with self.stage(name):
+            return await awaitable
+
+
+async def iter_vehicles(timer: StageTimer) -> AsyncIterator[list[Vehicle]]:
+    """Yield fleet vehicles page by page, fetching the next page while the current one is processed."""
+    vehicle_pages = URLRequestHandler.iter_vehicle_pages()
+    next_page = asyncio.ensure_future(timer.timed("fetch_vehicles", anext(vehicle_pages, None)))
+    try:
+        while (vehicle_page := await next_page) is not None:
+            next_page = asyncio.ensure_future(timer.timed("fetch_vehicles", anext(vehicle_pages, None)))
+            yield vehicle_page.data
+    finally:
+        next_page.cancel()
+        await vehicle_pages.aclose()
 
-def get_sensor_list() -> SensorListAPIResponse | None:
-    """Helper function to get sensor list."""
-    sensor_response = asyncio.run(URLRequestHandler.get_sensor_list())
-    if sensor_response is not None:
-        return SensorListAPIResponse.from_json(sensor_response)
-    else:
+async def get_sensor_list(sensor_dimension: SensorDimension | None = None) -> SensorListAPIResponse | None:
+    """Helper function to get sensor list, with each sensor's kind from the sensor dimension.
+
+    Sensors not in the dimension yet have their kind probed from the api once.
+    """
+    sensor_response = await URLRequestHandler.get_sensor_list()
+    if sensor_response is None:
         print("[API SENSOR WRAPPER] Response empty.")
         return None
+    sensor_list = SensorListAPIResponse.from_json(sensor_response)
+    sensor_dimension = sensor_dimension if sensor_dimension is not None else SensorDimension()
+    sensor_kinds = sensor_dimension.kinds()
+    unknown_ids = [sensor.id for sensor in sensor_list.sensors if sensor.id not in sensor_kinds]
+    if unknown_ids:
+        sensor_kinds.update(await URLRequestHandler.get_sensor_kinds(unknown_ids))
+        print(f"[API SENSOR WRAPPER] Probed the kind of {len(unknown_ids)} new sensors.")
+    return sensor_list.with_kinds(sensor_kinds)
     
-def get_sensor_data(
+async def get_sensor_data(
         sensor_list_response: SensorListAPIResponse,
     ) -> list[TemperatureSensorAPIResponse | DoorSensorAPIResponse] | None:
     """Helper function to get sensor data."""
-    return asyncio.run(URLRequestHandler.get_sensor_data(sensor_list_response))
-
-def get_sensor_history_data(sensor_list_response: SensorListAPIResponse, start_time:str, end_time:str) -> dict[str, Any] | None | None:
-    """helper to grab sensor history information for sensors in list."""
-    sensor_history_response = asyncio.run(
-        URLRequestHandler.get_sensor_history(
-        sensor_list_response, start_time=start_time, end_time=end_time
-        )
+    return await URLRequestHandler.get_sensor_data(sensor_list_response)
+
+async def get_sensor_history_data(
+        sensor_list_response: SensorListAPIResponse, start_time:str, end_time:str, step_ms: int = HISTORY_STEP_MS,
+        history_cache: HistoryCache | None = None,
+    ) -> SensorHistoryAPIResponse | None:
+    """helper to grab sensor history information for sensors in list, only fetching spans not cached yet."""
+    history_cache = history_cache if history_cache is not None else HistoryCache()
+    sensor_history_response = await history_cache.get_history(
+        sensor_list_response,
+        start_ms=convert_datetime_to_epoch_millis(start_time),
+        end_ms=convert_datetime_to_epoch_millis(end_time),
+        step_ms=step_ms,
     )
+    if sensor_history_response is None:
+        print("[API SENSOR HISTORY WRAPPER] Response empty.")
     return sensor_history_response
 
+async def _cancel_task(task: asyncio.Task) -> None:
+    """Stop a task the run no longer needs and collect its outcome, a task that already finished is left as is."""
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    except Exception as exc:  # already raised to the run if it got that far, otherwise reported here
+        print(f"[MAIN] Background task failed: {exc}")
+
+async def _fetch_sensor_assignments(
+        timer: StageTimer, sensor_dimension: SensorDimension,
+    ) -> tuple[SensorListAPIResponse, dict[str, list[TemperatureSensorAPIResponse | DoorSensorAPIResponse]]]:
+    """Get the sensor list and latest readings, grouped by the vehicle each sensor reports for.
+
+    The sensor dimension is brought up to date with the assignments on the way.
+    """
+    sensor_list = await timer.timed("fetch_sensor_list", get_sensor_list(sensor_dimension))
+    if sensor_list is None:
+        raise ValueError("[MAIN] Empty response from sensor list wrapper.")
+    sensor_data_list = await timer.timed("fetch_sensor_data", get_sensor_data(sensor_list))
+    if sensor_data_list is None:
+        raise ValueError("[MAIN] Empty response from sensor data wrapper.")
+
+    sensor_data_by_vehicle: dict[str, list[TemperatureSensorAPIResponse | DoorSensorAPIResponse]] = {}
+    for sensor_data in sensor_data_list:
+        vehicle_id = str(sensor_data.sensors[0].vehicle_id)
+        sensor_data_by_vehicle.setdefault(vehicle_id, []).append(sensor_data)
+    with timer.stage("upsert_dimensions"):
+        sensor_dimension.upsert(sensor_dimension_rows(sensor_list, sensor_data_list))
+    return sensor_list, sensor_data_by_vehicle
+
+def vehicle_dimension_rows(vehicles: list[Vehicle]) -> pd.DataFrame:
+    """Rows of the vehicle dimension for a page of vehicles."""
+    return pd.DataFrame({
+        "vehicle_id": [vehicle.id for vehicle in vehicles],
+        "name": [vehicle.name for vehicle in vehicles],
+        "make": [vehicle.make for vehicle in vehicles],
+        "model": [vehicle.model for vehicle in vehicles],
+        "year": [vehicle.year for vehicle in vehicles],
+        "gateway_sn": [vehicle.externalIds.serial for vehicle in vehicles],
+    })
+
+def sensor_dimension_rows(sensor_list: SensorListAPIResponse, sensor_data_list) -> pd.DataFrame:
+    """Rows of the sensor dimension, the vehicle of a sensor comes from its latest reading."""
+    vehicle_by_sensor = {sensor_data.sensors[0].id: str(sensor_data.sensors[0].vehicle_id) for sensor_data in sensor_data_list}
+    sensors = [sensor for sensor in sensor_list.sensors if sensor.id in vehicle_by_sensor]
+    return pd.DataFrame({
+        "sensor_id": [sensor.id for sensor in sensors],
+        "vehicle_id": [vehicle_by_sensor[sensor.id] for sensor in sensors],
+        "name": [sensor.name for sensor in sensors],
+        "mac": [sensor.mac_address for sensor in sensors],
+        "kind": [sensor.kind for sensor in sensors],
+    })
+
+def _fahrenheit(millicelsius):
+    """Temperatures are stored in Fahrenheit, the api reports millidegrees Celsius."""
+    return millicelsius * 0.001 * (9/5) + 32
+
 def convert_data_model_to_timeseries(vehicle_data:Vehicle, sensor_list: list[Sensor], sensor_data_list) -> pd.DataFrame:
-    """Convert extracted responses into a consumable format for local data storage."""
-    # create some dictionaries from the extracted vehicle and sensor data responses
-    vehicle_data_to_save = {
-        "Make": vehicle_data.make,
-        "Model": vehicle_data.model,
-        "Year": vehicle_data.year,
-        "Gateway SN": vehicle_data.externalIds.serial
-    }
-    # create sensor dict
-    sensor_list_data_to_save = {}
-    for i, (sensor, sensor_data) in enumerate(zip(sensor_list, sensor_data_list)):
-        sensor_list_data_to_save[f"Sensor {i} ID"] = sensor.id,
-        sensor_list_data_to_save[f"Sensor {i} Name"] = sensor.name,
-        sensor_list_data_to_save[f"Sensor {i} MAC"] = sensor.mac_address,
-    
+    """Convert the latest readings of a vehicle's sensors into one fact row per reading."""
+    sensor_ids, epoch_millis, values = [], [], []
+    for sensor_data in sensor_data_list:
+        sensor = sensor_data.sensors[0]
+        sensor_ids.append(sensor.id)
         if isinstance(sensor_data, TemperatureSensorAPIResponse):
-            sensor_list_data_to_save[f"Sensor {i} Type"] = "Temperature",
-            sensor_list_data_to_save["Ambient Temp."] = sensor_data.sensors[0].ambient_temperature * 0.001 * (9/5) + 32 # millicelcius -> Farenheit
-            sensor_list_data_to_save["Ambient Temp. Timestamp"] = sensor_data.sensors[0].ambient_temperature_time.strftime("%Y-%m-%d %H:%M")
+            epoch_millis.append(sensor.ambient_temperature_time_ms)
+            values.append(_fahrenheit(sensor.ambient_temperature))
         else:
-            sensor_list_data_to_save[f"Sensor {i} Type"] = "Door",
-            sensor_list_data_to_save["Door State"] = sensor_data.sensors[0].door_closed
-            sensor_list_data_to_save["Door State Timestamp"] = sensor_data.sensors[0].door_status_time.strftime("%Y-%m-%d %H:%M")
+            epoch_millis.append(sensor.door_status_time_ms)
+            values.append(float(sensor.door_closed))
+    return pd.DataFrame({
+        "vehicle_id": vehicle_data.id,
+        "sensor_id": np.asarray(sensor_ids, dtype=np.int64),
+        "ts": epoch_millis_to_timestamps(epoch_millis),
+        "value": np.asarray(values, dtype=np.float64),
+    })
 
-    # convert data dictionaries into dataframes, concatenate and return
-    vehicle_df = pd.DataFrame([vehicle_data_to_save])
-    sensor_df = pd.DataFrame([sensor_list_data_to_save])
+def convert_history_to_timeseries(vehicle_data:Vehicle, sensor_list: list[Sensor], sensor_history_data: SensorHistoryAPIResponse) -> pd.DataFrame:
+    """Convert a vehicle's sensor history into fact rows.
 
-    final_row_df = pd.concat([vehicle_df, sensor_df], axis=1, ignore_index=False)
-    final_row_df.sort_index(inplace=True)
+    Temperature sensors get one row per timestamp, change event sensors only a row at the
+    start of the window and wherever their state changes.
+    """
+    # (time x series) array, flattened time major so rows come out in time order
+    time_ms, values = sensor_history_data.to_arrays()
+    values = values.astype(np.float64)
+    is_temperature = np.array([sensor.kind == SensorKinds.TEMPERATURE for sensor in sensor_list], dtype=bool)
+    values[:, is_temperature] = _fahrenheit(values[:, is_temperature])
+    is_event = np.array([sensor.kind in CHANGE_EVENT_KINDS for sensor in sensor_list], dtype=bool)
+    keep = np.ones(values.shape, dtype=bool)
+    # a change is judged against the sensor's last actual reading, steps it has none for are skipped
+    event_states = pd.DataFrame(values[:, is_event]).ffill().to_numpy()
+    keep[1:, is_event] = event_states[1:] != event_states[:-1]
+    keep = (keep & ~np.isnan(values)).ravel()
+    num_sensors = len(sensor_list)
+    return pd.DataFrame({
+        "vehicle_id": vehicle_data.id,
+        "sensor_id": np.tile(np.array([sensor.id for sensor in sensor_list], dtype=np.int64), len(time_ms))[keep],
+        "ts": epoch_millis_to_timestamps(np.repeat(time_ms, num_sensors)[keep]),
+        "value": values.ravel()[keep],
+    })
 
-    return final_row_df
+def _legacy_str(value: Any) -> str:
+    """The single-file store kept sensor details as one-element tuples, strip the serialization artifacts."""
+    return str(value).translate(str.maketrans("", "", ", '\"()[]"))
 
-def convert_history_to_timeseries(vehicle_data:Vehicle, sensor_list: list[Sensor], sensor_history_data: SensorHistoryAPIResponse) -> pd.DataFrame:
-    """Convert extracted responses into a consumable format for local data storage."""
-    # create some dictionaries from the extracted vehicle and sensor data responses - repeat for each timestamp
-    len_timestamps = len(sensor_history_data.results)
-    vehicle_data_to_save = {
-        "Make": [vehicle_data.make for _ in range(len_timestamps)],
-        "Model": [vehicle_data.model for _ in range(len_timestamps)],
-        "Year": [vehicle_data.year for _ in range(len_timestamps)],
-        "Gateway SN": [vehicle_data.externalIds.serial for _ in range(len_timestamps)],
+def legacy_rows_to_facts(legacy_df: pd.DataFrame, vehicle_ids: pd.Series, sensor_dimension: SensorDimension) -> pd.DataFrame:
+    """Split the wide rows of the single-file store into readings, adding their sensors to the sensor dimension.
+
+    Each row is one poll of one vehicle with a temperature and a door reading, timestamps
+    are naive UTC minute strings. Door readings are cut down to their changes like polled ones.
+
+    Args:
+        legacy_df: rows of the old sensor_data.parquet.
+        vehicle_ids: vehicle of each row, aligned with legacy_df.
+    Returns:
+        vehicle_id, sensor_id, ts and value rows.
+    """
+    legacy_kinds = {"Temperature": SensorKinds.TEMPERATURE, "Door": SensorKinds.DOOR}
+    legacy_columns = {
+        SensorKinds.TEMPERATURE: ("Ambient Temp.", "Ambient Temp. Timestamp"),
+        SensorKinds.DOOR: ("Door State", "Door State Timestamp"),
     }
-    # extract sensor data
-    sensor_list_data_to_save = {}
-    for i, sensor in enumerate(sensor_list):
-        sensor_list_data_to_save[f"Sensor {i} ID"] = [sensor.id for _ in range(len_timestamps)]
-        sensor_list_data_to_save[f"Sensor {i} Name"] = [sensor.name for _ in range(len_timestamps)]
-        sensor_list_data_to_save[f"Sensor {i} MAC"] = [sensor.mac_address for _ in range(len_timestamps)]
-        sensor_list_data_to_save[f"Sensor {i} Type"] = ["Temperature" if sensor.name == SensorSerialNums.TEMP else "Door" for _ in range(len_timestamps)]
-        if sensor.name == SensorSerialNums.TEMP:
-            sensor_list_data_to_save["Ambient Temp."] = [result.values[i] * 0.001 * (9/5) + 32 for result in sensor_history_data.results] # millicelcius -> Farenheit
-            sensor_list_data_to_save["Ambient Temp. Timestamp"] = [result.time_ms.strftime("%Y-%m-%d %H:%M") for result in sensor_history_data.results]
-        else:
-            sensor_list_data_to_save["Door State"] = [result.values[i] for result in sensor_history_data.results]
-            sensor_list_data_to_save["Door State Timestamp"] = [result.time_ms.strftime("%Y-%m-%d %H:%M") for result in sensor_history_data.results]
-    
-    # convert data dictionaries into dataframes, concatenate and return
-    vehicle_df = pd.DataFrame(vehicle_data_to_save)
-    sensor_df = pd.DataFrame(sensor_list_data_to_save)
-
-    final_row_df = pd.concat([vehicle_df, sensor_df], axis=1, ignore_index=False)
-    final_row_df.sort_index(inplace=True)
-
-    return final_row_df        
-        
-def update_data_warehouse(row_data_df: pd.DataFrame, save_path: str = LOCAL_TIME_SERIES_STORAGE_FILE) -> None:
-    """Create and/or save timeseries data to storage."""
-
-    if not os.path.exists(save_path) or save_path == LOCAL_HISTORY_TIME_SERIES_STORAGE_FILE:
-        row_data_df.to_parquet(save_path, engine='pyarrow', index=True, compression="snappy")
-    else:
-        timeseries_df = pd.read_parquet(save_path, dtype_backend="pyarrow")
-        timeseries_df_updated = pd.concat([timeseries_df, row_data_df])
-        timeseries_df_updated.sort_index(inplace=True)
-        for col in timeseries_df_updated.select_dtypes(include=["object"]).columns:
-            timeseries_df_updated[col] = timeseries_df_updated[col].astype(str)
-        timeseries_df_updated.to_parquet(save_path, engine='pyarrow', index=True, compression="snappy")
+    fact_dfs, sensor_dfs = [], []
+    num_sensors = sum(1 for col in legacy_df.columns if col.startswith("Sensor ") and col.endswith(" ID"))
+    for i in range(num_sensors):
+        sensor_df = pd.DataFrame({
+            "sensor_id": legacy_df[f"Sensor {i} ID"].map(_legacy_str).astype(np.int64),
+            "vehicle_id": vehicle_ids.astype(str),
+            "name": legacy_df[f"Sensor {i} Name"].map(_legacy_str),
+            "mac": legacy_df[f"Sensor {i} MAC"].map(_legacy_str),
+            "kind": legacy_df[f"Sensor {i} Type"].map(_legacy_str).map(legacy_kinds),
+        })
+        sensor_dfs.append(sensor_df.drop_duplicates("sensor_id", keep="last"))
+        for sensor_kind, (value_column, timestamp_column) in legacy_columns.items():
+            if value_column not in legacy_df.columns:
+                continue
+            rows = (sensor_df["kind"] == sensor_kind).to_numpy()
+            fact_dfs.append(pd.DataFrame({
+                "vehicle_id": sensor_df["vehicle_id"][rows],
+                "sensor_id": sensor_df["sensor_id"][rows],
+                "ts": legacy_df[timestamp_column][rows],
+                "value": pd.to_numeric(legacy_df[value_column][rows].astype(object), errors="coerce").astype(np.float64),
+            }))
+    if not fact_dfs:
+        return pd.DataFrame(columns=["vehicle_id"] + FACT_SCHEMA.names)
+    sensors_df = pd.concat(sensor_dfs, ignore_index=True)
+    sensor_dimension.upsert(sensors_df)
+    fact_df = normalize_timestamp_columns(pd.concat(fact_dfs, ignore_index=True))
+    fact_df = fact_df.dropna().drop_duplicates(["sensor_id", "ts"]).sort_values(SORT_COLUMN, kind="stable")
+    # every poll repeated the door state, only the changes are kept
+    is_event = fact_df["sensor_id"].map(dict(zip(sensors_df["sensor_id"], sensors_df["kind"]))).isin(CHANGE_EVENT_KINDS)
+    is_change = fact_df.groupby("sensor_id")["value"].diff().ne(0).to_numpy()
+    return fact_df[~is_event.to_numpy() | is_change].reset_index(drop=True)
+
+def update_data_warehouse(row_data_df: pd.DataFrame, save_path: str = LOCAL_HISTORY_TIME_SERIES_STORAGE_FILE, overwrite: bool = False) -> None:
+    """Create and/or save readings to storage, replacing what is stored when overwrite is set."""
+    row_data_df = normalize_timestamp_columns(row_data_df[FACT_SCHEMA.names].copy())
+    if not overwrite and os.path.exists(save_path):
+        with metrics.timer("parquet_read", target="history"):
+            stored_df = pd.read_parquet(save_path, columns=FACT_SCHEMA.names)
+        row_data_df = pd.concat([stored_df, row_data_df], ignore_index=True)
+    # a reading is keyed on (sensor, timestamp), so merging an overlapping window again changes nothing
+    row_data_df = row_data_df.drop_duplicates(["sensor_id", "ts"], keep="last")
+    # time ordered rows give each row group a narrow timestamp range for readers to prune on
+    pa_table = pa.Table.from_pandas(row_data_df.sort_values(SORT_COLUMN, kind="stable"), schema=FACT_SCHEMA, preserve_index=False)
+    # written then renamed, the server reads this file back while other ranges are ingested
+    tmp_path = f"{save_path}.tmp"
+    with metrics.timer("parquet_write", target="history"):
+        pq.write_table(pa_table, tmp_path, compression="snappy", row_group_size=STORE_ROW_GROUP_SIZE, write_statistics=True)
+    metrics.count("rows_written", pa_table.num_rows, target="history")
+    metrics.count("bytes_written", os.path.getsize(tmp_path), target="history")
+    os.replace(tmp_path, save_path)
     print(f"[MAIN] Local timeseries updated.")
 
-def update_data_warehouse_from_time_range(start_time: str, end_time: str) -> None:
-    """Update the local data warehouse from a specified time range."""
-    
-    # get vehicle info and sensor info
-    vehicle_data = get_vehicle_data()
-    if vehicle_data is None:
-        raise ValueError("[MAIN] Empty response from vehicle wrapper.")
-    vehicle_data = vehicle_data.data[0]
-    sensor_list = get_sensor_list()
-    if sensor_list is None:
-        raise ValueError("[MAIN] Empty response from sensor list wrapper.")
-    
-    # get sensor data for time range
-    time_series_values = get_sensor_history_data(sensor_list, start_time, end_time)
-    if time_series_values is not None:
-        wrapped_time_series_values = SensorHistoryAPIResponse.from_json(time_series_values)
-    else:
-        print("[API SENSOR HISTORY WRAPPER] Response empty.")
-        return None
-    
-    # convert extracted data models into table
-    timeseries_df = convert_history_to_timeseries(vehicle_data, sensor_list.sensors, wrapped_time_series_values)
-    update_data_warehouse(timeseries_df, LOCAL_HISTORY_TIME_SERIES_STORAGE_FILE)
+async def update_data_warehouse_from_time_range(
+        start_time: str, end_time: str, step_ms: int = HISTORY_STEP_MS, history_cache: HistoryCache | None = None,
+        vehicle_dimension: VehicleDimension | None = None, sensor_dimension: SensorDimension | None = None,
+        save_path: str = LOCAL_HISTORY_TIME_SERIES_STORAGE_FILE,
+    ) -> dict[str, float]:
+    """Update the local data warehouse from a specified time range, for every vehicle in the fleet.
+
+    The range is written to the history file only, the rollups cover the polled readings.
+
+    Returns:
+        wall-clock seconds spent in each stage of the run.
+    """
+    timer = StageTimer()
+    vehicle_dimension = vehicle_dimension if vehicle_dimension is not None else VehicleDimension()
+    sensor_dimension = sensor_dimension if sensor_dimension is not None else SensorDimension()
+    with timer.stage("total"):
+        # vehicle pages and sensor assignments are independent, start both at once
+        sensor_task = asyncio.create_task(_fetch_sensor_assignments(timer, sensor_dimension))
+        history_cache = history_cache if history_cache is not None else HistoryCache()
+        first_page = True
+        try:
+            async for vehicle_page in iter_vehicles(timer):
+                with timer.stage("upsert_dimensions"):
+                    vehicle_dimension.upsert(vehicle_dimension_rows(vehicle_page))
+                sensor_list, sensor_data_by_vehicle = await sensor_task
+                # request history for every vehicle on the page concurrently
+                page_vehicles = [vehicle for vehicle in vehicle_page if vehicle.id in sensor_data_by_vehicle]
+                page_sensor_lists = [
+                    sensor_list.subset([sensor_data.sensors[0].id for sensor_data in sensor_data_by_vehicle[vehicle.id]])
+                    for vehicle in page_vehicles
+                ]
+                page_history = await timer.timed("fetch_sensor_history", asyncio.gather(*(
+                    get_sensor_history_data(vehicle_sensor_list, start_time, end_time, step_ms, history_cache)
+                    for vehicle_sensor_list in page_sensor_lists
+                )))
+
+                # convert extracted data models into table
+                with timer.stage("convert"):
+                    page_dfs = [
+                        convert_history_to_timeseries(vehicle, vehicle_sensor_list.sensors, vehicle_history)
+                        for vehicle, vehicle_sensor_list, vehicle_history in zip(page_vehicles, page_sensor_lists, page_history)
+                        if vehicle_history is not None
+                    ]
+                if not page_dfs:
+                    continue
+                # replace the previous range on the first page, then append the rest of the fleet
+                with timer.stage("write"):
+                    update_data_warehouse(pd.concat(page_dfs, ignore_index=True), save_path, overwrite=first_page)
+                first_page = False
+        finally:
+            # e.g. with no vehicle pages or a failed page, the assignments fetch must not outlive the run
+            await _cancel_task(sensor_task)
+    return timer.timings
+
+async def update_data_warehouse_from_latest(
+        store: PartitionedParquetStore | None = None, rollups: RollupStore | None = None,
+        vehicle_dimension: VehicleDimension | None = None, sensor_dimension: SensorDimension | None = None,
+        ingest_index: IngestIndex | None = None, change_notifier: ChangeNotifier | None = None,
+    ) -> dict[str, float]:
+    """Update the local data warehouse with the latest sensor readings, for every vehicle in the fleet.
+
+    Returns:
+        wall-clock seconds spent in each stage of the run.
+    """
+    timer = StageTimer()
+    store = store if store is not None else PartitionedParquetStore()
+    rollups = rollups if rollups is not None else RollupStore()
+    vehicle_dimension = vehicle_dimension if vehicle_dimension is not None else VehicleDimension()
+    sensor_dimension = sensor_dimension if sensor_dimension is not None else SensorDimension()
+    ingest_index = ingest_index if ingest_index is not None else IngestIndex()
+    change_notifier = change_notifier if change_notifier is not None else ChangeNotifier()
+    appended_dfs = []
+    num_repeats = 0
+    with timer.stage("total"):
+        # readings of the old single-file store are moved over once, before compaction reads the store
+        await timer.timed("migrate", asyncio.to_thread(
+            migrate_legacy_store, store, rollups, vehicle_dimension, sensor_dimension,
+        ))
+        if rollups.covers_from_ms is None:
+            # tiers not written yet roll up what is already stored first, so they cover all of it
+            with timer.stage("rollup"):
+                rollups.rebuild(store.read_all(), sensor_dimension.read())
+        if ingest_index.is_empty:
+            # start from what is already stored, so the first indexed poll does not repeat it
+            with timer.stage("dedup"):
+                ingest_index.advance(store.read_all())
+        # compact files from earlier polls off the event loop while this poll is fetched
+        compact_task = asyncio.create_task(timer.timed("compact", asyncio.to_thread(store.compact)))
+        # vehicle pages and sensor assignments are independent, start both at once
+        sensor_task = asyncio.create_task(_fetch_sensor_assignments(timer, sensor_dimension))
+        try:
+            async for vehicle_page in iter_vehicles(timer):
+                with timer.stage("upsert_dimensions"):
+                    vehicle_dimension.upsert(vehicle_dimension_rows(vehicle_page))
+                sensor_list, sensor_data_by_vehicle = await sensor_task
+                # convert extracted data models into fact rows we can add to the readings
+                with timer.stage("convert"):
+                    page_dfs = []
+                    for vehicle in vehicle_page:
+                        vehicle_sensor_data = sensor_data_by_vehicle.get(vehicle.id)
+                        if vehicle_sensor_data is None:
+                            print(f"[MAIN] No sensors reporting for vehicle {vehicle.id}.")
+                            continue
+                        vehicle_sensor_list = sensor_list.subset([sensor_data.sensors[0].id for sensor_data in vehicle_sensor_data])
+                        page_dfs.append(convert_data_model_to_timeseries(vehicle, vehicle_sensor_list.sensors, vehicle_sensor_data))
+                if not page_dfs:
+                    continue
+                # readings unchanged since the last poll are dropped before anything is written,
+                # so are readings of change event sensors that repeat the state already stored
+                with timer.stage("dedup"):
+                    page_df = pd.concat(page_dfs, ignore_index=True)
+                    seen_df = ingest_index.filter_new(page_df)
+                    event_sensor_ids = {sensor.id for sensor in sensor_list.sensors if sensor.kind in CHANGE_EVENT_KINDS}
+                    new_df = ingest_index.drop_unchanged(seen_df, event_sensor_ids)
+                    num_repeats += len(page_df) - len(new_df)
+                # append only, earlier polls are never read back or rewritten
+                if not new_df.empty:
+                    with timer.stage("write"):
+                        store.append(new_df)
+                        appended_dfs.append(new_df)
+                ingest_index.advance(seen_df)
+            # saved once the readings it covers are on disk
+            ingest_index.save()
+            print(f"[MAIN] Stored {sum(len(new_df) for new_df in appended_dfs)} new readings, skipped {num_repeats} repeats.")
+            # fold only this poll's rows into the rollups
+            if appended_dfs:
+                appended_df = pd.concat(appended_dfs, ignore_index=True)
+                with timer.stage("rollup"):
+                    rollups.update(appended_df, sensor_dimension.read())
+                # after the rollups, so a dashboard refetching a rollup tier on the notification sees this poll
+                change_notifier.notify(appended_df)
+            await compact_task
+        finally:
+            # e.g. with no vehicle pages or a failed page, neither task may outlive the run
+            await _cancel_task(sensor_task)
+            await _cancel_task(compact_task)
+    return timer.timings
+
+async def run_ingestion(start_time: str | None = None, end_time: str | None = None, step_ms: int = HISTORY_STEP_MS) -> dict[str, float]:
+    """Run one ingestion on a single event loop, closing the shared connection pool afterwards."""
+    try:
+        # just use start/end time from GUI to determine run mode for now
+        if start_time is not None and end_time is not None:
+            return await update_data_warehouse_from_time_range(start_time, end_time, step_ms)
+        return await update_data_warehouse_from_latest()
+    finally:
+        await URLRequestHandler.close_session()
+
+def migrate_legacy_store(
+        store: PartitionedParquetStore, rollups: RollupStore,
+        vehicle_dimension: VehicleDimension, sensor_dimension: SensorDimension,
+        legacy_path: str = LOCAL_LEGACY_TIME_SERIES_STORAGE_FILE,
+    ) -> int:
+    """Move the readings of the old single-file store into the partitioned store, once.
+
+    The old file does not hold vehicle ids, its rows are matched to vehicles by gateway
+    serial through the vehicle dimension. Until a poll has added those vehicles the file
+    is left for a later run. The readings are written as one named batch, so a run cut
+    short before the file is set aside writes them again rather than twice. The file is
+    kept with a .migrated suffix.
+
+    Returns:
+        number of readings moved.
+    """
+    if not os.path.exists(legacy_path):
+        return 0
+    legacy_df = pd.read_parquet(legacy_path)
+    vehicles_df = vehicle_dimension.read()
+    vehicle_ids = legacy_df["Gateway SN"].map(_legacy_str).map(dict(zip(vehicles_df["gateway_sn"], vehicles_df["vehicle_id"])))
+    if vehicle_ids.isna().any():
+        print(f"[MAIN] Vehicles of {legacy_path} not known yet, migrating it once they are polled.")
+        return 0
+    fact_df = legacy_rows_to_facts(legacy_df, vehicle_ids, sensor_dimension)
+    if not fact_df.empty:
+        store.append(fact_df, batch_name="legacy")
+        # the migrated readings are older than what the rollups were updated with
+        rollups.rebuild(store.read_all(), sensor_dimension.read())
+    os.replace(legacy_path, f"{legacy_path}.migrated")
+    print(f"[MAIN] Migrated {len(fact_df)} readings from {legacy_path}.")
+    return len(fact_df)
+
+def rebuild_rollups(
+        store: PartitionedParquetStore | None = None, rollups: RollupStore | None = None,
+        sensor_dimension: SensorDimension | None = None,
+    ) -> None:
+    """Recompute every rollup tier from the raw store, e.g. for data polled before rollups existed."""
+    store = store if store is not None else PartitionedParquetStore()
+    rollups = rollups if rollups is not None else RollupStore()
+    sensor_dimension = sensor_dimension if sensor_dimension is not None else SensorDimension()
+    if not os.path.isdir(store.root_dir):
+        print("[MAIN] No raw data to roll up.")
+        return
+    rollups.rebuild(store.read_all(), sensor_dimension.read())
 
 def main():
     """Main script to pull info down from the cloud."""
@@ -174,31 +497,30 @@ def main():
         type=str,
         default=None,
     )
+    parser.add_argument(
+        '--step-ms',
+        type=int,
+        default=HISTORY_STEP_MS,
+    )
+    parser.add_argument(
+        '--rebuild-rollups',
+        action='store_true',
+        help="recompute the rollups from everything in the raw store, then exit",
+    )
     args = parser.parse_args()
+    if args.rebuild_rollups:
+        rebuild_rollups()
+        return
     start_time = args.start_time
     end_time = args.end_time
-    
-    # just use start/end time from GUI to determine run mode for now
-    if start_time is not None and end_time is not None:
-        # use history function to update data warehouse
-        update_data_warehouse_from_time_range(start_time, end_time)
-    else:
-        # pull vehicle info, sensor data
-        vehicle_data = get_vehicle_data()
-        if vehicle_data is None:
-            raise ValueError("[MAIN] Empty response from vehicle wrapper.")
-        vehicle_data = vehicle_data.data[0]
-        sensor_list = get_sensor_list()
-        if sensor_list is None:
-            raise ValueError("[MAIN] Empty response from sensor list wrapper.")
-        sensor_data_list = get_sensor_data(sensor_list)
-        if sensor_data_list is None:
-            raise ValueError("[MAIN] Empty response from sensor data wrapper.")
-
-        # convert extracted data models into a row we can add to timeseries data
-        data_row_df = convert_data_model_to_timeseries(vehicle_data, sensor_list.sensors, sensor_data_list)
-        # well use a local file as a data warehouse
-        update_data_warehouse(data_row_df)
+
+    timings = asyncio.run(run_ingestion(start_time, end_time, args.step_ms))
+    log_event(
+        "ingestion_run",
+        mode="range" if start_time is not None and end_time is not None else "latest",
+        timings={stage: round(seconds, 6) for stage, seconds in timings.items()},
+        **metrics.snapshot(),
+    )
 
 
 
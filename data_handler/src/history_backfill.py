@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""This file handles windowed, resumable history backfills over long time ranges."""
+from __future__ import annotations
+from src.api_handler import URLRequestHandler, SensorListAPIResponse, SensorHistoryAPIResponse
+from src.constants import (
+    HISTORY_STEP_MS,
+    HISTORY_MAX_POINTS_PER_REQUEST,
+    HISTORY_MAX_CONCURRENT_WINDOWS,
+    LOCAL_BACKFILL_CHECKPOINT_DIR,
+)
+import asyncio
+import hashlib
+import json
+import numpy as np
+import os
+import shutil
+
+
+def stitch_history_windows(window_responses: list[SensorHistoryAPIResponse]) -> SensorHistoryAPIResponse:
+    """Join window responses in order, dropping points repeated on shared window edges."""
+    if not window_responses:
+        return SensorHistoryAPIResponse.from_arrays(np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.int64))
+    time_ms = np.concatenate([window_response.time_ms for window_response in window_responses])
+    values = np.concatenate([window_response.values for window_response in window_responses])
+    # a point is kept only if it is later than every point before it
+    previous_max = np.maximum.accumulate(np.concatenate(([np.iinfo(np.int64).min], time_ms[:-1])))
+    keep = time_ms > previous_max
+    return SensorHistoryAPIResponse.from_arrays(time_ms[keep], values[keep])
+
+
+class HistoryBackfill:
+    """Splits a history request into step-aligned windows fetched concurrently.
+
+    Each finished window is checkpointed to disk, so rerunning the same backfill
+    after a failure only requests the windows that are still missing.
+    """
+
+    def __init__(
+        self,
+        sensor_list_response: SensorListAPIResponse,
+        start_ms: int,
+        end_ms: int,
+        step_ms: int = HISTORY_STEP_MS,
+        max_points_per_request: int = HISTORY_MAX_POINTS_PER_REQUEST,
+        max_concurrency: int = HISTORY_MAX_CONCURRENT_WINDOWS,
+        checkpoint_dir: str = LOCAL_BACKFILL_CHECKPOINT_DIR,
+    ) -> None:
+        """Configure the backfill.
+
+        Args:
+            sensor_list_response: sensors to request a series for.
+            start_ms: range start, epoch millis.
+            end_ms: range end, epoch millis.
+            step_ms: resolution of the returned series.
+            max_points_per_request: cap on timestamps x series in one window.
+            max_concurrency: maximum windows in flight at once.
+            checkpoint_dir: where finished windows are kept until the backfill completes.
+        """
+        self.sensor_list_response = sensor_list_response
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.step_ms = step_ms
+        self.max_points_per_request = max_points_per_request
+        self.max_concurrency = max_concurrency
+        self.checkpoint_dir = checkpoint_dir
+
+    @property
+    def window_ms(self) -> int:
+        """Window length, a whole number of steps sized to the number of series."""
+        num_series = max(1, len(self.sensor_list_response.sensors))
+        steps_per_window = max(1, self.max_points_per_request // num_series)
+        return steps_per_window * self.step_ms
+
+    def build_windows(self) -> list[tuple[int, int]]:
+        """Split the range into (start_ms, end_ms) windows."""
+        window_ms = self.window_ms
+        return [
+            (window_start, min(window_start + window_ms, self.end_ms))
+            for window_start in range(self.start_ms, self.end_ms, window_ms)
+        ]
+
+    @property
+    def checkpoint_path(self) -> str:
+        """Checkpoint directory for this exact request, so unrelated backfills never mix."""
+        request_key = json.dumps({
+            "sensors": sorted(sensor.id for sensor in self.sensor_list_response.sensors),
+            "start_ms": self.start_ms,
+            "end_ms": self.end_ms,
+            "step_ms": self.step_ms,
+            "window_ms": self.window_ms,
+        })
+        return os.path.join(self.checkpoint_dir, hashlib.sha1(request_key.encode()).hexdigest())
+
+    def _load_window(self, window_path: str) -> bytes | None:
+        if not os.path.exists(window_path):
+            return None
+        with open(window_path, "rb") as window_file:
+            return window_file.read()
+
+    def _save_window(self, window_path: str, window_response: bytes) -> None:
+        # the raw body is kept as is, write then rename so a crash never leaves a half finished window
+        tmp_path = f"{window_path}.tmp"
+        with open(tmp_path, "wb") as window_file:
+            window_file.write(window_response)
+        os.replace(tmp_path, window_path)
+
+    async def run(self, semaphore: asyncio.Semaphore | None = None) -> SensorHistoryAPIResponse | None:
+        """Fetch every window not already checkpointed and stitch the results together.
+
+        Args:
+            semaphore: shared by backfills running side by side so max_concurrency caps them together.
+        Returns:
+            history over the whole range, or None if any window failed.
+        """
+        windows = self.build_windows()
+        checkpoint_path = self.checkpoint_path
+        os.makedirs(checkpoint_path, exist_ok=True)
+        semaphore = semaphore if semaphore is not None else asyncio.Semaphore(self.max_concurrency)
+
+        async def _fetch_window(window_index: int, window_start: int, window_end: int) -> bytes | None:
+            window_path = os.path.join(checkpoint_path, f"window_{window_index:06d}.json")
+            window_response = self._load_window(window_path)
+            if window_response is not None:
+                return window_response
+            async with semaphore:
+                window_response = await URLRequestHandler.get_sensor_history_window(
+                    self.sensor_list_response, start_ms=window_start, end_ms=window_end, step_ms=self.step_ms,
+                )
+            if window_response is not None:
+                self._save_window(window_path, window_response)
+            return window_response
+
+        window_responses = await asyncio.gather(*(
+            _fetch_window(window_index, window_start, window_end)
+            for window_index, (window_start, window_end) in enumerate(windows)
+        ))
+
+        num_failed = sum(1 for window_response in window_responses if window_response is None)
+        if num_failed:
+            print(f"[BACKFILL] {num_failed}/{len(windows)} windows failed, rerun to resume from {checkpoint_path}")
+            return None
+
+        stitched_response = stitch_history_windows(
+            [SensorHistoryAPIResponse.from_json(window_response) for window_response in window_responses]
+        )
+        shutil.rmtree(checkpoint_path, ignore_errors=True)
+        print(f"[BACKFILL] Stitched {len(windows)} windows into {len(stitched_response.time_ms)} timestamps.")
+        return stitched_response
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""This file holds the range-aware local cache for sensor history."""
+from __future__ import annotations
+from src.api_handler import SensorListAPIResponse, SensorHistoryAPIResponse
+from src.history_backfill import HistoryBackfill
+from src.constants import LOCAL_HISTORY_CACHE_DIR, HISTORY_CACHE_MAX_ROWS, HISTORY_MAX_CONCURRENT_WINDOWS
+from contextlib import contextmanager
+from typing import Any, Iterator
+import pandas as pd
+import numpy as np
+import asyncio
+import fcntl
+import json
+import os
+import time
+import uuid
+
+
+class HistoryCache:
+    """Interval index over the (sensor, step, time range) history already stored locally.
+
+    Only the gaps of a request are fetched from the api, the rest is read from disk. Every
+    fetched span is written to its own chunk file, and chunks are evicted least recently used
+    first once the cache holds more than max_rows. The index is shared by every process using
+    the cache directory, so it is only changed under a file lock, reloaded first and written
+    then renamed. A chunk file is written before the index refers to it and deleted after.
+    """
+
+    def __init__(self, cache_dir: str = LOCAL_HISTORY_CACHE_DIR, max_rows: int = HISTORY_CACHE_MAX_ROWS) -> None:
+        """Load the interval index.
+
+        Args:
+            cache_dir: directory holding the index and one directory of chunk files per sensor and step.
+            max_rows: rows kept across all series before the least recently used chunks are dropped.
+        """
+        self.cache_dir = cache_dir
+        self.max_rows = max_rows
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.lock_path = os.path.join(cache_dir, "index.lock")
+        # gaps being backfilled are checkpointed next to the cache they fill
+        self.checkpoint_dir = os.path.join(cache_dir, "checkpoints")
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index: dict[str, list[dict[str, Any]]] = self._load_index()
+
+    def _load_index(self) -> dict[str, list[dict[str, Any]]]:
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path, "r", encoding="utf-8") as index_file:
+            index = json.load(index_file)
+        # spans of the old one file per series layout have no chunk file, they are fetched again
+        return {
+            series_key: chunks
+            for series_key, chunks in ((key, [chunk for chunk in chunks if "file" in chunk]) for key, chunks in index.items())
+            if chunks
+        }
+
+    def _save_index(self) -> None:
+        """Persist the interval index, written then renamed so it is never half written."""
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as index_file:
+            json.dump(self._index, index_file)
+        os.replace(tmp_path, self.index_path)
+
+    @contextmanager
+    def _locked_index(self) -> Iterator[dict[str, list[dict[str, Any]]]]:
+        """Hold the index lock over a read-modify-write of the index, saved when the block exits cleanly."""
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # another process may have changed the index since it was last read
+                self._index = self._load_index()
+                yield self._index
+                self._save_index()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _series_key(sensor_id: int, step_ms: int) -> str:
+        return f"{sensor_id}:{step_ms}"
+
+    def _series_dir(self, sensor_id: int, step_ms: int) -> str:
+        return os.path.join(self.cache_dir, f"sensor_{sensor_id}_step_{step_ms}")
+
+    def missing_spans(self, sensor_id: int, step_ms: int, start_ms: int, end_ms: int) -> list[tuple[int, int]]:
+        """Parts of [start_ms, end_ms) not covered by any cached chunk."""
+        gaps: list[tuple[int, int]] = []
+        cursor = start_ms
+        for chunk in self._index.get(self._series_key(sensor_id, step_ms), []):
+            if chunk["end_ms"] <= cursor:
+                continue
+            if chunk["start_ms"] >= end_ms:
+                break
+            if chunk["start_ms"] > cursor:
+                gaps.append((cursor, chunk["start_ms"]))
+            cursor = max(cursor, chunk["end_ms"])
+        if cursor < end_ms:
+            gaps.append((cursor, end_ms))
+        return gaps
+
+    def store(self, sensor_id: int, step_ms: int, start_ms: int, end_ms: int, series_df: pd.DataFrame) -> None:
+        """Write a fetched span of one series to a chunk file of its own and index it.
+
+        Args:
+            sensor_id: sensor the series belongs to.
+            step_ms: resolution of the series.
+            start_ms: span start, epoch millis.
+            end_ms: span end, epoch millis.
+            series_df: 'time_ms' and 'value' columns covering the span, rows outside it are not stored.
+        """
+        if end_ms <= start_ms:
+            return
+        series_dir = self._series_dir(sensor_id, step_ms)
+        os.makedirs(series_dir, exist_ok=True)
+        chunk_file = f"{start_ms}_{end_ms}_{uuid.uuid4().hex[:8]}.parquet"
+        chunk_df = series_df[(series_df["time_ms"] >= start_ms) & (series_df["time_ms"] < end_ms)]
+        chunk_df.to_parquet(os.path.join(series_dir, chunk_file), engine="pyarrow", index=False, compression="snappy")
+
+        series_key = self._series_key(sensor_id, step_ms)
+        with self._locked_index() as index:
+            chunks = index.setdefault(series_key, [])
+            chunks.append({"start_ms": start_ms, "end_ms": end_ms, "file": chunk_file, "last_used": time.time()})
+            chunks.sort(key=lambda chunk: chunk["start_ms"])
+
+    def read(self, sensor_id: int, step_ms: int, start_ms: int, end_ms: int) -> pd.DataFrame:
+        """Read [start_ms, end_ms) of one series from the chunks that overlap it."""
+        series_dir = self._series_dir(sensor_id, step_ms)
+        chunk_dfs = []
+        for chunk in self._index.get(self._series_key(sensor_id, step_ms), []):
+            if chunk["start_ms"] >= end_ms or chunk["end_ms"] <= start_ms:
+                continue
+            try:
+                chunk_dfs.append(pd.read_parquet(
+                    os.path.join(series_dir, chunk["file"]), filters=[("time_ms", ">=", start_ms), ("time_ms", "<", end_ms)]
+                ))
+            except FileNotFoundError:
+                # evicted by another process since the index was read, the steps come back as NaN
+                continue
+        if not chunk_dfs:
+            return pd.DataFrame({"time_ms": pd.Series(dtype="int64"), "value": pd.Series(dtype="int64")})
+        return pd.concat(chunk_dfs, ignore_index=True).drop_duplicates(subset="time_ms", keep="last")
+
+    def touch(self, sensor_ids: list[int], step_ms: int, start_ms: int, end_ms: int) -> None:
+        """Mark the chunks of the sensors overlapping [start_ms, end_ms) as recently used."""
+        now = time.time()
+        with self._locked_index() as index:
+            for sensor_id in sensor_ids:
+                for chunk in index.get(self._series_key(sensor_id, step_ms), []):
+                    if chunk["start_ms"] < end_ms and chunk["end_ms"] > start_ms:
+                        chunk["last_used"] = now
+
+    def _cached_rows(self) -> int:
+        total_rows = 0
+        for series_key, chunks in self._index.items():
+            step_ms = int(series_key.split(":")[1])
+            total_rows += sum((chunk["end_ms"] - chunk["start_ms"]) // step_ms for chunk in chunks)
+        return total_rows
+
+    def evict(self) -> None:
+        """Drop least recently used chunks until the cache fits within max_rows."""
+        evicted: list[tuple[str, dict[str, Any]]] = []
+        with self._locked_index() as index:
+            while index and self._cached_rows() > self.max_rows:
+                series_key, chunk = min(
+                    ((series_key, chunk) for series_key, chunks in index.items() for chunk in chunks),
+                    key=lambda item: item[1]["last_used"],
+                )
+                index[series_key].remove(chunk)
+                if not index[series_key]:
+                    del index[series_key]
+                evicted.append((series_key, chunk))
+        # files go only once the saved index no longer refers to them
+        for series_key, chunk in evicted:
+            sensor_id, step_ms = (int(part) for part in series_key.split(":"))
+            try:
+                os.remove(os.path.join(self._series_dir(sensor_id, step_ms), chunk["file"]))
+            except FileNotFoundError:
+                pass
+            print(f"[HISTORY CACHE] Evicted {series_key} chunk {chunk['start_ms']}-{chunk['end_ms']}.")
+
+    async def get_history(
+        self,
+        sensor_list_response: SensorListAPIResponse,
+        start_ms: int,
+        end_ms: int,
+        step_ms: int,
+    ) -> SensorHistoryAPIResponse | None:
+        """Get history for the sensors, fetching only the gaps not already cached.
+
+        Args:
+            sensor_list_response: sensors to get a series for.
+            start_ms: range start, epoch millis.
+            end_ms: range end, epoch millis.
+            step_ms: resolution of the series.
+        Returns:
+            history over the range with one value per sensor, or None if a gap could not be fetched.
+        """
+        # align to the step grid so spans from different requests share timestamps
+        start_ms -= start_ms % step_ms
+        end_ms += -end_ms % step_ms
+
+        self._index = self._load_index()
+        # sensors missing the same gap are fetched together
+        sensor_ids_by_gap: dict[tuple[int, int], list[int]] = {}
+        for sensor in sensor_list_response.sensors:
+            for gap in self.missing_spans(sensor.id, step_ms, start_ms, end_ms):
+                sensor_ids_by_gap.setdefault(gap, []).append(sensor.id)
+
+        gaps = list(sensor_ids_by_gap)
+        gap_sensor_lists = [sensor_list_response.subset(sensor_ids_by_gap[gap]) for gap in gaps]
+        # one cap on the windows in flight across every gap, not one per gap
+        semaphore = asyncio.Semaphore(HISTORY_MAX_CONCURRENT_WINDOWS)
+        gap_responses = await asyncio.gather(*(
+            HistoryBackfill(
+                gap_sensor_list, start_ms=gap_start, end_ms=gap_end, step_ms=step_ms, checkpoint_dir=self.checkpoint_dir,
+            ).run(semaphore)
+            for gap_sensor_list, (gap_start, gap_end) in zip(gap_sensor_lists, gaps)
+        ))
+        # steps still in progress may get more readings, they are never recorded as cached
+        now_ms = int(time.time() * 1000)
+        complete_before_ms = now_ms - now_ms % step_ms
+        # everything just fetched is served from memory, including steps not cached yet
+        fetched_dfs: dict[int, list[pd.DataFrame]] = {}
+        for gap_sensor_list, (gap_start, gap_end), gap_response in zip(gap_sensor_lists, gaps, gap_responses):
+            if gap_response is None:
+                return None
+            time_ms, values = gap_response.to_arrays()
+            # only the part of the gap the api actually answered for counts as cached
+            cached_end = min(gap_end, int(time_ms[-1]) + step_ms if len(time_ms) else gap_start, complete_before_ms)
+            for i, sensor in enumerate(gap_sensor_list.sensors):
+                series_df = pd.DataFrame({"time_ms": time_ms, "value": values[:, i]})
+                self.store(sensor.id, step_ms, gap_start, cached_end, series_df)
+                fetched_dfs.setdefault(sensor.id, []).append(series_df)
+        print(f"[HISTORY CACHE] Fetched {len(gaps)} gaps, rest of {start_ms}-{end_ms} served from cache.")
+
+        # line the series back up on their shared step grid, a sensor without a reading at a step stays NaN
+        history_df = None
+        for i, sensor in enumerate(sensor_list_response.sensors):
+            series_df = pd.concat([self.read(sensor.id, step_ms, start_ms, end_ms), *fetched_dfs.get(sensor.id, [])])
+            series_df = series_df[(series_df["time_ms"] >= start_ms) & (series_df["time_ms"] < end_ms)]
+            series_df = series_df.drop_duplicates(subset="time_ms", keep="last").sort_values("time_ms")
+            series_df = series_df.rename(columns={"value": i}).set_index("time_ms")
+            history_df = series_df if history_df is None else history_df.join(series_df, how="outer")
+        self.touch([sensor.id for sensor in sensor_list_response.sensors], step_ms, start_ms, end_ms)
+        self.evict()
+        if history_df is None:
+            return SensorHistoryAPIResponse.from_arrays(np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.int64))
+        history_df = history_df.sort_index()
+        if not history_df.isna().to_numpy().any():
+            history_df = history_df.astype("int64")
+        return SensorHistoryAPIResponse.from_arrays(history_df.index.to_numpy(), history_df.to_numpy())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""This file holds the ingest index of the newest reading already stored per sensor."""
+from __future__ import annotations
+from src.constants import LOCAL_INGEST_INDEX_FILE
+import numpy as np
+import pandas as pd
+import json
+import os
+
+
+class IngestIndex:
+    """Last stored reading timestamp and value per sensor, persisted between runs.
+
+    Polls return a sensor's latest reading until it reports again, so most polled
+    readings were already stored. Checking them against the index drops those repeats
+    before anything is written. Sensors stored as change events also drop readings
+    that repeat the last known state.
+    """
+
+    def __init__(self, index_path: str = LOCAL_INGEST_INDEX_FILE) -> None:
+        """Load the index.
+
+        Args:
+            index_path: json file mapping sensor id to the epoch millis and value of its newest reading.
+        """
+        self.index_path = index_path
+        self._last_seen: dict[str, int] = {}
+        self._last_value: dict[str, float] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "r", encoding="utf-8") as index_file:
+            index = json.load(index_file)
+        # indexes written before values were tracked are a plain sensor id -> millis map
+        if "last_seen" not in index:
+            index = {"last_seen": index, "last_value": {}}
+        self._last_seen = index["last_seen"]
+        self._last_value = index["last_value"]
+
+    def save(self) -> None:
+        """Persist the index, written then renamed so it is never half written."""
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as index_file:
+            json.dump({"last_seen": self._last_seen, "last_value": self._last_value}, index_file)
+        os.replace(tmp_path, self.index_path)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self._last_seen
+
+    @staticmethod
+    def _epoch_millis(fact_df: pd.DataFrame) -> np.ndarray:
+        return pd.to_datetime(fact_df["ts"], utc=True).to_numpy(dtype="datetime64[ms]").astype(np.int64)
+
+    def filter_new(self, fact_df: pd.DataFrame) -> pd.DataFrame:
+        """Readings newer than the last stored one of their sensor, each (sensor, timestamp) once.
+
+        Args:
+            fact_df: readings with sensor_id and ts columns.
+        Returns:
+            the readings not stored yet.
+        """
+        last_seen = fact_df["sensor_id"].astype(str).map(self._last_seen).fillna(-1).to_numpy(dtype=np.int64)
+        new_df = fact_df[self._epoch_millis(fact_df) > last_seen]
+        return new_df.drop_duplicates(["sensor_id", "ts"], keep="last")
+
+    def drop_unchanged(self, fact_df: pd.DataFrame, event_sensor_ids: set[int]) -> pd.DataFrame:
+        """Keep only the state changes of sensors stored as change events, other readings pass through.
+
+        Call on readings from filter_new, before they are passed to advance.
+
+        Args:
+            fact_df: new readings with sensor_id, ts and value columns.
+            event_sensor_ids: sensors whose readings are stored as (ts, new state) events.
+        Returns:
+            the readings to store.
+        """
+        if fact_df.empty or not event_sensor_ids:
+            return fact_df
+        fact_df = fact_df.sort_values(["sensor_id", "ts"], kind="stable")
+        # the state before a sensor's first new reading is the last one indexed for it
+        previous = fact_df.groupby("sensor_id")["value"].shift()
+        previous = previous.fillna(fact_df["sensor_id"].astype(str).map(self._last_value))
+        changed = fact_df["value"].to_numpy() != previous.to_numpy(dtype=np.float64, na_value=np.nan)
+        return fact_df[changed | ~fact_df["sensor_id"].isin(event_sensor_ids).to_numpy()]
+
+    def advance(self, fact_df: pd.DataFrame) -> None:
+        """Record readings as seen, the index only ever moves forward."""
+        if fact_df.empty:
+            return
+        readings = pd.DataFrame({
+            "sensor_id": fact_df["sensor_id"].astype(str).to_numpy(),
+            "ts_ms": self._epoch_millis(fact_df),
+            "value": fact_df["value"].to_numpy(dtype=np.float64),
+        })
+        newest = readings.sort_values("ts_ms", kind="stable").groupby("sensor_id").last()
+        for sensor_id, ts_ms, value in zip(newest.index, newest["ts_ms"], newest["value"]):
+            if int(ts_ms) >= self._last_seen.get(sensor_id, -1):
+                self._last_seen[sensor_id] = int(ts_ms)
+                self._last_value[sensor_id] = float(value)
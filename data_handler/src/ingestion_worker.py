@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""Long-running ingestion worker, keeps the http pool and loaded state warm between jobs."""
+
+from __future__ import annotations
+import hmac
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from pydantic import BaseModel, Field
+from src.api_handler import URLRequestHandler
+from src.get_data_main import update_data_warehouse_from_latest, update_data_warehouse_from_time_range
+from src.history_cache import HistoryCache
+from src.data_store import PartitionedParquetStore
+from src.rollups import RollupStore
+from src.ingest_index import IngestIndex
+from src.metrics import metrics, log_event
+from src.constants import (
+    HISTORY_STEP_MS,
+    WORKER_HOST,
+    WORKER_PORT,
+    WORKER_TOKEN_LOCATION,
+    WORKER_POLL_INTERVAL_S,
+    WORKER_JOB_WAIT_TIMEOUT_S,
+    WORKER_MAX_FINISHED_JOBS,
+)
+
+
+class JobStatus:
+    QUEUED: str = "queued"
+    RUNNING: str = "running"
+    DONE: str = "done"
+    FAILED: str = "failed"
+
+
+class IngestionJob(BaseModel):
+    """One latest poll or time-range backfill submitted to the worker."""
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    kind: str
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    step_ms: int = HISTORY_STEP_MS
+    status: str = JobStatus.QUEUED
+    submitted_at: float = Field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    timings: dict[str, float] = {}
+    error: Optional[str] = None
+
+
+def load_worker_token(token_location: str = WORKER_TOKEN_LOCATION) -> str | None:
+    """Shared secret of the job endpoint, None if it was not set up."""
+    try:
+        with open(token_location, "r", encoding="ASCII") as token:
+            return token.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class IngestionWorker:
+    """Runs ingestion jobs one at a time on a single event loop.
+
+    Jobs come from the http endpoint or from the poll schedule. Running them in
+    order keeps two jobs from writing the same files at once.
+    """
+
+    def __init__(
+        self,
+        host: str = WORKER_HOST,
+        port: int = WORKER_PORT,
+        poll_interval_s: float = WORKER_POLL_INTERVAL_S,
+        token: str | None = None,
+    ) -> None:
+        """Configure the worker.
+
+        Args:
+            host: interface the job endpoint listens on.
+            port: port the job endpoint listens on.
+            poll_interval_s: seconds between scheduled latest polls, 0 disables the schedule.
+            token: secret job requests must send as a bearer token, read from WORKER_TOKEN_LOCATION if not given.
+        """
+        self.host = host
+        self.port = port
+        self.poll_interval_s = poll_interval_s
+        self.token = token if token is not None else load_worker_token()
+        self.history_cache = HistoryCache()
+        self.store = PartitionedParquetStore()
+        self.rollups = RollupStore()
+        self.ingest_index = IngestIndex()
+        self.jobs: dict[str, IngestionJob] = {}
+        self._job_done: dict[str, asyncio.Event] = {}
+        self._queue: asyncio.Queue[str] | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def submit(self, kind: str, start_time: str | None = None, end_time: str | None = None, step_ms: int = HISTORY_STEP_MS) -> IngestionJob:
+        """Queue a job, must be called on the worker's event loop."""
+        job = IngestionJob(kind=kind, start_time=start_time, end_time=end_time, step_ms=step_ms)
+        self.jobs[job.id] = job
+        self._job_done[job.id] = asyncio.Event()
+        await self._queue.put(job.id)
+        print(f"[WORKER] Queued {job.kind} job {job.id}.")
+        return job
+
+    async def wait(self, job_id: str, timeout: float = WORKER_JOB_WAIT_TIMEOUT_S) -> IngestionJob:
+        """Wait until the job finished, or the timeout passed."""
+        try:
+            await asyncio.wait_for(self._job_done[job_id].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.jobs[job_id]
+
+    def call_from_thread(self, coroutine: Any, timeout: float | None = None) -> Any:
+        """Run a coroutine on the worker's loop from an http handler thread."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout)
+
+    def _forget_finished_jobs(self) -> None:
+        finished = [job for job in self.jobs.values() if job.finished_at is not None]
+        for job in sorted(finished, key=lambda job: job.finished_at)[:-WORKER_MAX_FINISHED_JOBS]:
+            del self.jobs[job.id]
+            del self._job_done[job.id]
+
+    async def _run_jobs(self) -> None:
+        while True:
+            job = self.jobs[await self._queue.get()]
+            job.status = JobStatus.RUNNING
+            try:
+                if job.kind == "range":
+                    job.timings = await update_data_warehouse_from_time_range(
+                        job.start_time, job.end_time, job.step_ms, self.history_cache,
+                    )
+                else:
+                    job.timings = await update_data_warehouse_from_latest(
+                        self.store, self.rollups, ingest_index=self.ingest_index,
+                    )
+                job.status = JobStatus.DONE
+            except Exception as exc:  # keep the worker alive, the error is reported on the job
+                job.status = JobStatus.FAILED
+                job.error = str(exc)
+                print(f"[WORKER] Job {job.id} failed: {exc}")
+            job.finished_at = time.time()
+            self._job_done[job.id].set()
+            self._forget_finished_jobs()
+            metrics.count("ingestion_jobs", kind=job.kind, status=job.status)
+            log_event(
+                "ingestion_job", job_id=job.id, kind=job.kind, status=job.status, error=job.error,
+                seconds=round(job.finished_at - job.submitted_at, 6),
+                timings={stage: round(seconds, 6) for stage, seconds in job.timings.items()},
+            )
+
+    async def _poll_on_schedule(self) -> None:
+        while True:
+            # skip a tick rather than pile polls up behind a long backfill
+            if not any(job.kind == "latest" and job.finished_at is None for job in self.jobs.values()):
+                await self.submit("latest")
+            await asyncio.sleep(self.poll_interval_s)
+
+    async def serve(self) -> None:
+        """Serve the job endpoint and the poll schedule until cancelled."""
+        if not self.token:
+            raise RuntimeError(f"[WORKER] No job token at {WORKER_TOKEN_LOCATION}, refusing to serve jobs without one.")
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        http_server = ThreadingHTTPServer((self.host, self.port), _JobRequestHandler)
+        http_server.worker = self
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        print(f"[WORKER] Accepting jobs on http://{self.host}:{self.port}/jobs")
+
+        tasks = [asyncio.create_task(self._run_jobs())]
+        if self.poll_interval_s > 0:
+            tasks.append(asyncio.create_task(self._poll_on_schedule()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            http_server.shutdown()
+            await URLRequestHandler.close_session()
+
+
+class _JobRequestHandler(BaseHTTPRequestHandler):
+    """Json job endpoint: POST /jobs, GET /jobs/<id>, GET /health, plus GET /metrics in the Prometheus format.
+
+    The job routes require the worker's token as 'Authorization: Bearer <token>'.
+    """
+
+    def _authorized(self) -> bool:
+        worker: IngestionWorker = self.server.worker
+        supplied = self.headers.get("Authorization", "").encode()
+        return hmac.compare_digest(supplied, f"Bearer {worker.token}".encode())
+
+    def _send_json(self, status_code: int, body: dict[str, Any]) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        worker: IngestionWorker = self.server.worker
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            payload = metrics.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        elif self.path.startswith("/jobs/"):
+            if not self._authorized():
+                self._send_json(401, {"error": "missing or wrong token"})
+                return
+            job = worker.jobs.get(self.path.removeprefix("/jobs/"))
+            if job is None:
+                self._send_json(404, {"error": "unknown job"})
+            else:
+                self._send_json(200, job.model_dump())
+        else:
+            self._send_json(404, {"error": "unknown route"})
+
+    def do_POST(self) -> None:
+        worker: IngestionWorker = self.server.worker
+        if self.path != "/jobs":
+            self._send_json(404, {"error": "unknown route"})
+            return
+        if not self._authorized():
+            self._send_json(401, {"error": "missing or wrong token"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": "invalid json"})
+            return
+        if not isinstance(body, dict):
+            self._send_json(400, {"error": "body must be a json object"})
+            return
+
+        # a job with both times is a range backfill, anything else is a latest poll
+        start_time, end_time = body.get("start_time"), body.get("end_time")
+        if not all(isinstance(value, (str, type(None))) for value in (start_time, end_time)):
+            self._send_json(400, {"error": "start_time and end_time must be strings"})
+            return
+        try:
+            step_ms = int(body.get("step_ms", HISTORY_STEP_MS))
+        except (TypeError, ValueError):
+            step_ms = 0
+        if step_ms <= 0:
+            self._send_json(400, {"error": "step_ms must be a positive integer"})
+            return
+        kind = "range" if start_time and end_time else "latest"
+        job = worker.call_from_thread(worker.submit(kind, start_time, end_time, step_ms))
+        if body.get("wait"):
+            job = worker.call_from_thread(worker.wait(job.id))
+        self._send_json(202 if job.finished_at is None else 200, job.model_dump())
+
+    def log_message(self, format: str, *args: Any) -> None:
+        print(f"[WORKER] {self.address_string()} {format % args}")
+
+
+def main():
+    """Run the ingestion worker until interrupted."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default=WORKER_HOST)
+    parser.add_argument('--port', type=int, default=WORKER_PORT)
+    parser.add_argument('--poll-interval-s', type=float, default=WORKER_POLL_INTERVAL_S)
+    args = parser.parse_args()
+
+    worker = IngestionWorker(host=args.host, port=args.port, poll_interval_s=args.poll_interval_s)
+    try:
+        asyncio.run(worker.serve())
+    except KeyboardInterrupt:
+        print("[WORKER] Stopped.")
+
+
+if __name__ == "__main__":
+    """execute only if run as a script"""
+    main()
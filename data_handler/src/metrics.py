@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Process wide timers and counters, rendered in the Prometheus text format or logged as json lines."""
+from __future__ import annotations
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Iterator
+from src.constants import METRICS_NAMESPACE
+import json
+import threading
+import time
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Metrics:
+    """Summed timings and counters, keyed on a metric name and a few labels.
+
+    Recording is a dict update under a lock, cheap enough to leave on around every
+    request and stage. A timing keeps a count and a total, the scraper derives rates
+    and mean latencies from those.
+    """
+
+    def __init__(self, namespace: str = METRICS_NAMESPACE) -> None:
+        """Start with nothing recorded.
+
+        Args:
+            namespace: prefix of every exported metric name.
+        """
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._timings: dict[tuple[str, Labels], list[float]] = {}
+        self._counters: dict[tuple[str, Labels], float] = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict[str, Any]) -> tuple[str, Labels]:
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        """Record one timing of a stage, e.g. a fetch from one endpoint."""
+        key = self._key(name, labels)
+        with self._lock:
+            timing = self._timings.setdefault(key, [0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Time a block, recorded whether or not it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def count(self, name: str, amount: float = 1, **labels: Any) -> None:
+        """Add to a counter, e.g. bytes received or rows written."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def snapshot(self) -> dict[str, list[dict[str, Any]]]:
+        """Everything recorded so far as plain json-able data."""
+        with self._lock:
+            timings = {key: list(timing) for key, timing in self._timings.items()}
+            counters = dict(self._counters)
+        return {
+            "timings": [
+                {"name": name, "labels": dict(labels), "count": int(count), "seconds": round(total, 6)}
+                for (name, labels), (count, total) in sorted(timings.items())
+            ],
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(counters.items())
+            ],
+        }
+
+    def render_prometheus(self) -> str:
+        """Everything recorded so far in the Prometheus text exposition format.
+
+        Timings are summaries without quantiles (_count and _sum), counters end in _total.
+        """
+        with self._lock:
+            timings = sorted((key, list(timing)) for key, timing in self._timings.items())
+            counters = sorted(self._counters.items())
+        lines = []
+        previous_name = None
+        for (name, labels), (count, total) in timings:
+            metric = f"{self.namespace}_{name}_seconds"
+            if name != previous_name:
+                lines.append(f"# TYPE {metric} summary")
+                previous_name = name
+            lines.append(f"{metric}_count{_format_labels(labels)} {int(count)}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {total:.6f}")
+        previous_name = None
+        for (name, labels), value in counters:
+            metric = f"{self.namespace}_{name}_total"
+            if name != previous_name:
+                lines.append(f"# TYPE {metric} counter")
+                previous_name = name
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{label}="{_escape_label_value(value)}"' for label, value in labels) + "}"
+
+
+def log_event(event: str, **fields: Any) -> None:
+    """Write one json line for an event to stdout, next to the [TAG] prints."""
+    record = {"ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"), "event": event, **fields}
+    print(json.dumps(record, default=str), flush=True)
+
+
+# shared by everything in the process
+metrics = Metrics()
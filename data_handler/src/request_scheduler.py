@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""This file holds the rate limiter and batch scheduler used for fanning out sensor requests."""
+from __future__ import annotations
+from src.constants import SENSOR_BATCH_SIZE, SENSOR_MAX_CONCURRENCY
+from typing import Awaitable, Callable, TypeVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import asyncio
+import time
+
+T = TypeVar("T")
+
+
+# helper function to read the Retry-After header, either delay seconds or an http date
+def parse_retry_after(header_value: str | None, default: float) -> float:
+    """Convert a Retry-After header into a delay in seconds."""
+    if not header_value:
+        return default
+    try:
+        return max(0.0, float(header_value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(header_value)
+    except (TypeError, ValueError):
+        return default
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """Client side token bucket limiter, paused entirely while the api asks us to back off."""
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        """Start with a full bucket.
+
+        Args:
+            rate: tokens added per second.
+            capacity: maximum burst size.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+        # no awaits between the check and the take, so this is safe across tasks on one loop
+        while True:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                await asyncio.sleep(self._blocked_until - now)
+                continue
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, delay: float) -> None:
+        """Stop handing out tokens for delay seconds, e.g. after a 429 response."""
+        now = time.monotonic()
+        self._blocked_until = max(self._blocked_until, now + delay)
+        self._tokens = 0.0
+        self._updated = now
+
+
+class SensorRequestScheduler:
+    """Groups sensor ids into per-endpoint batches and runs them under a concurrency cap."""
+
+    def __init__(
+        self,
+        batch_size: int = SENSOR_BATCH_SIZE,
+        max_concurrency: int = SENSOR_MAX_CONCURRENCY,
+    ) -> None:
+        """Configure the scheduler.
+
+        Args:
+            batch_size: maximum sensor ids sent in one request.
+            max_concurrency: maximum batches in flight at once.
+        """
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+
+    def build_batches(self, sensor_endpoints: list[str], sensor_ids: list[int]) -> list[tuple[str, list[int]]]:
+        """Group sensor ids by endpoint and split each group into batches.
+
+        Args:
+            sensor_endpoints: endpoint for each sensor, e.g. 'door'.
+            sensor_ids: sensor id matching each endpoint.
+        Returns:
+            list of (endpoint, sensor ids) batches.
+        """
+        grouped_ids: dict[str, list[int]] = {}
+        for sensor_endpoint, sensor_id in zip(sensor_endpoints, sensor_ids):
+            grouped_ids.setdefault(sensor_endpoint, []).append(sensor_id)
+
+        batches: list[tuple[str, list[int]]] = []
+        for sensor_endpoint, ids in grouped_ids.items():
+            for i in range(0, len(ids), self.batch_size):
+                batches.append((sensor_endpoint, ids[i:i + self.batch_size]))
+        return batches
+
+    async def run(
+        self,
+        batches: list[tuple[str, list[int]]],
+        fetch_batch: Callable[[str, list[int]], Awaitable[T]],
+    ) -> list[T]:
+        """Run every batch concurrently, at most max_concurrency at a time.
+
+        Args:
+            batches: output of build_batches.
+            fetch_batch: coroutine function sending one batch request.
+        Returns:
+            results in the same order as batches.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def _bounded_fetch(sensor_endpoint: str, ids: list[int]) -> T:
+            async with semaphore:
+                return await fetch_batch(sensor_endpoint, ids)
+
+        return await asyncio.gather(*(_bounded_fetch(endpoint, ids) for endpoint, ids in batches))
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""This file holds the incrementally maintained hourly and daily rollups of the polled data."""
+from __future__ import annotations
+from src.constants import LOCAL_ROLLUP_DIR, ROLLUP_TIERS, ROLLUP_PARTITION_FORMATS, SensorKinds
+from src.data_store import bump_generation
+from src.metrics import metrics
+from typing import Any
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import json
+import os
+import shutil
+
+# rollup table layout, one row per vehicle and bucket
+ROLLUP_KEYS = ["vehicle", "bucket_start_ms"]
+ROLLUP_SCHEMA = pa.schema([
+    ("vehicle", pa.string()),
+    ("bucket_start_ms", pa.int64()),
+    ("temp_min", pa.float64()),
+    ("temp_max", pa.float64()),
+    ("temp_sum", pa.float64()),
+    ("temp_count", pa.int64()),
+    ("temp_mean", pa.float64()),
+    ("door_open_count", pa.int64()),
+    ("door_open_ms", pa.int64()),
+    ("door_observed_ms", pa.int64()),
+])
+# how partial aggregates of the same bucket combine
+_MERGE_AGGREGATIONS = {
+    "temp_min": "min",
+    "temp_max": "max",
+    "temp_sum": "sum",
+    "temp_count": "sum",
+    "door_open_count": "sum",
+    "door_open_ms": "sum",
+    "door_observed_ms": "sum",
+}
+
+
+def _to_epoch_ms(timestamps: pd.Series) -> np.ndarray:
+    """Stored timestamps, strings or datetimes, as UTC epoch milliseconds."""
+    return pd.to_datetime(timestamps, utc=True).to_numpy(dtype="datetime64[ms]").astype(np.int64)
+
+def split_intervals(starts_ms: np.ndarray, ends_ms: np.ndarray, bucket_ms: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Cut [start, end) intervals at bucket boundaries.
+
+    Returns:
+        (index of the source interval, bucket start, milliseconds inside that bucket) per piece.
+    """
+    first_bucket = starts_ms // bucket_ms
+    last_bucket = (ends_ms - 1) // bucket_ms
+    num_pieces = np.maximum(last_bucket - first_bucket + 1, 0)
+    source = np.repeat(np.arange(len(starts_ms)), num_pieces)
+    # offset of each piece within its interval, 0..num_pieces-1
+    piece_offsets = np.arange(num_pieces.sum()) - np.repeat(np.cumsum(num_pieces) - num_pieces, num_pieces)
+    bucket_starts = (first_bucket[source] + piece_offsets) * bucket_ms
+    piece_ms = np.minimum(ends_ms[source], bucket_starts + bucket_ms) - np.maximum(starts_ms[source], bucket_starts)
+    return source, bucket_starts, piece_ms
+
+
+class RollupStore:
+    """Hourly and daily rollups per vehicle, updated from each batch of new readings only.
+
+    Temperature keeps min, max, sum, count and mean per bucket. Door state keeps how
+    often a door opened and how long it was open, out of how long its state was known,
+    summed over the vehicle's door sensors. Door readings are 'doorClosed' values, so 0
+    means open. The interval after a sensor's latest door reading is only counted once the
+    next reading arrives, the latest reading of each sensor is kept in a small state file
+    between updates.
+
+    Only the readings of the raw store are rolled up. Ranges ingested on request go to the
+    history file instead: they overlap readings already polled, which the bucket sums would
+    count twice, and predate the state the updates continue from. The coverage file says
+    from when the tiers hold every raw reading, the server serves earlier windows raw.
+
+    Each tier is a directory with one file per partition of bucket starts, see
+    ROLLUP_PARTITION_FORMATS, so an update only rewrites the partitions it adds to.
+    """
+
+    def __init__(
+        self,
+        rollup_dir: str = LOCAL_ROLLUP_DIR,
+        tiers: dict[str, int] = ROLLUP_TIERS,
+        partition_formats: dict[str, str] = ROLLUP_PARTITION_FORMATS,
+    ) -> None:
+        """Load the rollup state.
+
+        Args:
+            rollup_dir: directory holding one directory per tier, the state and the coverage file.
+            tiers: tier name -> bucket width in milliseconds.
+            partition_formats: tier name -> strftime format of the bucket starts sharing a file.
+        """
+        self.rollup_dir = rollup_dir
+        self.tiers = tiers
+        self.partition_formats = partition_formats
+        self.state_path = os.path.join(rollup_dir, "state.json")
+        self.coverage_path = os.path.join(rollup_dir, "coverage.json")
+        os.makedirs(rollup_dir, exist_ok=True)
+        self._state: dict[str, dict[str, Any]] = self._load_state()
+
+    def tier_path(self, tier: str) -> str:
+        return os.path.join(self.rollup_dir, tier)
+
+    @property
+    def covers_from_ms(self) -> int | None:
+        """Epoch millis from which every raw reading is rolled up, None before the first update."""
+        if not os.path.exists(self.coverage_path):
+            return None
+        with open(self.coverage_path, "r", encoding="utf-8") as coverage_file:
+            return json.load(coverage_file)["from_ms"]
+
+    def _save_coverage(self, from_ms: int) -> None:
+        tmp_path = f"{self.coverage_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as coverage_file:
+            json.dump({"from_ms": from_ms}, coverage_file)
+        os.replace(tmp_path, self.coverage_path)
+
+    def _load_state(self) -> dict[str, dict[str, Any]]:
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, "r", encoding="utf-8") as state_file:
+            return json.load(state_file)
+
+    def _save_state(self) -> None:
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as state_file:
+            json.dump(self._state, state_file)
+        os.replace(tmp_path, self.state_path)
+
+    def _new_readings(self, readings: pd.DataFrame, sensor_kind: str) -> pd.DataFrame:
+        """Readings of one kind newer than the last one rolled up for their sensor.
+
+        Polls repeat a sensor's latest reading until it reports again, those repeats are dropped here.
+        """
+        readings = readings[readings["kind"] == sensor_kind].drop(columns="kind")
+        # typed explicitly, mapping an empty string column would keep its string dtype
+        last_seen = readings["sensor"].map(lambda sensor_id: self._state.get(sensor_id, {}).get("ts_ms", -1)).to_numpy(dtype=np.int64)
+        readings = readings[readings["ts_ms"].to_numpy() > last_seen]
+        return readings.drop_duplicates(["sensor", "ts_ms"]).sort_values(["sensor", "ts_ms"], kind="stable")
+
+    @staticmethod
+    def _temperature_partials(temp_readings: pd.DataFrame, bucket_ms: int) -> pd.DataFrame:
+        buckets = temp_readings.assign(bucket_start_ms=temp_readings["ts_ms"] // bucket_ms * bucket_ms)
+        return buckets.groupby(ROLLUP_KEYS).agg(
+            temp_min=("value", "min"),
+            temp_max=("value", "max"),
+            temp_sum=("value", "sum"),
+            temp_count=("value", "count"),
+        ).reset_index()
+
+    def _door_intervals(self, door_readings: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Intervals between consecutive readings of a door sensor and the readings where the door opened.
+
+        Each sensor's last rolled up reading is carried over so its interval is closed by the first new reading.
+        """
+        vehicle_by_sensor = dict(zip(door_readings["sensor"], door_readings["vehicle"]))
+        carried = pd.DataFrame([
+            {"sensor": sensor_id, "vehicle": vehicle_by_sensor[sensor_id], "ts_ms": state["ts_ms"], "value": state["value"]}
+            for sensor_id, state in self._state.items()
+            if "value" in state and sensor_id in vehicle_by_sensor
+        ], columns=["sensor", "vehicle", "ts_ms", "value"])
+        readings = pd.concat(
+            [carried.assign(carried=True), door_readings.assign(carried=False)], ignore_index=True,
+        ).sort_values(["sensor", "ts_ms"], kind="stable")
+        sensors = readings["sensor"].to_numpy()
+        vehicles = readings["vehicle"].to_numpy()
+        timestamps = readings["ts_ms"].to_numpy(dtype=np.int64)
+        is_open = readings["value"].to_numpy() == 0
+        # an interval runs from a reading to the next reading of the same sensor
+        same_sensor = sensors[1:] == sensors[:-1]
+        # the door opened on an open reading following a closed one or starting the sensor's readings,
+        # carried over readings were already counted when they arrived
+        follows_closed = np.concatenate([[True], ~same_sensor | ~is_open[:-1]])
+        opened = is_open & follows_closed & ~readings["carried"].to_numpy(dtype=bool)
+        intervals = pd.DataFrame({
+            "vehicle": vehicles[:-1][same_sensor],
+            "start_ms": timestamps[:-1][same_sensor],
+            "end_ms": timestamps[1:][same_sensor],
+            "is_open": is_open[:-1][same_sensor],
+        })
+        openings = pd.DataFrame({"vehicle": vehicles[opened], "ts_ms": timestamps[opened]})
+        return intervals, openings
+
+    @staticmethod
+    def _door_partials(intervals: pd.DataFrame, openings: pd.DataFrame, bucket_ms: int) -> pd.DataFrame:
+        source, bucket_starts, piece_ms = split_intervals(
+            intervals["start_ms"].to_numpy(), intervals["end_ms"].to_numpy(), bucket_ms,
+        )
+        pieces = pd.DataFrame({
+            "vehicle": intervals["vehicle"].to_numpy()[source],
+            "bucket_start_ms": bucket_starts,
+            "door_open_ms": np.where(intervals["is_open"].to_numpy()[source], piece_ms, 0),
+            "door_observed_ms": piece_ms,
+        })
+        durations = pieces.groupby(ROLLUP_KEYS)[["door_open_ms", "door_observed_ms"]].sum()
+        counts = openings.assign(bucket_start_ms=openings["ts_ms"] // bucket_ms * bucket_ms).groupby(ROLLUP_KEYS).size()
+        return durations.join(counts.rename("door_open_count"), how="outer").reset_index()
+
+    def _merge_tier(self, tier: str, partials: pd.DataFrame) -> None:
+        """Combine new partial aggregates with the stored ones of the same buckets, partition by partition."""
+        tier_dir = self.tier_path(tier)
+        os.makedirs(tier_dir, exist_ok=True)
+        partition_keys = pd.to_datetime(partials["bucket_start_ms"], unit="ms", utc=True).dt.strftime(self.partition_formats[tier])
+        for partition_key, partition_partials in partials.groupby(partition_keys.to_numpy()):
+            partition_path = os.path.join(tier_dir, f"{partition_key}.parquet")
+            if os.path.exists(partition_path):
+                partition_partials = pd.concat([pd.read_parquet(partition_path), partition_partials], ignore_index=True)
+            merged = partition_partials.groupby(ROLLUP_KEYS).agg(
+                {column: aggregation for column, aggregation in _MERGE_AGGREGATIONS.items() if column in partition_partials.columns}
+            ).reset_index()
+            for column in ["temp_count", "door_open_count", "door_open_ms", "door_observed_ms"]:
+                merged[column] = merged[column].fillna(0).astype(np.int64) if column in merged.columns else 0
+            merged["temp_mean"] = merged["temp_sum"] / merged["temp_count"].replace(0, np.nan)
+            table = pa.Table.from_pandas(merged.sort_values(ROLLUP_KEYS), schema=ROLLUP_SCHEMA, preserve_index=False)
+            tmp_path = os.path.join(tier_dir, f"_{partition_key}.parquet")
+            with metrics.timer("parquet_write", target=f"rollup_{tier}"):
+                pq.write_table(table, tmp_path, compression="snappy", write_statistics=True)
+            metrics.count("rows_written", table.num_rows, target=f"rollup_{tier}")
+            os.replace(tmp_path, partition_path)
+        bump_generation(tier_dir)
+
+    def update(self, fact_df: pd.DataFrame, sensor_df: pd.DataFrame) -> int:
+        """Fold newly stored readings into every tier.
+
+        Args:
+            fact_df: sensor_id, ts and value of the readings just appended to the raw store.
+            sensor_df: sensor dimension, gives each reading its vehicle and kind.
+        Returns:
+            number of new readings rolled up.
+        """
+        readings = fact_df[["sensor_id", "ts", "value"]].merge(sensor_df[["sensor_id", "vehicle_id", "kind"]], on="sensor_id")
+        readings = pd.DataFrame({
+            "sensor": readings["sensor_id"].astype(str).to_numpy(),
+            "vehicle": readings["vehicle_id"].astype(str).to_numpy(),
+            "kind": readings["kind"].to_numpy(),
+            "ts_ms": _to_epoch_ms(readings["ts"]),
+            "value": pd.to_numeric(readings["value"], errors="coerce").to_numpy(dtype=np.float64),
+        }).dropna()
+        temp_readings = self._new_readings(readings, SensorKinds.TEMPERATURE)
+        door_readings = self._new_readings(readings, SensorKinds.DOOR)
+        if temp_readings.empty and door_readings.empty:
+            return 0
+
+        covers_from_ms = self.covers_from_ms
+        intervals, openings = self._door_intervals(door_readings)
+        for tier, bucket_ms in self.tiers.items():
+            partials = pd.merge(
+                self._temperature_partials(temp_readings, bucket_ms),
+                self._door_partials(intervals, openings, bucket_ms),
+                on=ROLLUP_KEYS,
+                how="outer",
+            )
+            self._merge_tier(tier, partials)
+
+        # remember each sensor's newest reading, the next update continues from it
+        for sensor_id, last_temp_ms in temp_readings.groupby("sensor")["ts_ms"].max().items():
+            self._state[sensor_id] = {"ts_ms": int(last_temp_ms)}
+        for sensor_id, last_door in door_readings.groupby("sensor").tail(1).set_index("sensor").iterrows():
+            self._state[sensor_id] = {"ts_ms": int(last_door["ts_ms"]), "value": float(last_door["value"])}
+        self._save_state()
+        # written after the tiers, a reader never sees coverage the files do not have yet
+        if covers_from_ms is None:
+            self._save_coverage(int(min(readings["ts_ms"].min() for readings in [temp_readings, door_readings] if not readings.empty)))
+        num_readings = len(temp_readings) + len(door_readings)
+        print(f"[ROLLUPS] Rolled up {num_readings} new readings into {', '.join(self.tiers)}.")
+        return num_readings
+
+    def rebuild(self, fact_df: pd.DataFrame, sensor_df: pd.DataFrame) -> int:
+        """Drop every tier and the state, then roll up all of the given readings.
+
+        Args:
+            fact_df: every reading of the raw store, the tiers then cover all of it.
+            sensor_df: sensor dimension, gives each reading its vehicle and kind.
+        Returns:
+            number of readings rolled up.
+        """
+        # raw until the tiers are complete again
+        if os.path.exists(self.coverage_path):
+            os.remove(self.coverage_path)
+        for tier in self.tiers:
+            shutil.rmtree(self.tier_path(tier), ignore_errors=True)
+        self._state = {}
+        num_readings = self.update(fact_df, sensor_df)
+        self._save_coverage(0)
+        return num_readings
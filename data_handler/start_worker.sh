@@ -0,0 +1,65 @@
+#!/bin/bash
+
+# Variable definitions
+IMAGE_NAME="data-handler-demo"
+CONTAINER_NAME="data-handler-worker"
+TAG="v3"
+# private network shared with the server container, the job port is not published on the host
+NETWORK_NAME="${NETWORK_NAME:-samsara-demo}"
+POLL_INTERVAL_S="${POLL_INTERVAL_S:-60}"
+HOST_BASE_DIR="${1:-$(pwd)/..}"
+
+# api to ingest from, override to point at a local mock server
+SAMSARA_BASE_URL="${SAMSARA_BASE_URL:-https://api.samsara.com}"
+
+# api token configuration
+HOST_SECRET_FILE="$HOST_BASE_DIR/data_handler/secrets/api_token.txt"
+CONTAINER_SECRET_FILE=/data_handler/secrets/api_token.txt
+# shared secret the server sends with every job request, the server reads it from the mounted data_handler directory
+HOST_WORKER_TOKEN_FILE="$HOST_BASE_DIR/data_handler/secrets/worker_token.txt"
+CONTAINER_WORKER_TOKEN_FILE=/data_handler/secrets/worker_token.txt
+
+cd "$(dirname "$0")"
+
+# create the job token once
+if [ ! -s "$HOST_WORKER_TOKEN_FILE" ]; then
+    echo "[BUILD] Creating worker token $HOST_WORKER_TOKEN_FILE..."
+    mkdir -p "$(dirname "$HOST_WORKER_TOKEN_FILE")"
+    (umask 077 && od -An -tx1 -N32 /dev/urandom | tr -d ' \n' > "$HOST_WORKER_TOKEN_FILE")
+fi
+docker network create "$NETWORK_NAME" 2> /dev/null
+
+# Remove old worker if present
+echo "[BUILD] Cleaning up $CONTAINER_NAME (Image: $IMAGE_NAME:$TAG)..."
+docker stop $CONTAINER_NAME 2> /dev/null
+docker rm $CONTAINER_NAME 2> /dev/null
+
+# Build the docker image once, jobs then run inside the long-lived container
+echo "[BUILD] Building new image: $IMAGE_NAME:$TAG"
+docker build -t "$IMAGE_NAME:$TAG" .
+
+# Verify build was successful
+if [ $? -ne 0 ]; then
+    echo "[BUILD] BUILD FAILED: EXITING"
+    exit 1
+fi
+
+# run the worker - serves ingestion jobs on port 8081 of the docker network and polls on a schedule
+echo "[RUN] Starting data handler worker $CONTAINER_NAME on network $NETWORK_NAME..."
+docker run \
+    -d \
+    --restart unless-stopped \
+    --name "$CONTAINER_NAME" \
+    --network "$NETWORK_NAME" \
+    -v "$HOST_SECRET_FILE:$CONTAINER_SECRET_FILE:ro" \
+    -v "$HOST_WORKER_TOKEN_FILE:$CONTAINER_WORKER_TOKEN_FILE:ro" \
+    -e SAMSARA_BASE_URL="$SAMSARA_BASE_URL" \
+    -v "$HOST_BASE_DIR/data:/data_handler/data" \
+    --entrypoint "python3" \
+    "$IMAGE_NAME:$TAG" \
+    /data_handler/src/ingestion_worker.py \
+    --host 0.0.0.0 \
+    --port 8081 \
+    --poll-interval-s "$POLL_INTERVAL_S"
+
+echo "[BUILD] Worker started."
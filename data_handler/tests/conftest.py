@@ -0,0 +1,6 @@
+"""Make the handler importable as in its container, both as src.<module> and as bare <module>."""
+import os
+import sys
+
+HANDLER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [HANDLER_DIR, os.path.join(HANDLER_DIR, "src")]
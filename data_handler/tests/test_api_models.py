@@ -0,0 +1,28 @@
+"""Latest reading responses decode their times to epoch millis, like the history timeMs."""
+import json
+from src.api_handler import DoorSensorAPIResponse, TemperatureSensorAPIResponse
+
+
+def test_reading_times_decode_to_utc_epoch_millis():
+    temperature_body = json.dumps({"groupId": 1, "sensors": [{
+        "id": 101, "name": "W7NP-RJ8-6VE", "vehicleId": 10,
+        "ambientTemperature": 21500, "ambientTemperatureTime": "2026-10-17T01:02:03.456Z",
+    }]})
+    door_body = json.dumps({"groupId": 1, "sensors": [{
+        "id": 102, "name": "WM5D-K78-KN7", "vehicleId": 10,
+        "doorClosed": True, "doorStatusTime": "2026-10-17T03:02:03.456+02:00",
+    }]})
+
+    temperature = TemperatureSensorAPIResponse.from_json(temperature_body).sensors[0]
+    door = DoorSensorAPIResponse.from_json(door_body).sensors[0]
+    assert temperature.ambient_temperature_time_ms == 1_792_198_923_456
+    # an offset is applied, the same instant as the temperature reading
+    assert door.door_status_time_ms == 1_792_198_923_456
+
+
+def test_reading_times_keep_epoch_millis_and_read_naive_times_as_utc():
+    sensor = {"id": 101, "name": "W7NP-RJ8-6VE", "vehicleId": 10, "ambientTemperature": 21500}
+    from_millis = TemperatureSensorAPIResponse.from_json({"groupId": 1, "sensors": [{**sensor, "ambientTemperatureTime": 1_792_198_923_456}]})
+    from_naive = TemperatureSensorAPIResponse.from_json({"groupId": 1, "sensors": [{**sensor, "ambientTemperatureTime": "2026-10-17T01:02:03.456"}]})
+    assert from_millis.sensors[0].ambient_temperature_time_ms == 1_792_198_923_456
+    assert from_naive.sensors[0].ambient_temperature_time_ms == 1_792_198_923_456
@@ -0,0 +1,61 @@
+"""Appends and compaction of the partitioned parquet store."""
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+from src.data_store import PartitionedParquetStore
+
+
+def _readings(vehicle_ids: list[int], sensor_id: int, times: list[str], value: float = 1.0) -> pd.DataFrame:
+    return pd.DataFrame({
+        "vehicle_id": vehicle_ids,
+        "sensor_id": sensor_id,
+        "ts": pd.to_datetime(times, utc=True),
+        "value": value,
+    })
+
+
+def _sorted_rows(readings_df: pd.DataFrame) -> list[tuple]:
+    readings_df = readings_df.sort_values(["sensor_id", "ts"])
+    return list(zip(readings_df["sensor_id"], readings_df["ts"].dt.as_unit("ms").astype("int64"), readings_df["value"]))
+
+
+def test_append_files_readings_by_their_own_date_and_vehicle(tmp_path):
+    store = PartitionedParquetStore(str(tmp_path))
+    readings_df = _readings([10, 10, 11], 1, ["2026-10-16 23:59", "2026-10-17 00:01", "2026-10-17 00:02"])
+    written_paths = store.append(readings_df)
+
+    partitions = sorted(os.path.relpath(os.path.dirname(path), tmp_path) for path in written_paths)
+    assert partitions == ["date=2026-10-16/vehicle=10", "date=2026-10-17/vehicle=10", "date=2026-10-17/vehicle=11"]
+    # the vehicle lives in the path, files only hold the fact columns
+    assert pq.read_schema(written_paths[0]).names == ["sensor_id", "ts", "value"]
+    assert _sorted_rows(store.read_all()) == _sorted_rows(readings_df)
+
+
+def test_append_of_a_named_batch_replaces_its_earlier_files(tmp_path):
+    store = PartitionedParquetStore(str(tmp_path))
+    store.append(_readings([10], 1, ["2026-10-17 00:01"], value=1.0), batch_name="legacy-import")
+    store.append(_readings([10], 1, ["2026-10-17 00:01"], value=2.0), batch_name="legacy-import")
+    assert store.read_all()["value"].tolist() == [2.0]
+
+
+def test_compact_merges_small_files_and_keeps_every_reading(tmp_path):
+    store = PartitionedParquetStore(str(tmp_path), compaction_min_files=3, small_file_rows=100)
+    store.append(_readings([10], 1, ["2026-10-17 00:03"]))
+    store.append(_readings([10], 1, ["2026-10-17 00:01"]))
+    # too few small files, left alone
+    assert store.compact() == 0
+    store.append(_readings([10, 10], 2, ["2026-10-17 00:02", "2026-10-17 00:00"]))
+    before_df = store.read_all()
+    generation_before = (tmp_path / "_generation").read_text()
+
+    assert store.compact() == 3
+    partition_dir = tmp_path / "date=2026-10-17" / "vehicle=10"
+    file_names = os.listdir(partition_dir)
+    assert len(file_names) == 1 and file_names[0].startswith("compacted-")
+    assert _sorted_rows(store.read_all()) == _sorted_rows(before_df)
+    # rows are time ordered within the compacted file so row groups prune well
+    compacted_df = pq.read_table(partition_dir / file_names[0]).to_pandas()
+    assert compacted_df["ts"].is_monotonic_increasing
+    assert compacted_df["sensor_id"].tolist() == [2, 1, 2, 1]
+    # readers see the dataset changed
+    assert (tmp_path / "_generation").read_text() != generation_before
@@ -0,0 +1,53 @@
+"""Chunk files and the shared interval index of the history cache."""
+import os
+import pandas as pd
+from src.history_cache import HistoryCache
+
+STEP_MS = 1000
+
+
+def _series(start_ms: int, end_ms: int) -> pd.DataFrame:
+    time_ms = list(range(start_ms, end_ms, STEP_MS))
+    return pd.DataFrame({"time_ms": time_ms, "value": [t // STEP_MS for t in time_ms]})
+
+
+def _chunk_files(cache: HistoryCache, sensor_id: int) -> list[str]:
+    return sorted(os.listdir(cache._series_dir(sensor_id, STEP_MS)))
+
+
+def test_each_span_gets_its_own_chunk_file(tmp_path):
+    cache = HistoryCache(cache_dir=str(tmp_path))
+    cache.store(1, STEP_MS, 0, 5000, _series(0, 6000))
+    first_files = _chunk_files(cache, 1)
+    cache.store(1, STEP_MS, 5000, 10000, _series(5000, 10000))
+
+    # the first chunk is left alone, and only holds rows of its own span
+    assert set(first_files) < set(_chunk_files(cache, 1))
+    assert len(_chunk_files(cache, 1)) == 2
+    assert cache.missing_spans(1, STEP_MS, 0, 12000) == [(10000, 12000)]
+    assert cache.read(1, STEP_MS, 0, 10000)["time_ms"].tolist() == list(range(0, 10000, STEP_MS))
+
+
+def test_stores_from_separate_instances_keep_every_index_entry(tmp_path):
+    worker_cache = HistoryCache(cache_dir=str(tmp_path))
+    range_cache = HistoryCache(cache_dir=str(tmp_path))
+    worker_cache.store(1, STEP_MS, 0, 5000, _series(0, 5000))
+    # range_cache loaded the index before the store above, its store must not drop that entry
+    range_cache.store(2, STEP_MS, 0, 5000, _series(0, 5000))
+
+    reloaded = HistoryCache(cache_dir=str(tmp_path))
+    assert reloaded.missing_spans(1, STEP_MS, 0, 5000) == []
+    assert reloaded.missing_spans(2, STEP_MS, 0, 5000) == []
+
+
+def test_evict_drops_least_recently_used_chunks_from_index_and_disk(tmp_path):
+    cache = HistoryCache(cache_dir=str(tmp_path), max_rows=5)
+    cache.store(1, STEP_MS, 0, 5000, _series(0, 5000))
+    cache.store(1, STEP_MS, 5000, 10000, _series(5000, 10000))
+    cache.touch([1], STEP_MS, 5000, 10000)
+    cache.evict()
+
+    reloaded = HistoryCache(cache_dir=str(tmp_path))
+    assert reloaded.missing_spans(1, STEP_MS, 0, 10000) == [(0, 5000)]
+    assert len(_chunk_files(reloaded, 1)) == 1
+    assert reloaded.read(1, STEP_MS, 0, 10000)["time_ms"].tolist() == list(range(5000, 10000, STEP_MS))
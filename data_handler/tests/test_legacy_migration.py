@@ -0,0 +1,99 @@
+"""Migration of the single-file store the handler wrote before the partitioned one."""
+import os
+import pandas as pd
+import pytest
+from src.data_store import PartitionedParquetStore
+from src.dimensions import VehicleDimension, SensorDimension
+from src.get_data_main import migrate_legacy_store
+from src.rollups import RollupStore
+
+GATEWAY_SN = "GW-1"
+
+
+def _legacy_poll(timestamp: str, temperature: float, door_closed: bool) -> pd.DataFrame:
+    """One wide row as the old convert_data_model_to_timeseries built it, sensor details as one-element tuples."""
+    vehicle_df = pd.DataFrame([{"Make": "Ford", "Model": "Transit", "Year": "2020", "Gateway SN": GATEWAY_SN}])
+    sensor_df = pd.DataFrame([{
+        "Sensor 0 ID": (101,), "Sensor 0 Name": ("W7NP-RJ8-6VE",), "Sensor 0 MAC": ("aa:bb",), "Sensor 0 Type": ("Temperature",),
+        "Ambient Temp.": temperature, "Ambient Temp. Timestamp": timestamp,
+        "Sensor 1 ID": (102,), "Sensor 1 Name": ("WM5D-K78-KN7",), "Sensor 1 MAC": ("cc:dd",), "Sensor 1 Type": ("Door",),
+        "Door State": door_closed, "Door State Timestamp": timestamp,
+    }])
+    return pd.concat([vehicle_df, sensor_df], axis=1)
+
+
+def _write_legacy_file(path: str, polls: list[pd.DataFrame]) -> None:
+    """Write polls the way the old update_data_warehouse did, reading back and rewriting the file each time."""
+    for poll_df in polls:
+        if not os.path.exists(path):
+            poll_df.to_parquet(path, engine="pyarrow", index=True, compression="snappy")
+            continue
+        stored_df = pd.read_parquet(path, dtype_backend="pyarrow")
+        merged_df = pd.concat([stored_df, poll_df]).sort_index()
+        for col in merged_df.select_dtypes(include=["object"]).columns:
+            merged_df[col] = merged_df[col].astype(str)
+        merged_df.to_parquet(path, engine="pyarrow", index=True, compression="snappy")
+
+
+@pytest.fixture
+def stores(tmp_path):
+    vehicle_dimension = VehicleDimension(str(tmp_path / "vehicles.parquet"))
+    vehicle_dimension.upsert(pd.DataFrame({
+        "vehicle_id": ["v1"], "name": ["van"], "make": ["Ford"], "model": ["Transit"], "year": ["2020"], "gateway_sn": [GATEWAY_SN],
+    }))
+    return (
+        PartitionedParquetStore(str(tmp_path / "sensor_data")),
+        RollupStore(str(tmp_path / "rollups")),
+        vehicle_dimension,
+        SensorDimension(str(tmp_path / "sensors.parquet")),
+    )
+
+
+def test_legacy_file_is_moved_into_the_store(tmp_path, stores):
+    store, rollups, vehicle_dimension, sensor_dimension = stores
+    legacy_path = str(tmp_path / "sensor_data.parquet")
+    _write_legacy_file(legacy_path, [
+        _legacy_poll("2025-01-01 23:58", 40.1, True),
+        _legacy_poll("2025-01-01 23:59", 40.5, True),
+        _legacy_poll("2025-01-02 00:00", 41.0, False),
+    ])
+
+    num_moved = migrate_legacy_store(store, rollups, vehicle_dimension, sensor_dimension, legacy_path)
+
+    stored_df = store.read_all().sort_values(["sensor_id", "ts"]).reset_index(drop=True)
+    temperature_df = stored_df[stored_df["sensor_id"] == 101]
+    door_df = stored_df[stored_df["sensor_id"] == 102]
+    assert temperature_df["value"].tolist() == [40.1, 40.5, 41.0]
+    # the repeated closed state of the second poll is not a change
+    assert door_df["value"].tolist() == [1.0, 0.0]
+    assert num_moved == len(stored_df) == 5
+    # filed under the date each reading was taken
+    assert sorted(os.listdir(store.root_dir)) == ["_generation", "date=2025-01-01", "date=2025-01-02"]
+    assert sensor_dimension.kinds() == {101: "temperature", 102: "door"}
+    assert not os.path.exists(legacy_path)
+    assert os.path.exists(f"{legacy_path}.migrated")
+
+
+def test_rerun_after_an_interrupted_migration_does_not_duplicate(tmp_path, stores):
+    store, rollups, vehicle_dimension, sensor_dimension = stores
+    legacy_path = str(tmp_path / "sensor_data.parquet")
+    _write_legacy_file(legacy_path, [_legacy_poll("2025-01-01 23:58", 40.1, True), _legacy_poll("2025-01-01 23:59", 40.5, False)])
+    migrate_legacy_store(store, rollups, vehicle_dimension, sensor_dimension, legacy_path)
+    # as if the run stopped before the file was set aside
+    os.replace(f"{legacy_path}.migrated", legacy_path)
+
+    migrate_legacy_store(store, rollups, vehicle_dimension, sensor_dimension, legacy_path)
+
+    assert len(store.read_all()) == 4
+
+
+def test_unknown_vehicle_waits_for_a_poll(tmp_path, stores):
+    store, rollups, _, sensor_dimension = stores
+    legacy_path = str(tmp_path / "sensor_data.parquet")
+    _write_legacy_file(legacy_path, [_legacy_poll("2025-01-01 23:58", 40.1, True)])
+
+    num_moved = migrate_legacy_store(store, rollups, VehicleDimension(str(tmp_path / "none.parquet")), sensor_dimension, legacy_path)
+
+    assert num_moved == 0
+    assert os.path.exists(legacy_path)
+    assert not os.path.isdir(store.root_dir)
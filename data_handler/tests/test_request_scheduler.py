@@ -0,0 +1,83 @@
+"""Retry-After parsing and the client side token bucket, on a fake clock."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import pytest
+import src.request_scheduler as request_scheduler
+from src.request_scheduler import TokenBucket, parse_retry_after
+
+
+class FakeClock:
+    """monotonic() and asyncio.sleep() that only move when the bucket sleeps."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float) -> None:
+        self.slept.append(delay)
+        self.now += delay
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(request_scheduler.time, "monotonic", fake_clock.monotonic)
+    monkeypatch.setattr(request_scheduler.asyncio, "sleep", fake_clock.sleep)
+    return fake_clock
+
+
+def test_retry_after_reads_seconds_and_falls_back_to_the_default():
+    assert parse_retry_after("7", default=1.0) == 7.0
+    assert parse_retry_after("2.5", default=1.0) == 2.5
+    assert parse_retry_after("-3", default=1.0) == 0.0
+    assert parse_retry_after(None, default=1.5) == 1.5
+    assert parse_retry_after("", default=1.5) == 1.5
+    assert parse_retry_after("soon", default=1.5) == 1.5
+
+
+def test_retry_after_reads_http_dates():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 <= parse_retry_after(format_datetime(retry_at, usegmt=True), default=1.0) <= 30
+    # a date already passed means retry right away
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", default=1.0) == 0.0
+
+
+def test_bucket_bursts_up_to_capacity_then_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3)
+
+    async def take(num_tokens: int) -> None:
+        for _ in range(num_tokens):
+            await bucket.acquire()
+
+    asyncio.run(take(3))
+    assert clock.slept == []
+    asyncio.run(take(2))
+    # each further token waits one refill interval
+    assert clock.slept == [pytest.approx(0.5), pytest.approx(0.5)]
+
+    # refill stops at capacity however long the bucket sat idle
+    clock.now += 60
+    clock.slept.clear()
+    asyncio.run(take(4))
+    assert clock.slept == [pytest.approx(0.5)]
+
+
+def test_pause_blocks_and_empties_the_bucket(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3)
+    bucket.pause(10.0)
+    # a shorter backoff does not cut a longer one short
+    bucket.pause(1.0)
+    started = clock.now
+    asyncio.run(bucket.acquire())
+    assert clock.now - started == pytest.approx(10.0)
+
+    # the tokens saved up before a backoff are dropped
+    full_bucket = TokenBucket(rate=2.0, capacity=3)
+    full_bucket.pause(0.0)
+    clock.slept.clear()
+    asyncio.run(full_bucket.acquire())
+    assert clock.slept == [pytest.approx(0.5)]
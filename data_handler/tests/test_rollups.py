@@ -0,0 +1,46 @@
+"""Partitioned rollup tiers and the coverage they report to the server."""
+import os
+import pandas as pd
+from src.constants import SensorKinds
+from src.rollups import RollupStore
+
+SENSORS = pd.DataFrame({"sensor_id": [1], "vehicle_id": ["10"], "kind": [SensorKinds.TEMPERATURE]})
+
+
+def _temperatures(start: str, periods: int) -> pd.DataFrame:
+    ts = pd.date_range(start, periods=periods, freq="1h", tz="UTC")
+    return pd.DataFrame({"sensor_id": 1, "ts": ts, "value": [float(i) for i in range(periods)]})
+
+
+def _mtimes(tier_dir: str) -> dict[str, int]:
+    return {name: os.stat(os.path.join(tier_dir, name)).st_mtime_ns for name in os.listdir(tier_dir) if name.endswith(".parquet")}
+
+
+def test_update_rewrites_only_the_partitions_it_adds_to(tmp_path):
+    rollups = RollupStore(str(tmp_path))
+    rollups.update(_temperatures("2026-10-01", 72), SENSORS)
+    hourly_dir = rollups.tier_path("hourly")
+    before = _mtimes(hourly_dir)
+    assert sorted(before) == ["2026-10-01.parquet", "2026-10-02.parquet", "2026-10-03.parquet"]
+    assert sorted(_mtimes(rollups.tier_path("daily"))) == ["2026-10.parquet"]
+
+    rollups.update(_temperatures("2026-10-03 23:30", 2), SENSORS)
+    after = _mtimes(hourly_dir)
+    assert after["2026-10-01.parquet"] == before["2026-10-01.parquet"]
+    assert after["2026-10-02.parquet"] == before["2026-10-02.parquet"]
+    assert after["2026-10-03.parquet"] != before["2026-10-03.parquet"]
+    # the 3rd's 24 hourly readings and the new one at 23:30
+    third_df = pd.read_parquet(os.path.join(hourly_dir, "2026-10-03.parquet"))
+    assert third_df["temp_count"].sum() == 25
+    assert "2026-10-04.parquet" in after
+
+
+def test_coverage_starts_at_the_first_update_and_at_zero_after_a_rebuild(tmp_path):
+    rollups = RollupStore(str(tmp_path))
+    assert rollups.covers_from_ms is None
+    readings = _temperatures("2026-10-01 06:00", 4)
+    rollups.update(readings, SENSORS)
+    assert rollups.covers_from_ms == int(readings["ts"].iloc[0].timestamp() * 1000)
+
+    rollups.rebuild(readings, SENSORS)
+    assert rollups.covers_from_ms == 0
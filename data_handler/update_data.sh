@@ -2,7 +2,8 @@
 
 # Variable dfinitions
 IMAGE_NAME="data-handler-demo"
-CONTAINER_NAME="data-handler-demo-temp" # Renamed to avoid conflict (Good practice)
+# unique per run, several server processes may each start a run
+CONTAINER_NAME="data-handler-demo-temp-$$-$(date +%s%N)"
 TAG="v3"
 
 START_TIME="$1"
@@ -18,6 +19,9 @@ if [ -n "$END_TIME" ]; then
     DOCKER_ARGS_ARRAY+=(--end-time "$END_TIME")
 fi
 
+# api to ingest from, override to point at a local mock server
+SAMSARA_BASE_URL="${SAMSARA_BASE_URL:-https://api.samsara.com}"
+
 # api token configuration
 HOST_SECRET_DIR="$HOST_BASE_DIR/data_handler/secrets"
 HOST_SECRET_FILE="$HOST_SECRET_DIR/api_token.txt"
@@ -37,11 +41,6 @@ if [ -z "$DOCKER_COMMAND" ]; then
     fi
 fi
 
-# Remove old container if present (using the new temp name)
-echo "[BUILD] Cleaning up $CONTAINER_NAME (Image: $IMAGE_NAME:$TAG)..."
-"$DOCKER_COMMAND" stop $CONTAINER_NAME 2> /dev/null
-"$DOCKER_COMMAND" rm $CONTAINER_NAME 2> /dev/null
-
 # Build the docker image
 echo "[BUILD] Building new image: $IMAGE_NAME:$TAG"
 "$DOCKER_COMMAND" build -t "$IMAGE_NAME:$TAG" .
@@ -58,6 +57,7 @@ echo "[RUN] Running data handler container $CONTAINER_NAME..."
     --rm \
     --name "$CONTAINER_NAME" \
     -v "$HOST_SECRET_FILE:$CONTAINER_SECRET_FILE:ro" \
+    -e SAMSARA_BASE_URL="$SAMSARA_BASE_URL" \
     -v "$HOST_BASE_DIR/data:/data_handler/data" \
     --entrypoint "python3" \
     "$IMAGE_NAME:$TAG" \
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Gunicorn settings for serving the server app in production.
+
+Run from the data_server directory with `gunicorn --config gunicorn.conf.py`. Every setting
+comes from the SERVER_* constants, which read their environment variable of the same name.
+Send SIGHUP to the master for a graceful reload of all workers.
+"""
+import os
+import sys
+
+# the app imports both src.<module> and bare <module> names, as when running src/host_local_server.py
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [SERVER_DIR, os.path.join(SERVER_DIR, "src")]
+
+from src.constants import (
+    SERVER_BIND,
+    SERVER_WORKERS,
+    SERVER_THREADS,
+    SERVER_TIMEOUT_S,
+    SERVER_GRACEFUL_TIMEOUT_S,
+    SERVER_MAX_REQUESTS,
+    SERVER_MAX_REQUESTS_JITTER,
+)
+
+wsgi_app = "src.wsgi:application"
+bind = SERVER_BIND
+
+# processes so a slow request's pandas and plotly work does not hold the GIL for every viewer,
+# threads so a worker waiting on disk or a status poll still answers other requests
+worker_class = "gthread"
+workers = SERVER_WORKERS
+threads = SERVER_THREADS
+timeout = SERVER_TIMEOUT_S
+graceful_timeout = SERVER_GRACEFUL_TIMEOUT_S
+keepalive = 5
+
+# rolling restarts bound the memory a worker's caches can pile up
+max_requests = SERVER_MAX_REQUESTS
+max_requests_jitter = SERVER_MAX_REQUESTS_JITTER
+
+# import flask, pandas, pyarrow and plotly once in the master, workers start from a copy of it
+preload_app = True
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    """Fill the caches of each new worker before it accepts requests.
+
+    The master only imports, so no cached frame, open connection or thread is shared across the fork.
+    """
+    from src.wsgi import warm_caches
+
+    warm_caches()
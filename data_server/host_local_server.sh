@@ -6,10 +6,13 @@ export PATH="/snap/bin:$PATH"
 IMAGE_NAME="data-server-demo"
 CONTAINER_NAME="data-server-demo"
 TAG="v0"
+# shared with the data handler worker, see data_handler/start_worker.sh
+NETWORK_NAME="samsara-demo"
 
 # remove old container if present
 echo "[BUILD] Cleaning up $CONTAINER_NAME..."
-docker stop $CONTAINER_NAME 2> /dev/null
+# gunicorn lets in-flight requests finish on SIGTERM, give it longer than its graceful timeout
+docker stop -t 35 $CONTAINER_NAME 2> /dev/null
 docker rm $CONTAINER_NAME 2> /dev/null
 
 # build the docker image
@@ -23,9 +26,15 @@ if [ $? -ne 0 ]; then
 fi
 
 # run the docker - main scripts here, defined in Dockerfile
+docker network create "$NETWORK_NAME" 2> /dev/null
 docker run \
     -d \
     -p 8080:5000 \
+    --network "$NETWORK_NAME" \
+    -e SERVER_WORKERS \
+    -e SERVER_THREADS \
+    --stop-timeout 35 \
+    --add-host host.docker.internal:host-gateway \
     --name "$CONTAINER_NAME" \
     -v /var/run/docker.sock:/var/run/docker.sock \
     -v /home/ecurl/samsara_demo/data:/data_server/data \
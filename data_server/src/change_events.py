@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Step series and state durations rebuilt from sensors stored as (ts, new state) change events."""
+from src.constants import DOOR_STEP_MIN_MS
+import numpy as np
+
+
+def step_ms_for_window(start_ms: int, end_ms: int, max_points: int) -> int:
+    """Finest whole multiple of DOOR_STEP_MIN_MS that keeps the window within max_points samples."""
+    return max(1, -(-(end_ms - start_ms) // (max(max_points, 1) * DOOR_STEP_MIN_MS))) * DOOR_STEP_MIN_MS
+
+def step_times(start_ms: int, end_ms: int, step_ms: int) -> np.ndarray:
+    """Sample times on multiples of step_ms inside the window, aligned so series of different sensors line up."""
+    first_ms = -(-start_ms // step_ms) * step_ms
+    return np.arange(first_ms, end_ms + 1, step_ms, dtype=np.int64)
+
+def state_at(event_ms: np.ndarray, event_values: np.ndarray, sample_ms: np.ndarray) -> np.ndarray:
+    """State of a sensor at each sample time, NaN before its first event.
+
+    Args:
+        event_ms: time ordered epoch millis of the change events.
+        event_values: state each event changed to.
+        sample_ms: epoch millis to sample at.
+    """
+    event_index = np.searchsorted(event_ms, sample_ms, side="right") - 1
+    return np.where(event_index >= 0, event_values[np.maximum(event_index, 0)], np.nan)
+
+def state_duration_ms(
+    event_ms: np.ndarray, event_values: np.ndarray, start_ms: int, end_ms: int, state: float,
+) -> tuple[int, int]:
+    """Time a sensor spent in a state during a window, straight from its events.
+
+    Each event's state holds until the next event or the end of the window. Time before
+    the first event is unknown and counted neither way.
+
+    Args:
+        event_ms: time ordered epoch millis of the change events, including the last one before the window.
+        event_values: state each event changed to.
+        start_ms: window start.
+        end_ms: window end.
+        state: state to measure.
+    Returns:
+        (millis in the state, millis with a known state).
+    """
+    first = max(int(np.searchsorted(event_ms, start_ms, side="right")) - 1, 0)
+    last = int(np.searchsorted(event_ms, end_ms, side="right"))
+    bounds = np.clip(event_ms[first:last], start_ms, end_ms)
+    durations = np.diff(np.append(bounds, end_ms))
+    return int(durations[event_values[first:last] == state].sum()), int(durations.sum())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Change notifications from the data handler, fanned out to the dashboard streams of this process."""
+from typing import Optional
+from src.constants import LOCAL_CHANGE_FEED_FILE, CHANGE_FEED_POLL_S
+import json
+import os
+import threading
+import time
+
+
+class ChangeFeed:
+    """Wakes waiting streams whenever the data handler announces newly stored readings.
+
+    The handler rewrites one small json file after every poll it stores. A single
+    watcher thread per process checks that file's modification time and notifies
+    every waiting stream at once, so open streams cost nothing while no data comes in.
+    The thread starts with the first wait, never in a process that is only imported
+    and forked, e.g. the gunicorn master.
+    """
+
+    def __init__(self, notify_path: str = LOCAL_CHANGE_FEED_FILE, poll_interval_s: float = CHANGE_FEED_POLL_S):
+        """Configure the feed.
+
+        Args:
+            notify_path: json file the data handler rewrites after storing readings.
+            poll_interval_s: seconds between checks of the file.
+        """
+        self.notify_path = notify_path
+        self.poll_interval_s = poll_interval_s
+        self._condition = threading.Condition()
+        self._change: Optional[dict] = None
+        self._mtime_ns: Optional[int] = None
+        self._watcher: Optional[threading.Thread] = None
+
+    def _read_change(self) -> None:
+        try:
+            mtime_ns = os.stat(self.notify_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self._mtime_ns:
+            return
+        with open(self.notify_path, "r", encoding="utf-8") as notify_file:
+            change = json.load(notify_file)
+        with self._condition:
+            self._mtime_ns = mtime_ns
+            self._change = change
+            self._condition.notify_all()
+
+    def _watch(self) -> None:
+        while True:
+            try:
+                self._read_change()
+            except (OSError, ValueError) as exc:  # a file being replaced is read again on the next check
+                print(f"[CHANGEFEED] Could not read {self.notify_path}: {exc}")
+            time.sleep(self.poll_interval_s)
+
+    def _ensure_watching(self) -> None:
+        with self._condition:
+            if self._watcher is not None:
+                return
+            self._watcher = threading.Thread(target=self._watch, name="change-feed", daemon=True)
+        # read once before watching so the first caller already sees the current sequence number
+        self._read_change()
+        self._watcher.start()
+
+    def current_seq(self) -> int:
+        """Sequence number of the newest change announced so far, 0 before any."""
+        self._ensure_watching()
+        with self._condition:
+            return self._change["seq"] if self._change is not None else 0
+
+    def wait(self, after_seq: int, timeout_s: float) -> Optional[dict]:
+        """Block until a change newer than after_seq is announced.
+
+        Args:
+            after_seq: sequence number the caller has already handled.
+            timeout_s: longest time to wait.
+        Returns:
+            the newest change, None if there was none before the timeout.
+        """
+        self._ensure_watching()
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._change is not None and self._change["seq"] > after_seq, timeout=timeout_s,
+            )
+            if self._change is None or self._change["seq"] <= after_seq:
+                return None
+            return self._change
+
+
+# shared by every stream in the process
+change_feed = ChangeFeed()
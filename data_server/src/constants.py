@@ -1,31 +1,150 @@
 #!/usr/bin/env python3
 """Define some constants for the server app."""
 
+import os
 from typing import Final
 
 # where the timeseries data is mounted in the container
-LOCAL_TIME_SERIES_STORAGE_FILE: Final = "/data_server/data/sensor_data.parquet"
+LOCAL_TIME_SERIES_STORAGE_DIR: Final = "/data_server/data/sensor_data"
 LOCAL_HISTORY_TIME_SERIES_STORAGE_FILE: Final = "/data_server/data/sensor_history_data.parquet"
+# dimension tables the readings refer to by id, one row per vehicle and per sensor
+LOCAL_VEHICLE_DIMENSION_FILE: Final = "/data_server/data/vehicles.parquet"
+LOCAL_SENSOR_DIMENSION_FILE: Final = "/data_server/data/sensors.parquet"
+
+# rollup tables maintained by the data handler, tier name -> bucket width
+# they cover the polled readings only, ranges ingested through /api/update_plot are served raw
+LOCAL_ROLLUP_DIR: Final = "/data_server/data/rollups"
+ROLLUP_TIERS: Final = {"hourly": 3_600_000, "daily": 86_400_000}
+# a tier is a directory of files named by the UTC day or month of their bucket starts
+ROLLUP_PARTITION_FORMATS: Final = {"hourly": "%Y-%m-%d", "daily": "%Y-%m"}
+# written by the data handler, epoch millis from which the tiers hold every raw reading
+ROLLUP_COVERAGE_FILE: Final = "coverage.json"
+# longest spans served from raw rows and from the hourly tier, anything longer uses daily
+RAW_MAX_SPAN_DAYS: Final = 2
+HOURLY_MAX_SPAN_DAYS: Final = 60
+
+# hive partition keys written by the data handler store
+PARTITION_DATE_KEY: Final = "date"
+PARTITION_VEHICLE_KEY: Final = "vehicle"
+# marker file the store replaces after every write, one stat tells whether the dataset changed
+STORE_GENERATION_MARKER: Final = "_generation"
+
+# window shown on the main page when no time range is requested
+DEFAULT_VIEW_DAYS: Final = 7
+
+# door state is stored as change events and rebuilt into a step series of at least this resolution
+DOOR_STEP_MIN_MS: Final = 60_000
+# doorClosed readings, so the door is open while the stored state is 0
+DOOR_OPEN_STATE: Final = 0.0
+
+# memory budget for typed frames cached in the server process
+DATA_CACHE_MAX_BYTES: Final = 512 * 1024 * 1024
 
 # flask constants
 TEMPLATE_FOLDER: Final = "/data_server/src/templates"
 HOST_BASE_DIR: Final = "/home/ecurl/samsara_demo"
 
+# long-running data handler worker, the docker script is only used when it is unreachable.
+# It is only reachable on the docker network both containers join, see start_worker.sh
+DATA_HANDLER_WORKER_URL: Final = os.environ.get("DATA_HANDLER_WORKER_URL", "http://data-handler-worker:8081")
+# secret the worker requires on its job routes, from the data handler directory the server mounts
+DATA_HANDLER_WORKER_TOKEN_LOCATION: Final = "/data_handler/secrets/worker_token.txt"
+DATA_HANDLER_WORKER_TIMEOUT_S: Final = 300.0
+
+# background range jobs behind /api/update_plot
+RANGE_JOB_WORKERS: Final = 1
+RANGE_JOB_MAX_FINISHED: Final = 100
+RANGE_JOB_POLL_INTERVAL_MS: Final = 1000
+# job status shared by the server workers, a status poll may land on a worker that did not run the job
+RANGE_JOB_STATE_DIR: Final = os.environ.get("RANGE_JOB_STATE_DIR", "/tmp/range_jobs")
+
+# production serving with gunicorn, see gunicorn.conf.py, every worker process keeps its own frame cache
+SERVER_BIND: Final = os.environ.get("SERVER_BIND", "0.0.0.0:5000")
+SERVER_WORKERS: Final = int(os.environ.get("SERVER_WORKERS", "2"))
+# live dashboard streams hold a thread each while open, see STREAM_MAX_PER_PROCESS
+SERVER_THREADS: Final = int(os.environ.get("SERVER_THREADS", "16"))
+SERVER_TIMEOUT_S: Final = int(os.environ.get("SERVER_TIMEOUT_S", "120"))
+# in-flight requests get this long to finish on a restart or shutdown before the worker is killed
+SERVER_GRACEFUL_TIMEOUT_S: Final = int(os.environ.get("SERVER_GRACEFUL_TIMEOUT_S", "30"))
+# workers are replaced one by one after this many requests, the jitter keeps them from restarting together
+SERVER_MAX_REQUESTS: Final = int(os.environ.get("SERVER_MAX_REQUESTS", "2000"))
+SERVER_MAX_REQUESTS_JITTER: Final = int(os.environ.get("SERVER_MAX_REQUESTS_JITTER", "200"))
+# the werkzeug debugger and reloader, only for the development server
+SERVER_DEBUG: Final = os.environ.get("SERVER_DEBUG", "0") == "1"
+
+# plot downsampling, the point budget follows the chart width in pixels
+DOWNSAMPLE_DEFAULT_WIDTH_PX: Final = 1200
+DOWNSAMPLE_POINTS_PER_PIXEL: Final = 2
+DOWNSAMPLE_MIN_POINTS: Final = 100
+DOWNSAMPLE_MAX_POINTS: Final = 20000
+
+# live readings pushed to the dashboard, the data handler rewrites this file after every poll it stores
+LOCAL_CHANGE_FEED_FILE: Final = "/data_server/data/sensor_data_changes.json"
+CHANGE_FEED_POLL_S: Final = 0.5
+# an idle stream sends a comment this often so proxies keep it open, and ends after a while for the browser to reconnect
+STREAM_KEEPALIVE_S: Final = 15
+STREAM_MAX_DURATION_S: Final = 300
+STREAM_RETRY_MS: Final = 3000
+# open streams per server process, kept below SERVER_THREADS so streams cannot starve the other routes
+STREAM_MAX_PER_PROCESS: Final = int(os.environ.get("STREAM_MAX_PER_PROCESS", "8"))
+
+# prefix of the exported timing and counter names served on /metrics
+METRICS_NAMESPACE: Final = "samsara_server"
+
+# responses smaller than this are not worth compressing
+GZIP_MIN_BYTES: Final = 1024
+GZIP_COMPRESS_LEVEL: Final = 6
+
 # define constants for data keys
 class TimeseriesKeys:
     AMBIENT_TEMP = "Ambient Temp."
     AMBIENT_TEMP_TIMESTAMP = "Ambient Temp. Timestamp"
     DOOR_STATE = "Door State"
     DOOR_STATE_TIMESTAMP = "Door State Timestamp"
+    VEHICLE_ID = "Vehicle ID"
+    AMBIENT_TEMP_MIN = "Ambient Temp. Min"
+    AMBIENT_TEMP_MAX = "Ambient Temp. Max"
+    DOOR_OPEN_COUNT = "Door Open Count"
     MAKE = "Make"
     MODEL = "Model"
     YEAR = "Year"
     GATEWAY_SN = "Gateway SN"
-    SENSOR_0_ID = "Sensor 0 ID"
-    SENSOR_0_NAME = "Sensor 0 Name"
-    SENSOR_0_MAC = "Sensor 0 MAC"
-    SENSOR_0_TYPE = "Sensor 0 Type"
-    SENSOR_1_ID = "Sensor 1 ID"
-    SENSOR_1_NAME = "Sensor 1 Name"
-    SENSOR_1_MAC = "Sensor 1 MAC"
-    SENSOR_1_TYPE = "Sensor 1 Type"
\ No newline at end of file
+
+# kind of reading a sensor reports, as stored in the sensor dimension
+class SensorKinds:
+    TEMPERATURE = "temperature"
+    DOOR = "door"
+    LABELS = {TEMPERATURE: "Temperature", DOOR: "Door"}
+    # kinds stored as (ts, new state) events rather than one reading per step
+    CHANGE_EVENTS = (DOOR,)
+
+class DownsampleMode:
+    NONE = "none"
+    LTTB = "lttb"
+    MINMAX = "minmax"
+    TRANSITIONS = "transitions"
+    ALL = (NONE, LTTB, MINMAX, TRANSITIONS)
+
+class SeriesFormat:
+    BASE64 = "b64"
+    ARROW = "arrow"
+    FIGURE = "figure"
+    ALL = (BASE64, ARROW, FIGURE)
+
+class FigureBuilder:
+    PLOTLY = "plotly"
+    DIRECT = "direct"
+    ALL = (PLOTLY, DIRECT)
+
+class SeriesKeys:
+    TEMPERATURE = "temperature"
+    TEMPERATURE_MIN = "temperature_min"
+    TEMPERATURE_MAX = "temperature_max"
+    DOOR_STATE = "door_state"
+
+class SeriesTier:
+    AUTO = "auto"
+    RAW = "raw"
+    HOURLY = "hourly"
+    DAILY = "daily"
+    ALL = (AUTO, RAW, HOURLY, DAILY)
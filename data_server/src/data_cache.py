@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""In-process cache of loaded, typed timeseries frames."""
+from collections import OrderedDict
+from typing import Callable
+from src.constants import DATA_CACHE_MAX_BYTES, STORE_GENERATION_MARKER
+import pandas as pd
+import threading
+import os
+
+
+def path_signature(data_path: str) -> tuple:
+    """Version of a parquet file or dataset directory, changes whenever the handler writes to it."""
+    if os.path.isfile(data_path):
+        stat = os.stat(data_path)
+        return ((data_path, stat.st_mtime_ns, stat.st_size),)
+    try:
+        # the marker is replaced, so given a new inode, on every write to the dataset
+        stat = os.stat(os.path.join(data_path, STORE_GENERATION_MARKER))
+        return ((data_path, stat.st_mtime_ns, stat.st_ino),)
+    except FileNotFoundError:
+        pass
+    # a store not written to since the marker was introduced, every file is checked
+    signature = []
+    for root, _, file_names in os.walk(data_path):
+        for file_name in file_names:
+            # in-progress writes use an ignored name and are skipped like the dataset reader does
+            if file_name.endswith(".parquet") and not file_name.startswith(("_", ".")):
+                stat = os.stat(os.path.join(root, file_name))
+                signature.append((os.path.join(root, file_name), stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(signature))
+
+
+class FrameCache:
+    """LRU cache of frames keyed on path and query, reloaded when the path's signature changes.
+
+    Frames handed out are shared between requests and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes: int = DATA_CACHE_MAX_BYTES):
+        """Configure the cache.
+
+        Args:
+            max_bytes: memory budget across cached frames, least recently used are dropped first.
+        """
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, tuple[tuple, pd.DataFrame, int]] = OrderedDict()
+
+    def get(self, data_path: str, load: Callable[[], pd.DataFrame], query_key: tuple = ()) -> pd.DataFrame:
+        """Get the frame for a path and query, loading it again only if the data on disk changed.
+
+        Args:
+            data_path: parquet file or dataset directory.
+            load: reads and types the frame on a cache miss.
+            query_key: hashable description of the query, e.g. columns and time window.
+        Returns:
+            the cached frame.
+        """
+        cache_key = (data_path, query_key)
+        signature = path_signature(data_path)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(cache_key)
+                return entry[1]
+
+        # load outside the lock so a slow read does not block hits on other keys
+        timeseries_df = load()
+        num_bytes = int(timeseries_df.memory_usage(deep=True).sum())
+        with self._lock:
+            self._entries[cache_key] = (signature, timeseries_df, num_bytes)
+            self._entries.move_to_end(cache_key)
+            self._evict()
+        return timeseries_df
+
+    def _evict(self) -> None:
+        # always keep the most recent entry, even if it alone is over budget
+        while len(self._entries) > 1 and sum(entry[2] for entry in self._entries.values()) > self.max_bytes:
+            (evicted_path, evicted_query), _ = self._entries.popitem(last=False)
+            print(f"[DATACACHE] Evicted {evicted_path} {evicted_query}.")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+frame_cache = FrameCache()
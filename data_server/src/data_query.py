@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""Query path over the stored parquet data with projection and predicate pushdown."""
+from datetime import datetime, timezone
+from typing import Optional
+from src.constants import PARTITION_DATE_KEY, PARTITION_VEHICLE_KEY
+from src.metrics import metrics
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pandas as pd
+import os
+
+# partition values are read as plain strings so they compare like the stored columns
+PARTITIONING = ds.partitioning(
+    pa.schema([(PARTITION_DATE_KEY, pa.string()), (PARTITION_VEHICLE_KEY, pa.string())]), flavor="hive"
+)
+# readings are stored one per row, vehicle and sensor details live in the dimension tables
+SENSOR_ID_KEY = "sensor_id"
+TIMESTAMP_KEY = "ts"
+VALUE_KEY = "value"
+# the data handler stores every timestamp as int64 epoch millis tagged UTC
+TIMESTAMP_TYPE = pa.timestamp("ms", tz="UTC")
+READING_SCHEMA = pa.schema([(SENSOR_ID_KEY, pa.int64()), (TIMESTAMP_KEY, TIMESTAMP_TYPE), (VALUE_KEY, pa.float64())])
+# one row per vehicle and bucket of a rollup tier, as the data handler writes it
+ROLLUP_SCHEMA = pa.schema([
+    ("vehicle", pa.string()),
+    ("bucket_start_ms", pa.int64()),
+    ("temp_min", pa.float64()),
+    ("temp_max", pa.float64()),
+    ("temp_sum", pa.float64()),
+    ("temp_count", pa.int64()),
+    ("temp_mean", pa.float64()),
+    ("door_open_count", pa.int64()),
+    ("door_open_ms", pa.int64()),
+    ("door_observed_ms", pa.int64()),
+])
+
+
+def _utc_scalar(naive_utc: datetime) -> pa.Scalar:
+    """Window bound as a scalar comparable with the stored timestamps, naive bounds are UTC."""
+    return pa.scalar(naive_utc.replace(tzinfo=timezone.utc), type=TIMESTAMP_TYPE)
+
+
+def _readings_dataset(data_path: str) -> ds.Dataset:
+    """Readings of a single parquet file, or of a hive partitioned directory with its partition keys as columns."""
+    if not os.path.isdir(data_path):
+        return ds.dataset(data_path, schema=READING_SCHEMA, format="parquet")
+    schema = READING_SCHEMA.append(pa.field(PARTITION_DATE_KEY, pa.string())).append(pa.field(PARTITION_VEHICLE_KEY, pa.string()))
+    return ds.dataset(data_path, schema=schema, format="parquet", partitioning=PARTITIONING)
+
+
+def _read_table(dataset: ds.Dataset, query: str, **scan_kwargs) -> pd.DataFrame:
+    """Scan a dataset into a frame, timed and counted under the kind of query."""
+    with metrics.timer("parquet_read", query=query):
+        table = dataset.to_table(**scan_kwargs)
+    metrics.count("rows_read", table.num_rows, query=query)
+    # decoded arrow bytes, what the scan hands on to pandas
+    metrics.count("bytes_read", table.nbytes, query=query)
+    return table.to_pandas()
+
+
+def query_readings(
+    data_path: str,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    sensor_ids: Optional[list[int]] = None,
+    vehicle_id: Optional[str] = None,
+) -> pd.DataFrame:
+    """Read the readings of a window, optionally only those of some sensors.
+
+    The filters are pushed into the parquet scan, so partitions and row groups
+    whose statistics fall outside the window are never read.
+
+    Args:
+        data_path: parquet file or hive partitioned dataset directory.
+        start_time: window start, inclusive.
+        end_time: window end, inclusive.
+        sensor_ids: only read readings of these sensors.
+        vehicle_id: only read partitions of this vehicle, pass its sensor ids as well to filter a single file.
+    Returns:
+        sensor_id, ts and value of the matching readings.
+    """
+    partitioned = os.path.isdir(data_path)
+    dataset = _readings_dataset(data_path)
+
+    filters = []
+    if start_time is not None:
+        filters.append(ds.field(TIMESTAMP_KEY) >= _utc_scalar(start_time))
+    if end_time is not None:
+        filters.append(ds.field(TIMESTAMP_KEY) <= _utc_scalar(end_time))
+    if sensor_ids is not None:
+        filters.append(ds.field(SENSOR_ID_KEY).isin(pa.array(sensor_ids, type=pa.int64())))
+    if partitioned:
+        # partitions are dated by their readings' UTC date, so both ends of the window prune them
+        if start_time is not None:
+            filters.append(ds.field(PARTITION_DATE_KEY) >= start_time.strftime("%Y-%m-%d"))
+        if end_time is not None:
+            filters.append(ds.field(PARTITION_DATE_KEY) <= end_time.strftime("%Y-%m-%d"))
+        if vehicle_id is not None:
+            filters.append(ds.field(PARTITION_VEHICLE_KEY) == str(vehicle_id))
+
+    combined_filter = None
+    for scan_filter in filters:
+        combined_filter = scan_filter if combined_filter is None else combined_filter & scan_filter
+    return _read_table(dataset, "readings", columns=READING_SCHEMA.names, filter=combined_filter)
+
+
+def _date_partitions(data_path: str) -> list[str]:
+    """Dates of the store's date partitions, oldest first."""
+    prefix = f"{PARTITION_DATE_KEY}="
+    return sorted(name.removeprefix(prefix) for name in os.listdir(data_path) if name.startswith(prefix))
+
+
+def _partition_files(data_path: str, dates: list[str], vehicle_id: Optional[str] = None) -> list[str]:
+    """Parquet files of some date partitions, optionally of one vehicle, skipping files being written."""
+    partition_files = []
+    for date in dates:
+        date_dir = os.path.join(data_path, f"{PARTITION_DATE_KEY}={date}")
+        vehicle_dirs = [f"{PARTITION_VEHICLE_KEY}={vehicle_id}"] if vehicle_id is not None else os.listdir(date_dir)
+        for vehicle_dir in vehicle_dirs:
+            partition_dir = os.path.join(date_dir, vehicle_dir)
+            if not os.path.isdir(partition_dir):
+                continue
+            partition_files.extend(
+                os.path.join(partition_dir, file_name) for file_name in os.listdir(partition_dir)
+                if file_name.endswith(".parquet") and not file_name.startswith(("_", "."))
+            )
+    return partition_files
+
+
+def query_last_readings(
+    data_path: str,
+    before_time: datetime,
+    sensor_ids: list[int],
+    vehicle_id: Optional[str] = None,
+) -> pd.DataFrame:
+    """Read the newest reading of each sensor strictly before a time, e.g. the state a change event series starts a window in.
+
+    In a partitioned store the date partitions are searched backwards from the time, a day
+    first and then twice as many each round, only for the sensors not found yet. A sensor
+    that last reported long ago costs a few rounds instead of every scan reading all history.
+
+    Args:
+        data_path: parquet file or hive partitioned dataset directory.
+        before_time: readings at or after this time are ignored.
+        sensor_ids: sensors to look up.
+        vehicle_id: only read partitions of this vehicle.
+    Returns:
+        sensor_id, ts and value, at most one row per sensor.
+    """
+    before_filter = ds.field(TIMESTAMP_KEY) < _utc_scalar(before_time)
+    if not os.path.isdir(data_path):
+        scan_filter = before_filter & ds.field(SENSOR_ID_KEY).isin(pa.array(sensor_ids, type=pa.int64()))
+        readings_df = _read_table(_readings_dataset(data_path), "last_readings", columns=READING_SCHEMA.names, filter=scan_filter)
+        return readings_df.sort_values(TIMESTAMP_KEY, kind="stable").drop_duplicates(SENSOR_ID_KEY, keep="last")
+
+    before_date = before_time.strftime("%Y-%m-%d")
+    dates = [date for date in _date_partitions(data_path) if date <= before_date]
+    missing_ids = list(sensor_ids)
+    found_dfs = []
+    num_dates = 1
+    while dates and missing_ids:
+        round_dates, dates = dates[-num_dates:], dates[:-num_dates]
+        num_dates *= 2
+        round_files = _partition_files(data_path, round_dates, vehicle_id)
+        if not round_files:
+            continue
+        dataset = ds.dataset(round_files, schema=READING_SCHEMA, format="parquet")
+        scan_filter = before_filter & ds.field(SENSOR_ID_KEY).isin(pa.array(missing_ids, type=pa.int64()))
+        round_df = _read_table(dataset, "last_readings", columns=READING_SCHEMA.names, filter=scan_filter)
+        found_dfs.append(round_df)
+        found_ids = set(round_df[SENSOR_ID_KEY])
+        missing_ids = [sensor_id for sensor_id in missing_ids if sensor_id not in found_ids]
+    if not found_dfs:
+        return READING_SCHEMA.empty_table().to_pandas()
+    readings_df = pd.concat(found_dfs, ignore_index=True)
+    return readings_df.sort_values(TIMESTAMP_KEY, kind="stable").drop_duplicates(SENSOR_ID_KEY, keep="last")
+
+
+def query_dimension(dimension_path: str, columns: list[str]) -> pd.DataFrame:
+    """Read a vehicle or sensor dimension table, empty with the given columns until the handler wrote it."""
+    if not os.path.exists(dimension_path):
+        return pd.DataFrame(columns=columns)
+    return _read_table(ds.dataset(dimension_path, format="parquet"), "dimension", columns=columns)
+
+
+def query_rollup(
+    rollup_path: str,
+    partition_format: str,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    vehicle_id: Optional[str] = None,
+) -> pd.DataFrame:
+    """Read the rollup buckets starting inside a window, filtered in the scan.
+
+    Only the partition files named for a day or month inside the window are opened.
+
+    Args:
+        rollup_path: directory of one rollup tier.
+        partition_format: strftime format the tier's partition files are named with.
+        start_time: window start, inclusive, naive UTC.
+        end_time: window end, inclusive, naive UTC.
+        vehicle_id: only read buckets of this vehicle.
+    Returns:
+        the matching buckets.
+    """
+    first_key = start_time.strftime(partition_format) if start_time is not None else ""
+    last_key = end_time.strftime(partition_format) if end_time is not None else "~"
+    # files being written start with '_' and are skipped, like the dataset reader does
+    partition_files = sorted(
+        os.path.join(rollup_path, file_name)
+        for file_name in (os.listdir(rollup_path) if os.path.isdir(rollup_path) else [])
+        if file_name.endswith(".parquet") and not file_name.startswith(("_", "."))
+        and first_key <= file_name.removesuffix(".parquet") <= last_key
+    )
+    filters = []
+    if start_time is not None:
+        filters.append(ds.field("bucket_start_ms") >= _utc_scalar(start_time).value)
+    if end_time is not None:
+        filters.append(ds.field("bucket_start_ms") <= _utc_scalar(end_time).value)
+    if vehicle_id is not None:
+        filters.append(ds.field("vehicle") == str(vehicle_id))
+    combined_filter = None
+    for scan_filter in filters:
+        combined_filter = scan_filter if combined_filter is None else combined_filter & scan_filter
+    return _read_table(ds.dataset(partition_files, schema=ROLLUP_SCHEMA, format="parquet"), "rollup", filter=combined_filter)
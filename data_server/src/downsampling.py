@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Reduce plotted series to a point budget before they are sent to the browser."""
+from typing import Optional
+from src.constants import (
+    DownsampleMode,
+    DOWNSAMPLE_DEFAULT_WIDTH_PX,
+    DOWNSAMPLE_POINTS_PER_PIXEL,
+    DOWNSAMPLE_MIN_POINTS,
+    DOWNSAMPLE_MAX_POINTS,
+)
+import numpy as np
+
+
+def point_budget(width_px: Optional[int] = None) -> int:
+    """Number of points worth drawing on a chart of the given pixel width."""
+    width_px = width_px or DOWNSAMPLE_DEFAULT_WIDTH_PX
+    return int(np.clip(width_px * DOWNSAMPLE_POINTS_PER_PIXEL, DOWNSAMPLE_MIN_POINTS, DOWNSAMPLE_MAX_POINTS))
+
+def _bucket_bounds(num_points: int, num_buckets: int) -> np.ndarray:
+    """Start offsets of num_buckets equal-count buckets over num_points, plus the end."""
+    return np.linspace(0, num_points, num_buckets + 1).astype(np.int64)
+
+def minmax_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices of the min and max of each bucket, keeps the envelope of the series.
+
+    Args:
+        y: values ordered by time, without NaNs.
+        max_points: point budget, two points are kept per bucket.
+    Returns:
+        sorted indices into y.
+    """
+    num_points = len(y)
+    num_buckets = max(max_points // 2, 1)
+    if num_points <= max_points:
+        return np.arange(num_points)
+    bucket_bounds = _bucket_bounds(num_points, num_buckets)
+    # buckets differ in length by at most one, so lay them out as rows of a matrix,
+    # short rows repeat their last index which changes neither their min nor max
+    bucket_len = int(np.diff(bucket_bounds).max())
+    bucket_matrix = np.minimum(bucket_bounds[:-1, None] + np.arange(bucket_len), bucket_bounds[1:, None] - 1)
+    bucket_values = y[bucket_matrix]
+    rows = np.arange(num_buckets)
+    min_indices = bucket_matrix[rows, bucket_values.argmin(axis=1)]
+    max_indices = bucket_matrix[rows, bucket_values.argmax(axis=1)]
+    return np.unique(np.concatenate([min_indices, max_indices]))
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets selection, keeps the visual shape of the series.
+
+    Each bucket keeps the point forming the largest triangle with the point kept
+    in the previous bucket and the mean of the next bucket. Buckets depend on the
+    previous choice so they are walked in order, the work inside a bucket is vectorized.
+
+    Args:
+        x: time as numbers, increasing.
+        y: values, without NaNs.
+        max_points: point budget, the first and last points are always kept.
+    Returns:
+        sorted indices into x and y.
+    """
+    num_points = len(x)
+    if num_points <= max_points or max_points < 3:
+        return np.arange(num_points)
+    # the first and last points are buckets of their own
+    bucket_bounds = 1 + _bucket_bounds(num_points - 2, max_points - 2)
+    # next-bucket means for every bucket at once, the last bucket looks ahead to the final point
+    x_sums = np.add.reduceat(x[:bucket_bounds[-1]], bucket_bounds[:-1])
+    y_sums = np.add.reduceat(y[:bucket_bounds[-1]], bucket_bounds[:-1])
+    counts = np.diff(bucket_bounds)
+    x_means = np.append(x_sums / counts, x[-1])
+    y_means = np.append(y_sums / counts, y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = num_points - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = bucket_bounds[bucket], bucket_bounds[bucket + 1]
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        # twice the triangle area, the constant factor does not change the argmax
+        areas = np.abs(
+            (x[previous] - x_means[bucket + 1]) * (bucket_y - y[previous])
+            - (x[previous] - bucket_x) * (y_means[bucket + 1] - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+def transition_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices where a step series changes value, plus its first and last points.
+
+    Drawn with a step line shape this is the same plot as the full series. If the
+    series changes more often than the budget allows, the min/max envelope is kept instead
+    so short openings still show up.
+
+    Args:
+        y: values ordered by time, without NaNs.
+        max_points: point budget.
+    Returns:
+        sorted indices into y.
+    """
+    num_points = len(y)
+    if num_points == 0:
+        return np.arange(0)
+    changes = np.flatnonzero(y[1:] != y[:-1]) + 1
+    indices = np.unique(np.concatenate([[0], changes, [num_points - 1]]))
+    if len(indices) > max_points:
+        return minmax_indices(y, max_points)
+    return indices
+
+def downsample(x: np.ndarray, y: np.ndarray, mode: str, max_points: int) -> tuple[np.ndarray, np.ndarray]:
+    """Reduce a time ordered series to at most about max_points points.
+
+    Args:
+        x: datetime64 timestamps, increasing.
+        y: float values, without NaNs.
+        mode: one of DownsampleMode.
+        max_points: point budget.
+    Returns:
+        the kept (x, y).
+    """
+    if mode == DownsampleMode.NONE or len(x) <= max_points:
+        return x, y
+    if mode == DownsampleMode.LTTB:
+        indices = lttb_indices(x.astype("datetime64[ms]").astype(np.float64), y, max_points)
+    elif mode == DownsampleMode.MINMAX:
+        indices = minmax_indices(y, max_points)
+    elif mode == DownsampleMode.TRANSITIONS:
+        indices = transition_indices(y, max_points)
+    else:
+        raise ValueError(f"Unknown downsample mode {mode}, expected one of {DownsampleMode.ALL}")
+    return x[indices], y[indices]
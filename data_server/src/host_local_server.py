@@ -1,60 +1,410 @@
 #!/usr/bin/env python3
 """Main entry point for the host local server."""
-from flask import Flask, render_template, request, redirect, url_for, jsonify
+from flask import Flask, Response, render_template, request, url_for, jsonify, abort, g
 from plotly.utils import PlotlyJSONEncoder
 
+import gzip
 import json
-from src.visualization_helpers import load_data, plot_timeseries, parse_header_info, load_range_data
-from src.constants import TEMPLATE_FOLDER
-from src.constants import TimeseriesKeys
+import threading
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta, timezone
+from src.visualization_helpers import (
+    plot_timeseries,
+    timeseries_figure_json,
+    prepare_plot_series,
+    load_range_data,
+    load_series_window,
+    pick_series_tier,
+    series_data_path,
+    series_version,
+    load_header_info,
+    load_door_open_durations,
+    load_readings_since,
+    timeseries_layout_json,
+    LIVE_CURSORS_ATTR,
+)
+from src.change_feed import change_feed
+from src.job_queue import RangeJobQueue, JobStatus
+from src.metrics import metrics
+from src.downsampling import point_budget
+from src.series_encoding import encode_series_base64, encode_series_arrow, series_etag, ARROW_STREAM_MIMETYPE
+from src.constants import TEMPLATE_FOLDER, RANGE_JOB_POLL_INTERVAL_MS, RANGE_JOB_STATE_DIR, DEFAULT_VIEW_DAYS
+from src.constants import SERVER_DEBUG, STREAM_KEEPALIVE_S, STREAM_MAX_DURATION_S, STREAM_RETRY_MS, STREAM_MAX_PER_PROCESS
+from src.constants import GZIP_MIN_BYTES, GZIP_COMPRESS_LEVEL
+from src.constants import TimeseriesKeys, DownsampleMode, SeriesFormat, SeriesKeys, SeriesTier, FigureBuilder
 
 app = Flask(__name__, template_folder=TEMPLATE_FOLDER)
+# status polls may be answered by any server worker, they share job state on disk
+range_job_queue = RangeJobQueue(run_job=load_range_data, state_dir=RANGE_JOB_STATE_DIR)
+# every open live stream holds a server thread
+stream_slots = threading.BoundedSemaphore(STREAM_MAX_PER_PROCESS)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response: Response) -> Response:
+    """Latency and response size per route, labelled by the route pattern rather than the raw path."""
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics.observe("http_request", time.perf_counter() - g.request_start, route=route, method=request.method)
+    metrics.count("http_responses", route=route, status=response.status_code)
+    if not response.is_streamed:
+        metrics.count("http_bytes_sent", response.calculate_content_length() or 0, route=route)
+    return response
+
+class PlotOptions:
+    """Downsampling requested for the plots, read from the query string or form."""
+
+    def __init__(self, args):
+        self.temp_mode = args.get('downsample', DownsampleMode.LTTB)
+        self.door_mode = args.get('door_downsample', DownsampleMode.TRANSITIONS)
+        if self.temp_mode not in DownsampleMode.ALL or self.door_mode not in DownsampleMode.ALL:
+            abort(400, description=f"downsample modes must be one of {DownsampleMode.ALL}")
+        try:
+            width_px = int(args['width']) if args.get('width') else None
+        except ValueError:
+            abort(400, description="width must be an integer pixel count")
+        self.max_points = point_budget(width_px)
+        self.width_px = width_px
+        self.series_format = args.get('format', SeriesFormat.BASE64)
+        if self.series_format not in SeriesFormat.ALL:
+            abort(400, description=f"format must be one of {SeriesFormat.ALL}")
+        self.figure_builder = args.get('figure_builder', FigureBuilder.DIRECT)
+        if self.figure_builder not in FigureBuilder.ALL:
+            abort(400, description=f"figure_builder must be one of {FigureBuilder.ALL}")
+        self.tier = args.get('tier', SeriesTier.AUTO)
+        if self.tier not in SeriesTier.ALL:
+            abort(400, description=f"tier must be one of {SeriesTier.ALL}")
+
+    def as_args(self) -> dict:
+        args = {
+            'downsample': self.temp_mode,
+            'door_downsample': self.door_mode,
+            'format': self.series_format,
+            'figure_builder': self.figure_builder,
+            'tier': self.tier,
+        }
+        if self.width_px:
+            args['width'] = self.width_px
+        return args
+
+def build_plot_json(timeseries_df: pd.DataFrame, plot_options: PlotOptions) -> tuple[str, str]:
+    """Build the temperature and door state plots as json."""
+    plots = [
+        (TimeseriesKeys.AMBIENT_TEMP, TimeseriesKeys.AMBIENT_TEMP_TIMESTAMP, plot_options.temp_mode),
+        (TimeseriesKeys.DOOR_STATE, TimeseriesKeys.DOOR_STATE_TIMESTAMP, plot_options.door_mode),
+    ]
+    plot_jsons = []
+    for data_key, timestamp_key, downsample_mode in plots:
+        if plot_options.figure_builder == FigureBuilder.DIRECT:
+            # same json as the plotly path, written straight from the arrays
+            plot_jsons.append(timeseries_figure_json(
+                timeseries_df, data_key, timestamp_key, downsample_mode, plot_options.max_points,
+            ))
+        else:
+            timeseries_plot = plot_timeseries(
+                timeseries_df, data_key, timestamp_key, downsample_mode, plot_options.max_points,
+            )
+            with metrics.timer("encode", format="plotly"):
+                plot_jsons.append(json.dumps(timeseries_plot, cls=PlotlyJSONEncoder))
+    plot_json_temp, plot_json_door = plot_jsons
+    return plot_json_temp, plot_json_door
+
+def build_series(timeseries_df: pd.DataFrame, plot_options: PlotOptions) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """Build the temperature and door state series as drawn, without any figure around them.
+
+    Frames read from a rollup tier also give the temperature min/max envelope.
+    """
+    series = {
+        SeriesKeys.TEMPERATURE: prepare_plot_series(
+            timeseries_df, TimeseriesKeys.AMBIENT_TEMP, TimeseriesKeys.AMBIENT_TEMP_TIMESTAMP,
+            plot_options.temp_mode, plot_options.max_points,
+        ),
+        SeriesKeys.DOOR_STATE: prepare_plot_series(
+            timeseries_df, TimeseriesKeys.DOOR_STATE, TimeseriesKeys.DOOR_STATE_TIMESTAMP,
+            plot_options.door_mode, plot_options.max_points,
+        ),
+    }
+    for series_key, data_key in [
+        (SeriesKeys.TEMPERATURE_MIN, TimeseriesKeys.AMBIENT_TEMP_MIN),
+        (SeriesKeys.TEMPERATURE_MAX, TimeseriesKeys.AMBIENT_TEMP_MAX),
+    ]:
+        if data_key in timeseries_df.columns:
+            series[series_key] = prepare_plot_series(
+                timeseries_df, data_key, TimeseriesKeys.AMBIENT_TEMP_TIMESTAMP, plot_options.temp_mode, plot_options.max_points,
+            )
+    return series
+
+def series_response(timeseries_df: pd.DataFrame, plot_options: PlotOptions, tier: str, etag: str = None, live: bool = True) -> Response:
+    """Respond with the plotted series in the requested format, gzipped when the client accepts it.
+
+    Args:
+        live: False for a frame the live stream does not continue, e.g. a range job's history, sent without cursors.
+    """
+    if plot_options.series_format == SeriesFormat.FIGURE:
+        plot_json_temp, plot_json_door = build_plot_json(timeseries_df, plot_options)
+        # the figures are already json, splice them in rather than parsing them back
+        body = f'{{"figures": {{"{SeriesKeys.TEMPERATURE}": {plot_json_temp}, "{SeriesKeys.DOOR_STATE}": {plot_json_door}}}}}'.encode()
+        mimetype = 'application/json'
+    elif plot_options.series_format == SeriesFormat.ARROW:
+        series = build_series(timeseries_df, plot_options)
+        with metrics.timer("encode", format=SeriesFormat.ARROW):
+            body = encode_series_arrow(series)
+        mimetype = ARROW_STREAM_MIMETYPE
+    else:
+        series = build_series(timeseries_df, plot_options)
+        with metrics.timer("encode", format=SeriesFormat.BASE64):
+            body = json.dumps({
+                'tier': tier,
+                'series': {name: encode_series_base64(x_data, y_data) for name, (x_data, y_data) in series.items()},
+                # where a live chart's stream starts, only raw windows of the polled store have them
+                'cursors': timeseries_df.attrs.get(LIVE_CURSORS_ATTR) if live else None,
+            }).encode()
+        mimetype = 'application/json'
+
+    response = Response(body, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    if len(body) >= GZIP_MIN_BYTES and request.accept_encodings.quality('gzip') > 0:
+        with metrics.timer("gzip"):
+            response.set_data(gzip.compress(body, compresslevel=GZIP_COMPRESS_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+        # the compressed body is a different representation, so it gets its own validator
+        etag = f"{etag}-gzip" if etag else None
+    if etag:
+        response.set_etag(etag)
+        # cached copies are fine but must be revalidated, the data changes with every poll
+        response.cache_control.no_cache = True
+    return response
+
+def parse_time_arg(args, key: str) -> datetime:
+    """A UTC minute from the query string or form, in the format of the page's datetime-local inputs."""
+    try:
+        return datetime.strptime(args[key], "%Y-%m-%dT%H:%M")
+    except (KeyError, TypeError, ValueError):
+        abort(400, description=f"{key} must be a time formatted as YYYY-MM-DDTHH:MM")
+
+def parse_time_range(args) -> tuple[datetime, datetime]:
+    """Requested start_time and end_time, a missing, malformed or empty range is a bad request."""
+    start_time, end_time = parse_time_arg(args, 'start_time'), parse_time_arg(args, 'end_time')
+    if end_time <= start_time:
+        abort(400, description="end_time must be after start_time")
+    return start_time, end_time
+
+def parse_view_window(args) -> tuple[datetime, datetime]:
+    """Time window for the main page, defaults to the last few days in UTC.
+
+    The default end is rounded up to the hour so repeat page loads hit the frame cache.
+    """
+    if args.get('start_time') and args.get('end_time'):
+        return parse_time_range(args)
+    end_time = (datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+    return end_time - timedelta(days=DEFAULT_VIEW_DAYS), end_time
+
 @app.route('/')
 def index():
-    """Render the main page with the timeseries plot."""
-    # Load the data
-    df = load_data()
-    header_info = parse_header_info(df)
-
-    # Create the plot for the temperature sensor
-    timeseries_plot_temp = plot_timeseries(df, data_key=TimeseriesKeys.AMBIENT_TEMP, timestamp_key=TimeseriesKeys.AMBIENT_TEMP_TIMESTAMP)
-    plot_json_temp = json.dumps(timeseries_plot_temp, cls=PlotlyJSONEncoder)
-    
-    # create the plot for the door state sensor
-    timeseries_plot_door = plot_timeseries(df, data_key=TimeseriesKeys.DOOR_STATE, timestamp_key=TimeseriesKeys.DOOR_STATE_TIMESTAMP)
-    plot_json_door = json.dumps(timeseries_plot_door, cls=PlotlyJSONEncoder)
-    # Render the HTML template with the plot JSON
+    """Render the main page, the plot data is fetched by the page from /api/series."""
+    start_time, end_time = parse_view_window(request.args)
+    plot_options = PlotOptions(request.args)
+    header_info = load_header_info(request.args.get('vehicle_id'))
+
+    series_args = {
+        'start_time': start_time.strftime("%Y-%m-%dT%H:%M"),
+        'end_time': end_time.strftime("%Y-%m-%dT%H:%M"),
+        'downsample': plot_options.temp_mode,
+        'door_downsample': plot_options.door_mode,
+    }
+    for passed_arg in ['vehicle_id', 'tier']:
+        if request.args.get(passed_arg):
+            series_args[passed_arg] = request.args[passed_arg]
+    # Render the HTML template, the page assembles traces and layout itself
     return render_template(
         'index.html',
-        plot_json_temp=plot_json_temp,
-        plot_json_door=plot_json_door,
         header_info=header_info,
-        current_start_time='2025-08-01T00:00',
-        current_end_time='2025-08-02T00:00'
+        series_url=url_for('api_series', **series_args),
+        stream_url=url_for('api_stream', **{key: value for key, value in series_args.items() if key == 'vehicle_id'}),
+        current_start_time=series_args['start_time'],
+        current_end_time=series_args['end_time'],
+        job_poll_interval_ms=RANGE_JOB_POLL_INTERVAL_MS,
+        downsample_mode=plot_options.temp_mode,
+    )
+
+@app.route('/api/series', methods=['GET'])
+def api_series():
+    """Plotted series of a time window as typed columns, revalidated with ETag/If-None-Match."""
+    start_time, end_time = parse_view_window(request.args)
+    plot_options = PlotOptions(request.args)
+    vehicle_id = request.args.get('vehicle_id')
+
+    # pick raw rows or a rollup tier from the span, long views then cost about the same as short ones
+    tier = pick_series_tier(start_time, end_time, plot_options.tier)
+
+    # answer from the validator alone when nothing changed, before any data is read
+    etag = series_etag(
+        series_data_path(tier), tier, start_time, end_time, vehicle_id, sorted(plot_options.as_args().items()),
+        series_version(tier, end_time),
     )
+    if request.if_none_match.contains(etag) or request.if_none_match.contains(f"{etag}-gzip"):
+        response = Response(status=304)
+        response.set_etag(f"{etag}-gzip" if request.if_none_match.contains(f"{etag}-gzip") else etag)
+        return response
+
+    df, tier = load_series_window(start_time, end_time, vehicle_id=vehicle_id, tier=tier, max_points=plot_options.max_points)
+    return series_response(df, plot_options, tier, etag=etag)
+
+@app.route('/api/door_open_duration', methods=['GET'])
+def api_door_open_duration():
+    """Time each door sensor spent open in a window, computed from its change events."""
+    start_time, end_time = parse_view_window(request.args)
+    durations_df = load_door_open_durations(start_time, end_time, vehicle_id=request.args.get('vehicle_id'))
+    return jsonify({
+        'start_time': start_time.isoformat(),
+        'end_time': end_time.isoformat(),
+        'open_ms': int(durations_df['open_ms'].sum()),
+        'observed_ms': int(durations_df['observed_ms'].sum()),
+        'sensors': [
+            {'sensor_id': int(sensor_id), 'vehicle_id': vehicle_id, 'open_ms': int(open_ms), 'observed_ms': int(observed_ms)}
+            for sensor_id, vehicle_id, open_ms, observed_ms in durations_df.itertuples(index=False)
+        ],
+    })
+
+def parse_stream_cursor() -> tuple[int, int]:
+    """Epoch millis of the last temperature and door state points a live chart has.
+
+    A reconnecting browser sends the id of the last event it got, which carries both.
+    """
+    last_event_id = request.headers.get('Last-Event-ID')
+    try:
+        if last_event_id:
+            temperature_since, door_since = last_event_id.split(':')
+            return int(temperature_since), int(door_since)
+        return int(request.args['temperature_since']), int(request.args['door_since'])
+    except (KeyError, ValueError):
+        abort(400, description="temperature_since and door_since must be epoch milliseconds")
+
+def stream_event(event: str, data: str, event_id: str = None) -> str:
+    """One server-sent event."""
+    metrics.count("stream_events", event=event)
+    id_line = f"id: {event_id}\n" if event_id else ""
+    return f"{id_line}event: {event}\ndata: {data}\n\n"
+
+@app.route('/api/stream', methods=['GET'])
+def api_stream():
+    """Server-sent events pushing readings stored after a live chart's last points.
+
+    The stream wakes on the data handler's change notification. Charts on raw rows
+    get the new readings to extend their traces with, charts on a rollup tier only
+    a 'changed' event to refetch their few buckets. Streams end after a while and
+    the browser reconnects, resuming from the last event id.
+    """
+    tier = request.args.get('tier', SeriesTier.RAW)
+    if tier not in SeriesTier.ALL:
+        abort(400, description=f"tier must be one of {SeriesTier.ALL}")
+    vehicle_id = request.args.get('vehicle_id')
+    cursor = parse_stream_cursor() if tier == SeriesTier.RAW else None
+    if not stream_slots.acquire(blocking=False):
+        abort(503, description="too many live streams open, try again later")
+
+    def generate(cursor: tuple[int, int]):
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        seq = change_feed.current_seq()
+        stream_end = time.monotonic() + STREAM_MAX_DURATION_S
+        # a raw chart first catches up on what was stored between its page load, or last event, and now
+        change = {'seq': seq} if cursor is not None else None
+        while time.monotonic() < stream_end:
+            if change is None:
+                change = change_feed.wait(seq, min(STREAM_KEEPALIVE_S, max(stream_end - time.monotonic(), 0)))
+            if change is None:
+                yield ": keepalive\n\n"
+                continue
+            seq, change = change['seq'], None
+            if cursor is None:
+                yield stream_event('changed', json.dumps({'seq': seq}))
+                continue
+
+            timeseries_df = load_readings_since(*cursor, vehicle_id=vehicle_id)
+            # every new point is sent, a live update is a handful of readings
+            series = {
+                SeriesKeys.TEMPERATURE: prepare_plot_series(
+                    timeseries_df, TimeseriesKeys.AMBIENT_TEMP, TimeseriesKeys.AMBIENT_TEMP_TIMESTAMP,
+                ),
+                SeriesKeys.DOOR_STATE: prepare_plot_series(
+                    timeseries_df, TimeseriesKeys.DOOR_STATE, TimeseriesKeys.DOOR_STATE_TIMESTAMP,
+                ),
+            }
+            if not any(len(x_data) for x_data, _ in series.values()):
+                continue
+            cursor = tuple(
+                int(x_data[-1].astype(np.int64)) if len(x_data) else since
+                for (x_data, _), since in zip(series.values(), cursor)
+            )
+            with metrics.timer("encode", format="stream"):
+                data = json.dumps({'series': {name: encode_series_base64(x_data, y_data) for name, (x_data, y_data) in series.items()}})
+            yield stream_event('readings', data, event_id=f"{cursor[0]}:{cursor[1]}")
+
+    response = Response(generate(cursor), mimetype='text/event-stream')
+    # released when the server closes the response, also if the client left before the first event
+    response.call_on_close(stream_slots.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    # proxies must pass events on as they are written
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Timings and counters of this server process in the Prometheus text format."""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/update_plot', methods=['POST'])
 def api_update_plot():
-    """Function to update the plot data."""
-    # This function can be expanded to fetch new data and update the plot
-    start_time = request.form.get('start_time')+ ":00"
-    end_time = request.form.get('end_time') + ":00"
-    
-    # get new data based on the provided time range
-    timeseries_df = load_range_data(start_time, end_time)
-
-    # Create the plot for the temperature sensor
-    timeseries_plot_temp = plot_timeseries(timeseries_df, data_key=TimeseriesKeys.AMBIENT_TEMP, timestamp_key=TimeseriesKeys.AMBIENT_TEMP_TIMESTAMP)
-    plot_json_temp = json.dumps(timeseries_plot_temp, cls=PlotlyJSONEncoder)
-    
-    # create the plot for the door state sensor
-    timeseries_plot_door = plot_timeseries(timeseries_df, data_key=TimeseriesKeys.DOOR_STATE, timestamp_key=TimeseriesKeys.DOOR_STATE_TIMESTAMP)
-    plot_json_door = json.dumps(timeseries_plot_door, cls=PlotlyJSONEncoder)
-    # reloads the local server page data
+    """Queue an ingestion for the requested time range and return its job id right away."""
+    # checked now so a bad request fails before any ingestion is queued
+    start_time, end_time = parse_time_range(request.form)
+    plot_options = PlotOptions(request.form)
+
+    # identical or overlapping in-flight ranges share one ingestion
+    job_id = range_job_queue.submit(start_time, end_time)
     return jsonify({
-        'plot_json_temp': plot_json_temp,
-        'plot_json_door': plot_json_door,
-    })
+        'job_id': job_id,
+        'status_url': url_for('api_update_plot_status', job_id=job_id, **plot_options.as_args()),
+    }), 202
+
+@app.route('/api/update_plot/<job_id>', methods=['GET'])
+def api_update_plot_status(job_id: str):
+    """Report a range job's status, with the plotted series once it is ready."""
+    job_state = range_job_queue.get(job_id)
+    if job_state is None:
+        return jsonify({'status': 'unknown'}), 404
+    status, timeseries_df, error = job_state
+    if status == JobStatus.FAILED:
+        return jsonify({'status': status, 'error': error}), 500
+    if status != JobStatus.DONE:
+        return jsonify({'status': status}), 202
+
+    # same payload as /api/series, the page draws it the same way. The range comes from the
+    # history file while the stream reads the polled store, so the chart is not kept live
+    return series_response(timeseries_df, PlotOptions(request.args), SeriesTier.RAW, live=False)
+
+def warm_caches() -> None:
+    """Load what the default page needs into this process's caches, called in every server worker before it serves.
+
+    Missing data only means a cold first request, so failures are printed and not raised.
+    """
+    started = time.perf_counter()
+    try:
+        for data_key in (TimeseriesKeys.AMBIENT_TEMP, TimeseriesKeys.DOOR_STATE):
+            timeseries_layout_json(data_key)
+        load_header_info()
+        start_time, end_time = parse_view_window({})
+        plot_options = PlotOptions({})
+        load_series_window(start_time, end_time, tier=plot_options.tier, max_points=plot_options.max_points)
+    except Exception as exc:
+        print(f"[SERVER] Cache warmup skipped: {exc}")
+        return
+    print(f"[SERVER] Caches warmed in {time.perf_counter() - started:.3f}s.")
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # development server only, production runs the app under gunicorn with gunicorn.conf.py
+    app.run(debug=SERVER_DEBUG, threaded=True, host='0.0.0.0', port=5000)
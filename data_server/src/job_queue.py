@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""Background queue for time range ingestion jobs requested from the dashboard."""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Optional
+from src.constants import TimeseriesKeys, RANGE_JOB_WORKERS, RANGE_JOB_MAX_FINISHED
+import pandas as pd
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+
+# job states sit next to the request states in the state directory, both as json
+JOB_STATE_SUFFIX = ".job.json"
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class RangeJob:
+    """One ingestion of [start_time, end_time], shared by every request it was coalesced with."""
+
+    def __init__(self, start_time: datetime, end_time: datetime):
+        self.id = uuid.uuid4().hex
+        self.start_time = start_time
+        self.end_time = end_time
+        self.status = JobStatus.QUEUED
+        self.result_df: Optional[pd.DataFrame] = None
+        self.error: Optional[str] = None
+        self.finished_at: Optional[float] = None
+
+    def overlaps(self, start_time: datetime, end_time: datetime) -> bool:
+        return self.start_time <= end_time and start_time <= self.end_time
+
+    def covers(self, start_time: datetime, end_time: datetime) -> bool:
+        return self.start_time <= start_time and end_time <= self.end_time
+
+
+class RangeRequest:
+    """A single dashboard request, pointing at the job that produces its data.
+
+    The job is None when it runs in another server process, its state is then read from the state directory.
+    """
+
+    def __init__(self, job_id: str, job: Optional[RangeJob], start_time: datetime, end_time: datetime):
+        self.id = uuid.uuid4().hex
+        self.job_id = job_id
+        self.job = job
+        self.start_time = start_time
+        self.end_time = end_time
+        self.submitted_at = time.time()
+
+
+class RangeJobQueue:
+    """Runs range ingestions off the request threads and merges overlapping requests.
+
+    A request overlapping a job that has not started yet widens that job to cover
+    both ranges. A request inside the range of a running job waits on that job.
+    Anything else gets a new job.
+
+    Jobs run in the process that queued them. With a state directory shared by the
+    server processes, every job's status and range and every request's job are
+    published there, with each finished job's data as a parquet file. A request is
+    then also coalesced with a queued or running job of another process that covers
+    its range, checked and claimed under a lock file so two processes never start
+    the same range. Any process can answer a request's status polls and serve its
+    data once the job is done. Every job ingests into the data handler's one history
+    file, so the server processes take turns running them through a second lock file.
+    """
+
+    def __init__(
+        self,
+        run_job: Callable[[str, str], pd.DataFrame],
+        max_workers: int = RANGE_JOB_WORKERS,
+        max_finished: int = RANGE_JOB_MAX_FINISHED,
+        state_dir: Optional[str] = None,
+    ):
+        """Configure the queue.
+
+        Args:
+            run_job: ingests a range given as '%Y-%m-%dT%H:%M:%S' strings and returns its data.
+            max_workers: jobs run at once, the data handler writes one shared history file so keep this at 1.
+            max_finished: finished requests kept around for status polling.
+            state_dir: directory shared by the server processes for request and job states and job data, None keeps them in memory only.
+        """
+        self.run_job = run_job
+        self.max_finished = max_finished
+        self.state_dir = state_dir
+        if state_dir is not None:
+            os.makedirs(state_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="range-job")
+        self._lock = threading.Lock()
+        self._jobs: dict[str, RangeJob] = {}
+        self._requests: dict[str, RangeRequest] = {}
+
+    def _find_coalescable_job(self, start_time: datetime, end_time: datetime) -> Optional[RangeJob]:
+        for job in self._jobs.values():
+            if job.status == JobStatus.QUEUED and job.overlaps(start_time, end_time):
+                job.start_time = min(job.start_time, start_time)
+                job.end_time = max(job.end_time, end_time)
+                self._publish_job(job)
+                return job
+            if job.status == JobStatus.RUNNING and job.covers(start_time, end_time):
+                return job
+        return None
+
+    def _find_published_job(self, start_time: datetime, end_time: datetime) -> Optional[str]:
+        """Id of another process's queued or running job covering the range, its range can only grow."""
+        if self.state_dir is None:
+            return None
+        for file_name in os.listdir(self.state_dir):
+            if not file_name.endswith(JOB_STATE_SUFFIX):
+                continue
+            job_id = file_name[:-len(JOB_STATE_SUFFIX)]
+            if job_id in self._jobs:
+                continue
+            job_state = self._read_state(self._job_state_path(job_id))
+            if (
+                job_state is not None
+                and job_state["status"] in (JobStatus.QUEUED, JobStatus.RUNNING)
+                and _process_alive(job_state["pid"])
+                and datetime.fromisoformat(job_state["start_time"]) <= start_time
+                and end_time <= datetime.fromisoformat(job_state["end_time"])
+            ):
+                return job_id
+        return None
+
+    def submit(self, start_time: datetime, end_time: datetime) -> str:
+        """Queue a range request, reusing an in-flight job of any server process where possible.
+
+        Returns:
+            request id to poll with get().
+        """
+        # the claim lock is taken before the in-process lock, nothing takes them the other way round
+        with self._state_lock("claim"), self._lock:
+            job = self._find_coalescable_job(start_time, end_time)
+            job_id = job.id if job is not None else self._find_published_job(start_time, end_time)
+            if job_id is None:
+                job = RangeJob(start_time, end_time)
+                job_id = job.id
+                self._jobs[job.id] = job
+                # published before the claim lock is released, so other processes find it
+                self._publish_job(job)
+                self._executor.submit(self._run, job)
+            else:
+                print(f"[JOBS] Coalesced {start_time} - {end_time} into job {job_id}.")
+            range_request = RangeRequest(job_id, job, start_time, end_time)
+            self._requests[range_request.id] = range_request
+            self._publish_request(range_request)
+            self._forget_finished()
+        return range_request.id
+
+    @contextmanager
+    def _state_lock(self, name: str):
+        """Exclusive lock shared by the server processes, only this process's lock without a state directory."""
+        if self.state_dir is None:
+            yield
+            return
+        with open(os.path.join(self.state_dir, f"{name}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _run(self, job: RangeJob) -> None:
+        # one job at a time across the server processes, a queued job can still be widened meanwhile
+        with self._state_lock("run"):
+            self._run_locked(job)
+
+    def _run_locked(self, job: RangeJob) -> None:
+        with self._lock:
+            # the range is frozen once the job starts, later requests can no longer widen it
+            job.status = JobStatus.RUNNING
+            start_time, end_time = job.start_time, job.end_time
+            self._publish_job(job)
+        try:
+            result_df = self.run_job(start_time.strftime("%Y-%m-%dT%H:%M:%S"), end_time.strftime("%Y-%m-%dT%H:%M:%S"))
+            # the data handler overwrites its history file with every range, keep this job's own copy
+            self._save_result(job, result_df)
+            with self._lock:
+                job.result_df = result_df
+                job.status = JobStatus.DONE
+        except Exception as exc:  # reported to every request waiting on the job
+            with self._lock:
+                job.error = str(exc)
+                job.status = JobStatus.FAILED
+            print(f"[JOBS] Job {job.id} failed: {exc}")
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._publish_job(job)
+
+    def _request_state_path(self, request_id: str) -> str:
+        return os.path.join(self.state_dir, f"{request_id}.json")
+
+    def _job_state_path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f"{job_id}{JOB_STATE_SUFFIX}")
+
+    def _result_path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.parquet")
+
+    def _save_result(self, job: RangeJob, result_df: pd.DataFrame) -> None:
+        """Write a job's data for the other processes, before it is published as done."""
+        if self.state_dir is None:
+            return
+        result_path = self._result_path(job.id)
+        tmp_path = f"{result_path}.tmp"
+        result_df.to_parquet(tmp_path, engine="pyarrow", index=False)
+        os.replace(tmp_path, result_path)
+
+    def _write_state(self, state_path: str, state: dict) -> None:
+        """Write a state file, written then renamed so it is never half written."""
+        if self.state_dir is None:
+            return
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as state_file:
+            json.dump(state, state_file)
+        os.replace(tmp_path, state_path)
+
+    def _read_state(self, state_path: str) -> Optional[dict]:
+        try:
+            with open(state_path, "r", encoding="utf-8") as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return None
+
+    def _publish_request(self, range_request: RangeRequest) -> None:
+        if self.state_dir is None:
+            return
+        self._write_state(self._request_state_path(range_request.id), {
+            "job_id": range_request.job_id,
+            "start_time": range_request.start_time.isoformat(),
+            "end_time": range_request.end_time.isoformat(),
+        })
+
+    def _publish_job(self, job: RangeJob) -> None:
+        if self.state_dir is None:
+            return
+        self._write_state(self._job_state_path(job.id), {
+            "status": job.status,
+            "error": job.error,
+            "start_time": job.start_time.isoformat(),
+            "end_time": job.end_time.isoformat(),
+            "finished_at": job.finished_at,
+            # lets other processes tell a job lost with its process from one still running
+            "pid": os.getpid(),
+        })
+
+    def _published_job_ids(self) -> set[str]:
+        """Jobs referred to by any process's published requests."""
+        if self.state_dir is None:
+            return set()
+        job_ids = set()
+        for file_name in os.listdir(self.state_dir):
+            if file_name.endswith(".json") and not file_name.endswith(JOB_STATE_SUFFIX):
+                request_state = self._read_state(os.path.join(self.state_dir, file_name))
+                if request_state is not None:
+                    job_ids.add(request_state["job_id"])
+        return job_ids
+
+    def _finished_at(self, range_request: RangeRequest) -> Optional[float]:
+        """When a request's job finished, None while it is queued or running."""
+        if range_request.job is not None:
+            return range_request.job.finished_at
+        job_state = self._read_state(self._job_state_path(range_request.job_id))
+        # a job forgotten by its process, or lost with it, counts as finished when the request came in
+        if job_state is None or (job_state["finished_at"] is None and not _process_alive(job_state["pid"])):
+            return range_request.submitted_at
+        return job_state["finished_at"]
+
+    def _forget_finished(self) -> None:
+        finished_at = {
+            request_id: self._finished_at(range_request) for request_id, range_request in self._requests.items()
+        }
+        finished = [range_request for range_request in self._requests.values() if finished_at[range_request.id] is not None]
+        for range_request in sorted(finished, key=lambda range_request: finished_at[range_request.id])[:-self.max_finished]:
+            del self._requests[range_request.id]
+            self._remove_state_file(self._request_state_path(range_request.id))
+        # requests of other processes may still wait on a job of this one
+        live_job_ids = {range_request.job_id for range_request in self._requests.values()}
+        unreferenced_job_ids = [job_id for job_id, job in self._jobs.items() if job_id not in live_job_ids]
+        if unreferenced_job_ids:
+            live_job_ids |= self._published_job_ids()
+        for job_id in unreferenced_job_ids:
+            if job_id in live_job_ids:
+                continue
+            del self._jobs[job_id]
+            self._remove_state_file(self._job_state_path(job_id))
+            self._remove_state_file(self._result_path(job_id))
+
+    def _remove_state_file(self, path: str) -> None:
+        if self.state_dir is None:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def get(self, request_id: str) -> Optional[tuple[str, Optional[pd.DataFrame], Optional[str]]]:
+        """Status of a request.
+
+        Returns:
+            (status, data for the requested range once done, error if failed), None for unknown ids.
+        """
+        with self._lock:
+            range_request = self._requests.get(request_id)
+            if range_request is None or range_request.job is None:
+                job = None
+            else:
+                job = range_request.job
+                if job.status != JobStatus.DONE:
+                    return job.status, None, job.error
+                result_df = job.result_df
+        if job is None:
+            return self._get_published(request_id)
+        return JobStatus.DONE, _in_range(result_df, range_request.start_time, range_request.end_time), None
+
+    def _get_published(self, request_id: str) -> Optional[tuple[str, Optional[pd.DataFrame], Optional[str]]]:
+        """Status of a request whose job runs in another server process, read from the state directory."""
+        # ids come from the url, anything but a request id we issued is unknown
+        if self.state_dir is None or not request_id.isalnum():
+            return None
+        request_state = self._read_state(self._request_state_path(request_id))
+        if request_state is None:
+            return None
+        job_state = self._read_state(self._job_state_path(request_state["job_id"]))
+        if job_state is None:
+            # the owning process already forgot the job
+            return None
+        status = job_state["status"]
+        if status in (JobStatus.QUEUED, JobStatus.RUNNING) and not _process_alive(job_state["pid"]):
+            return JobStatus.FAILED, None, "the server process running this job exited"
+        if status != JobStatus.DONE:
+            return status, None, job_state["error"]
+        try:
+            result_df = pd.read_parquet(self._result_path(request_state["job_id"]))
+        except FileNotFoundError:
+            return None
+        start_time = datetime.fromisoformat(request_state["start_time"])
+        end_time = datetime.fromisoformat(request_state["end_time"])
+        return JobStatus.DONE, _in_range(result_df, start_time, end_time), None
+
+
+def _in_range(result_df: pd.DataFrame, start_time: datetime, end_time: datetime) -> pd.DataFrame:
+    """Rows of a job's data inside one request's range, the job may cover a wider one. Stored timestamps are UTC."""
+    start_time = pd.Timestamp(start_time, tz="UTC")
+    end_time = pd.Timestamp(end_time, tz="UTC")
+    ambient_in_range = result_df[TimeseriesKeys.AMBIENT_TEMP_TIMESTAMP].between(start_time, end_time)
+    door_in_range = result_df[TimeseriesKeys.DOOR_STATE_TIMESTAMP].between(start_time, end_time)
+    return result_df[ambient_in_range | door_in_range]
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
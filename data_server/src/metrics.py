@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Process wide timers and counters of the server, rendered in the Prometheus text format.
+
+The data handler image keeps its own metrics module, which also logs json lines and takes
+snapshots for the run summary. Only what the server exports lives here.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Any, Iterator
+from src.constants import METRICS_NAMESPACE
+import threading
+import time
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Metrics:
+    """Summed timings and counters, keyed on a metric name and a few labels.
+
+    Recording is a dict update under a lock, cheap enough to leave on around every
+    request and stage. A timing keeps a count and a total, the scraper derives rates
+    and mean latencies from those.
+    """
+
+    def __init__(self, namespace: str = METRICS_NAMESPACE) -> None:
+        """Start with nothing recorded.
+
+        Args:
+            namespace: prefix of every exported metric name.
+        """
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._timings: dict[tuple[str, Labels], list[float]] = {}
+        self._counters: dict[tuple[str, Labels], float] = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict[str, Any]) -> tuple[str, Labels]:
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        """Record one timing of a stage, e.g. a fetch from one endpoint."""
+        key = self._key(name, labels)
+        with self._lock:
+            timing = self._timings.setdefault(key, [0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Time a block, recorded whether or not it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def count(self, name: str, amount: float = 1, **labels: Any) -> None:
+        """Add to a counter, e.g. bytes received or rows written."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render_prometheus(self) -> str:
+        """Everything recorded so far in the Prometheus text exposition format.
+
+        Timings are summaries without quantiles (_count and _sum), counters end in _total.
+        """
+        with self._lock:
+            timings = sorted((key, list(timing)) for key, timing in self._timings.items())
+            counters = sorted(self._counters.items())
+        lines = []
+        previous_name = None
+        for (name, labels), (count, total) in timings:
+            metric = f"{self.namespace}_{name}_seconds"
+            if name != previous_name:
+                lines.append(f"# TYPE {metric} summary")
+                previous_name = name
+            lines.append(f"{metric}_count{_format_labels(labels)} {int(count)}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {total:.6f}")
+        previous_name = None
+        for (name, labels), value in counters:
+            metric = f"{self.namespace}_{name}_total"
+            if name != previous_name:
+                lines.append(f"# TYPE {metric} counter")
+                previous_name = name
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{label}="{_escape_label_value(value)}"' for label, value in labels) + "}"
+
+
+# shared by everything in the process
+metrics = Metrics()
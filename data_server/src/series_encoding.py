@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Compact encodings of plotted series for the data endpoints."""
+from src.data_cache import path_signature
+import pyarrow as pa
+import numpy as np
+import base64
+import hashlib
+
+ARROW_STREAM_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+
+def epoch_millis(timestamps: np.ndarray) -> np.ndarray:
+    """Naive UTC datetime64 timestamps as int64 milliseconds since the epoch."""
+    return timestamps.astype("datetime64[ms]").astype(np.int64)
+
+def encode_series_base64(timestamps: np.ndarray, values: np.ndarray) -> dict:
+    """One series as base64 packed little-endian arrays.
+
+    Returns:
+        {'length', 'x': int64 epoch-ms, 'y': float64 values}, decoded in the browser with typed array views.
+    """
+    return {
+        "length": len(values),
+        "x": base64.b64encode(epoch_millis(timestamps).astype("<i8").tobytes()).decode("ascii"),
+        "y": base64.b64encode(np.asarray(values, dtype="<f8").tobytes()).decode("ascii"),
+    }
+
+def encode_series_arrow(series: dict[str, tuple[np.ndarray, np.ndarray]]) -> bytes:
+    """Every series as one Arrow IPC stream in long form, columns series, timestamp and value."""
+    names = list(series)
+    lengths = [len(series[name][1]) for name in names]
+    table = pa.table({
+        "series": pa.DictionaryArray.from_arrays(
+            pa.array(np.repeat(np.arange(len(names), dtype=np.int32), lengths)), pa.array(names, pa.string())
+        ),
+        "timestamp": pa.array(
+            np.concatenate([epoch_millis(series[name][0]) for name in names]) if names else np.empty(0, np.int64),
+            pa.timestamp("ms", tz="UTC"),
+        ),
+        "value": pa.array(
+            np.concatenate([series[name][1] for name in names]) if names else np.empty(0, np.float64),
+            pa.float64(),
+        ),
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def series_etag(data_path: str, *query) -> str:
+    """Validator for a series response, changes with the data on disk or with the query."""
+    return hashlib.sha1(repr((path_signature(data_path), query)).encode()).hexdigest()
@@ -2,26 +2,95 @@
 """"Helper functions for data visualization and handling."""
 import plotly.graph_objects as go
 from plotly.graph_objects import Figure
-from src.constants import TimeseriesKeys
-from constants import LOCAL_TIME_SERIES_STORAGE_FILE, LOCAL_HISTORY_TIME_SERIES_STORAGE_FILE, HOST_BASE_DIR
+from plotly.utils import PlotlyJSONEncoder
+from functools import lru_cache
+from src.constants import TimeseriesKeys, DownsampleMode, SeriesTier, SeriesKeys, SensorKinds
+from src.downsampling import downsample, point_budget
+from src.data_cache import frame_cache, path_signature
+from src.metrics import metrics
+from src.data_query import query_readings, query_last_readings, query_dimension, query_rollup
+from src.change_events import step_ms_for_window, step_times, state_at, state_duration_ms
+from constants import (
+    LOCAL_TIME_SERIES_STORAGE_DIR,
+    LOCAL_VEHICLE_DIMENSION_FILE,
+    LOCAL_SENSOR_DIMENSION_FILE,
+    LOCAL_ROLLUP_DIR,
+    ROLLUP_PARTITION_FORMATS,
+    ROLLUP_COVERAGE_FILE,
+    DOOR_OPEN_STATE,
+    DOOR_STEP_MIN_MS,
+    RAW_MAX_SPAN_DAYS,
+    HOURLY_MAX_SPAN_DAYS,
+    LOCAL_HISTORY_TIME_SERIES_STORAGE_FILE,
+    HOST_BASE_DIR,
+    DATA_HANDLER_WORKER_URL,
+    DATA_HANDLER_WORKER_TIMEOUT_S,
+    DATA_HANDLER_WORKER_TOKEN_LOCATION,
+)
+import httpx
+import base64
+import json
 import pandas as pd
+import numpy as np
 import os
 import subprocess
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 
 
-def load_range_data(start_time: str, end_time: str) -> pd.DataFrame:
-    """Call the data handler script to update local data based on time range."""
-    
-    def _convert_to_expected_format(time_str: str) -> str:
-        """Convert time string to expected format."""
-        new_time = datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%S")
-        return new_time.strftime("%Y-%m-%d %H:%M")
+# raw window frames carry the epoch millis of their last stored reading per series under this attribute
+LIVE_CURSORS_ATTR = "live_cursors"
 
-    updated_start_time = _convert_to_expected_format(start_time)
-    updated_end_time = _convert_to_expected_format(end_time)
+# keep-alive client for the data handler worker, shared across the requests of one process.
+# Opened on first use, so gunicorn workers forked from the preloaded master never share its connections.
+_worker_client: Optional[httpx.Client] = None
+_worker_client_pid: Optional[int] = None
+_worker_client_lock = threading.Lock()
+
+def _worker_auth_headers() -> dict[str, str]:
+    """Bearer token header for the worker's job routes, none if the token file is missing."""
+    try:
+        with open(DATA_HANDLER_WORKER_TOKEN_LOCATION, "r", encoding="ASCII") as token:
+            return {"Authorization": f"Bearer {token.read().strip()}"}
+    except FileNotFoundError:
+        print(f"[DATAWAREHOUSE] No worker token at {DATA_HANDLER_WORKER_TOKEN_LOCATION}, the worker will refuse jobs.")
+        return {}
+
+def _get_worker_client() -> httpx.Client:
+    """The worker client of this process, a forked process opens its own."""
+    global _worker_client, _worker_client_pid
+    with _worker_client_lock:
+        if _worker_client is None or _worker_client_pid != os.getpid():
+            _worker_client = httpx.Client(timeout=DATA_HANDLER_WORKER_TIMEOUT_S, headers=_worker_auth_headers())
+            _worker_client_pid = os.getpid()
+        return _worker_client
+
+def request_worker_range_ingestion(start_time: str, end_time: str) -> bool:
+    """Ask the running data handler worker to ingest a time range and wait for it.
+
+    Returns:
+        False if the worker is unreachable, so the caller can fall back to the docker script.
+    """
+    try:
+        response = _get_worker_client().post(
+            f"{DATA_HANDLER_WORKER_URL}/jobs",
+            json={"start_time": start_time, "end_time": end_time, "wait": True},
+        )
+        response.raise_for_status()
+    except httpx.RequestError as request_error:
+        print(f"[DATAWAREHOUSE] Data handler worker unreachable, falling back to docker run: {request_error}")
+        return False
+    job = response.json()
+    if job["status"] != "done":
+        raise RuntimeError(f"[DATAWAREHOUSE] Worker job {job['id']} ended as {job['status']}: {job['error']}")
+    print(f"[DATAWAREHOUSE] Worker job {job['id']} finished in {job['timings'].get('total', 0.0):.3f}s.")
+    return True
+
+def run_range_ingestion_script(start_time: str, end_time: str) -> None:
+    """Build and run the data handler container once to ingest a time range."""
     update_data_command = [
-        f"bash /data_handler/update_data.sh '{updated_start_time}' '{updated_end_time}' '{HOST_BASE_DIR}'"
+        f"bash /data_handler/update_data.sh '{start_time}' '{end_time}' '{HOST_BASE_DIR}'"
     ]
     # run the update command
     try:
@@ -30,91 +99,485 @@ def load_range_data(start_time: str, end_time: str) -> pd.DataFrame:
     except subprocess.CalledProcessError as e:
         print(f"[DATAWAREHOUSE] Error updating data warehouse: {e.stderr}")
         raise
+
+def load_range_data(start_time: str, end_time: str) -> pd.DataFrame:
+    """Call the data handler script to update local data based on time range."""
     
-    # load the updated data
-    df = load_data(LOCAL_HISTORY_TIME_SERIES_STORAGE_FILE)
-     # *** ADD THESE NEW DEBUG PRINTS ***
-    print(f"--- DATA CONTENT CHECK (Source: {LOCAL_HISTORY_TIME_SERIES_STORAGE_FILE}) ---")
-    
-    # Check Temperature Data
-    temp_data_series = df[TimeseriesKeys.AMBIENT_TEMP]
-    print(f"[TEMP DEBUG] Non-null count: {temp_data_series.count()} / {len(temp_data_series)}")
-    print(f"[TEMP DEBUG] Value stats: Min={temp_data_series.min()}, Max={temp_data_series.max()}")
-    
-    # Check Door State Data
-    door_data_series = df[TimeseriesKeys.DOOR_STATE]
-    print(f"[DOOR DEBUG] Non-null count: {door_data_series.count()} / {len(door_data_series)}")
-    print(f"[DOOR DEBUG] Value stats: Min={door_data_series.min()}, Max={door_data_series.max()}")
-    
-    print("-------------------------------------------------")
-    return load_data(LOCAL_HISTORY_TIME_SERIES_STORAGE_FILE)
+    def _convert_to_expected_format(time_str: str) -> str:
+        """Convert time string to expected format."""
+        new_time = datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%S")
+        return new_time.strftime("%Y-%m-%d %H:%M")
+
+    updated_start_time = _convert_to_expected_format(start_time)
+    updated_end_time = _convert_to_expected_format(end_time)
+    if not request_worker_range_ingestion(updated_start_time, updated_end_time):
+        run_range_ingestion_script(updated_start_time, updated_end_time)
     
-def clean_str(text: str) -> str:
-    """Removes artifacts from json serialization."""
-    chars_to_remove = ", '\"[]"
-    translation_table = str.maketrans('', '', chars_to_remove)
-    return text.translate(translation_table)
-
-def parse_header_info(timeseries_df: pd.DataFrame) -> dict:
-    """Parse some header info from the timeseries data."""
+    # load the updated data, only the plotted columns of the requested window
+    df = load_timeseries_window(
+        datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%S"),
+        datetime.strptime(end_time, "%Y-%m-%dT%H:%M:%S"),
+        data_path=LOCAL_HISTORY_TIME_SERIES_STORAGE_FILE,
+    )
+    # non-null readings of each kind, watched on /metrics rather than printed per request
+    metrics.count("range_readings_loaded", int(df[TimeseriesKeys.AMBIENT_TEMP].count()), kind=SensorKinds.TEMPERATURE)
+    metrics.count("range_readings_loaded", int(df[TimeseriesKeys.DOOR_STATE].count()), kind=SensorKinds.DOOR)
+    return df
     
-    # get vehicle data
+def load_vehicle_dimension() -> pd.DataFrame:
+    """Vehicle dimension table, cached until the handler rewrites it."""
+    columns = ["vehicle_id", "name", "make", "model", "year", "gateway_sn"]
+    return frame_cache.get(LOCAL_VEHICLE_DIMENSION_FILE, lambda: query_dimension(LOCAL_VEHICLE_DIMENSION_FILE, columns))
+
+def load_sensor_dimension() -> pd.DataFrame:
+    """Sensor dimension table, cached until the handler rewrites it."""
+    columns = ["sensor_id", "vehicle_id", "name", "mac", "kind"]
+    return frame_cache.get(LOCAL_SENSOR_DIMENSION_FILE, lambda: query_dimension(LOCAL_SENSOR_DIMENSION_FILE, columns))
+
+def parse_header_info(vehicles_df: pd.DataFrame, sensors_df: pd.DataFrame, vehicle_id: Optional[str] = None) -> dict:
+    """Header info of a vehicle and its sensors, looked up in the dimension tables.
+
+    Args:
+        vehicles_df: vehicle dimension.
+        sensors_df: sensor dimension.
+        vehicle_id: vehicle to describe, the first known vehicle if not given.
+    """
+    if vehicle_id is None and len(vehicles_df):
+        vehicle_id = vehicles_df["vehicle_id"].iloc[0]
+    vehicle_rows = vehicles_df[vehicles_df["vehicle_id"] == str(vehicle_id)]
+    if vehicle_rows.empty:
+        return {}
+    vehicle = vehicle_rows.iloc[0]
     header_info = {
-    TimeseriesKeys.MAKE: timeseries_df[TimeseriesKeys.MAKE].iloc[0],
-    TimeseriesKeys.MODEL: timeseries_df[TimeseriesKeys.MODEL].iloc[0],
-    TimeseriesKeys.YEAR: timeseries_df[TimeseriesKeys.YEAR].iloc[0],
+        TimeseriesKeys.MAKE: vehicle["make"],
+        TimeseriesKeys.MODEL: vehicle["model"],
+        TimeseriesKeys.YEAR: vehicle["year"],
+        "Sensors": {},
     }
-    # get sensor data
-    num_sensors = sum(1 for col in timeseries_df.columns if "Sensor" in col and "ID" in col)
-    header_info["Sensors"] = {}
-    for i in range(num_sensors):
-        sensor_dict={
-            "Sensor ID": clean_str(str(timeseries_df[f"Sensor {i} ID"].iloc[0])),
-            "Serial Number": clean_str(timeseries_df[f"Sensor {i} Name"].iloc[0]),
-            "MAC Address": clean_str(timeseries_df[f"Sensor {i} MAC"].iloc[0]),
+    for _, sensor in sensors_df[sensors_df["vehicle_id"] == str(vehicle_id)].sort_values("sensor_id").iterrows():
+        sensor_label = SensorKinds.LABELS.get(sensor["kind"], sensor["kind"])
+        # a second sensor of the same kind is told apart by its id
+        if sensor_label in header_info["Sensors"]:
+            sensor_label = f"{sensor_label} {sensor['sensor_id']}"
+        header_info["Sensors"][sensor_label] = {
+            "Sensor ID": str(sensor["sensor_id"]),
+            "Serial Number": sensor["name"],
+            "MAC Address": sensor["mac"],
         }
-        header_info["Sensors"][clean_str(timeseries_df[f"Sensor {i} Type"].iloc[0])] = sensor_dict
-        
     return header_info
 
-def load_data(data_path: str = LOCAL_TIME_SERIES_STORAGE_FILE) -> pd.DataFrame:
-    """Get the locally stored timeseries data from fetch data events."""
-    timeseries_df = pd.read_parquet(data_path)
-    
-    # ensure correct dtypes
-    timeseries_df[TimeseriesKeys.AMBIENT_TEMP_TIMESTAMP] = pd.to_datetime(timeseries_df[TimeseriesKeys.AMBIENT_TEMP_TIMESTAMP])
-    timeseries_df[TimeseriesKeys.DOOR_STATE_TIMESTAMP] = pd.to_datetime(timeseries_df[TimeseriesKeys.DOOR_STATE_TIMESTAMP])
-    timeseries_df[TimeseriesKeys.AMBIENT_TEMP] = pd.to_numeric(timeseries_df[TimeseriesKeys.AMBIENT_TEMP], errors='coerce')
-    timeseries_df[TimeseriesKeys.DOOR_STATE] = pd.to_numeric(timeseries_df[TimeseriesKeys.DOOR_STATE], errors='coerce')
-
-    print("[DATAWAREHOUSE] Loading timeseries data...")
-    return timeseries_df
-
-def plot_timeseries(timeseries_df: pd.DataFrame, data_key: str, timestamp_key: str) -> Figure:
-    """Plot timeseries data onto interactive plot."""
-
-    # slice appropriate data
-    df_plot = timeseries_df[[timestamp_key, data_key]].copy()
-    df_plot = df_plot.set_index(timestamp_key)
-    df_aggregated = df_plot.groupby(level=0)[data_key].mean().reset_index()
-    
-    # create the plot using the simple names
-    x_data = df_aggregated[timestamp_key].tolist()
-    y_data = df_aggregated[data_key].tolist()
-    trace = go.Scatter(
-                  x=x_data,
-                  y=y_data,
-                  mode='lines+markers',
-                  name=data_key,
+def readings_to_plot_frame(readings_df: pd.DataFrame, sensors_df: pd.DataFrame) -> pd.DataFrame:
+    """Readings in the plotted column layout, each kind of reading in its own value and timestamp columns.
+
+    A row holds a single reading, the columns of the other kind are null on it.
+    """
+    kinds = readings_df["sensor_id"].map(dict(zip(sensors_df["sensor_id"], sensors_df["kind"])))
+    is_temperature = (kinds == SensorKinds.TEMPERATURE).to_numpy()
+    is_door = (kinds == SensorKinds.DOOR).to_numpy()
+    return pd.DataFrame({
+        TimeseriesKeys.AMBIENT_TEMP_TIMESTAMP: readings_df["ts"].where(is_temperature),
+        TimeseriesKeys.AMBIENT_TEMP: readings_df["value"].where(is_temperature),
+        TimeseriesKeys.DOOR_STATE_TIMESTAMP: readings_df["ts"].where(is_door),
+        TimeseriesKeys.DOOR_STATE: readings_df["value"].where(is_door),
+    })
+
+def load_data(data_path: str = LOCAL_TIME_SERIES_STORAGE_DIR) -> pd.DataFrame:
+    """Get every locally stored reading in the plotted layout, cached until the data changes on disk.
+
+    The returned frame is shared with other requests, do not modify it in place.
+    """
+
+    def _load_all() -> pd.DataFrame:
+        print("[DATAWAREHOUSE] Loading timeseries data...")
+        return readings_to_plot_frame(query_readings(data_path), load_sensor_dimension())
+
+    return frame_cache.get(data_path, _load_all)
+
+def _epoch_millis(naive_utc: datetime) -> int:
+    return int(naive_utc.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+def _event_window_end_ms(end_time: datetime) -> int:
+    """A change event's state is only known up to now, a window reaching into the future stops there.
+
+    Now is rounded down to DOOR_STEP_MIN_MS, so a series rebuilt up to it, and the cache
+    key and validator that include it, change once a step rather than on every request.
+    """
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+    return min(_epoch_millis(end_time), now_ms - now_ms % DOOR_STEP_MIN_MS)
+
+def timeseries_window_version(end_time: datetime) -> tuple:
+    """What a raw window's frame depends on besides its readings: the sensor dimension and the time door state is rebuilt up to."""
+    return path_signature(LOCAL_SENSOR_DIMENSION_FILE), _event_window_end_ms(end_time)
+
+def _change_event_sensor_ids(sensors_df: pd.DataFrame, sensor_ids: Optional[list[int]] = None) -> list[int]:
+    """Sensors stored as change events, optionally only those among sensor_ids."""
+    event_ids = sensors_df.loc[sensors_df["kind"].isin(SensorKinds.CHANGE_EVENTS), "sensor_id"]
+    if sensor_ids is not None:
+        event_ids = event_ids[event_ids.isin(sensor_ids)]
+    return event_ids.tolist()
+
+def _events_with_prior_state(
+    events_df: pd.DataFrame, data_path: str, start_time: datetime, event_ids: list[int], vehicle_id: Optional[str],
+) -> pd.DataFrame:
+    """Change events of a window preceded by each sensor's last event before it, which holds the state at the window start."""
+    prior_df = query_last_readings(data_path, start_time, event_ids, vehicle_id=vehicle_id)
+    return pd.concat([prior_df, events_df], ignore_index=True).sort_values("ts", kind="stable")
+
+def _event_arrays(events_df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    return (
+        events_df["ts"].to_numpy(dtype="datetime64[ms]").astype(np.int64),
+        events_df["value"].to_numpy(dtype=np.float64),
     )
 
-    # create the figure
+def _last_stored_ms(readings_df: pd.DataFrame, default_ms: int) -> int:
+    """Epoch millis of the newest reading, default_ms if there is none."""
+    if readings_df.empty:
+        return default_ms
+    return int(_event_arrays(readings_df)[0].max())
+
+def rebuild_step_readings(events_df: pd.DataFrame, start_ms: int, end_ms: int, step_ms: int) -> pd.DataFrame:
+    """Step series sampled from change events, one reading per sensor and sample time.
+
+    Samples fall on multiples of step_ms plus the exact time of every event inside the
+    window, so transitions are drawn where they happened at any step.
+
+    Args:
+        events_df: time ordered sensor_id, ts and value of the change events, with the last one before the window.
+        start_ms: window start.
+        end_ms: window end.
+        step_ms: resolution of the rebuilt series.
+    Returns:
+        sensor_id, ts and value readings, none before a sensor's first event.
+    """
+    event_ms, _ = _event_arrays(events_df)
+    in_window = (event_ms >= start_ms) & (event_ms <= end_ms)
+    sample_ms = np.union1d(step_times(start_ms, end_ms, step_ms), event_ms[in_window])
+    sensor_ids, sample_values = [], []
+    for sensor_id, sensor_events in events_df.groupby("sensor_id", sort=False):
+        sensor_event_ms, sensor_event_values = _event_arrays(sensor_events)
+        sensor_ids.append(np.full(len(sample_ms), sensor_id, dtype=np.int64))
+        sample_values.append(state_at(sensor_event_ms, sensor_event_values, sample_ms))
+    if not sensor_ids:
+        return events_df.iloc[:0]
+    num_sensors = len(sensor_ids)
+    readings_df = pd.DataFrame({
+        "sensor_id": np.concatenate(sensor_ids),
+        "ts": pd.to_datetime(np.tile(sample_ms, num_sensors), unit="ms", utc=True).as_unit("ms"),
+        "value": np.concatenate(sample_values),
+    })
+    return readings_df.dropna(subset=["value"])
+
+def load_timeseries_window(
+    start_time: datetime,
+    end_time: datetime,
+    vehicle_id: Optional[str] = None,
+    data_path: str = LOCAL_TIME_SERIES_STORAGE_DIR,
+    max_points: Optional[int] = None,
+) -> pd.DataFrame:
+    """Get the readings of a time window in the plotted layout, cached until the data changes on disk.
+
+    Door state is stored as change events and comes back as a step series with about
+    max_points samples over the window. The returned frame is shared with other
+    requests, do not modify it in place.
+    """
+    max_points = max_points or point_budget()
+    # computed once, the frame is rebuilt up to the same time its cache key names
+    window_version = timeseries_window_version(end_time)
+    end_ms = window_version[1]
+
+    def _load_window() -> pd.DataFrame:
+        sensors_df = load_sensor_dimension()
+        # a vehicle is a set of sensor ids, so one filter works on the dataset and the single history file
+        sensor_ids = None
+        if vehicle_id is not None:
+            sensor_ids = sensors_df.loc[sensors_df["vehicle_id"] == str(vehicle_id), "sensor_id"].tolist()
+        readings_df = query_readings(data_path, start_time, end_time, sensor_ids=sensor_ids, vehicle_id=vehicle_id)
+        event_ids = _change_event_sensor_ids(sensors_df, sensor_ids)
+        start_ms = _epoch_millis(start_time)
+        # the rebuilt door samples run up to now, live updates go on from the last stored readings instead
+        live_cursors = {SeriesKeys.TEMPERATURE: _last_stored_ms(readings_df, start_ms), SeriesKeys.DOOR_STATE: start_ms}
+        if event_ids:
+            is_event = readings_df["sensor_id"].isin(event_ids).to_numpy()
+            events_df = _events_with_prior_state(readings_df[is_event], data_path, start_time, event_ids, vehicle_id)
+            live_cursors[SeriesKeys.TEMPERATURE] = _last_stored_ms(readings_df[~is_event], start_ms)
+            live_cursors[SeriesKeys.DOOR_STATE] = _last_stored_ms(events_df, start_ms)
+            step_readings_df = rebuild_step_readings(events_df, start_ms, end_ms, step_ms_for_window(start_ms, end_ms, max_points))
+            readings_df = pd.concat([readings_df[~is_event], step_readings_df], ignore_index=True)
+        timeseries_df = readings_to_plot_frame(readings_df, sensors_df)
+        timeseries_df.attrs[LIVE_CURSORS_ATTR] = live_cursors
+        # values and timestamps come typed from the scan, nothing left to parse
+        print(f"[DATAWAREHOUSE] Loaded {len(timeseries_df)} readings for {start_time} - {end_time}.")
+        return timeseries_df
+
+    return frame_cache.get(data_path, _load_window, query_key=(start_time, end_time, vehicle_id, max_points, window_version))
+
+def load_door_open_durations(
+    start_time: datetime,
+    end_time: datetime,
+    vehicle_id: Optional[str] = None,
+    data_path: str = LOCAL_TIME_SERIES_STORAGE_DIR,
+) -> pd.DataFrame:
+    """How long each door sensor was open during a window, from its change events alone.
+
+    Returns:
+        sensor_id, vehicle_id, open_ms and observed_ms per door sensor, observed_ms
+        being the part of the window its state was known.
+    """
+    sensors_df = load_sensor_dimension()
+    door_sensors_df = sensors_df[sensors_df["kind"] == SensorKinds.DOOR]
+    if vehicle_id is not None:
+        door_sensors_df = door_sensors_df[door_sensors_df["vehicle_id"] == str(vehicle_id)]
+    door_ids = door_sensors_df["sensor_id"].tolist()
+    durations_df = pd.DataFrame({
+        "sensor_id": door_sensors_df["sensor_id"].to_numpy(dtype=np.int64),
+        "vehicle_id": door_sensors_df["vehicle_id"].to_numpy(),
+        "open_ms": 0,
+        "observed_ms": 0,
+    })
+    if not door_ids:
+        return durations_df
+    events_df = query_readings(data_path, start_time, end_time, sensor_ids=door_ids, vehicle_id=vehicle_id)
+    events_df = _events_with_prior_state(events_df, data_path, start_time, door_ids, vehicle_id)
+    start_ms, end_ms = _epoch_millis(start_time), _event_window_end_ms(end_time)
+    durations = {
+        sensor_id: state_duration_ms(*_event_arrays(sensor_events), start_ms, end_ms, DOOR_OPEN_STATE)
+        for sensor_id, sensor_events in events_df.groupby("sensor_id", sort=False)
+    }
+    durations_df["open_ms"] = [durations.get(sensor_id, (0, 0))[0] for sensor_id in door_ids]
+    durations_df["observed_ms"] = [durations.get(sensor_id, (0, 0))[1] for sensor_id in door_ids]
+    return durations_df
+
+def load_readings_since(
+    temperature_since_ms: int,
+    door_since_ms: int,
+    vehicle_id: Optional[str] = None,
+    data_path: str = LOCAL_TIME_SERIES_STORAGE_DIR,
+) -> pd.DataFrame:
+    """Readings newer than the last ones a live chart already has, in the plotted layout.
+
+    Only partitions from the older cursor's date on are scanned, so a live chart's
+    update reads a few small files. Door state comes as its stored change events,
+    which extend a step ('hv') line drawn from the rebuilt series correctly.
+
+    Args:
+        temperature_since_ms: epoch millis of the chart's last temperature point.
+        door_since_ms: epoch millis of the chart's last door state point.
+    Returns:
+        the readings after each kind's cursor, not cached since every cursor is different.
+    """
+    sensors_df = load_sensor_dimension()
+    sensor_ids = None
+    if vehicle_id is not None:
+        sensor_ids = sensors_df.loc[sensors_df["vehicle_id"] == str(vehicle_id), "sensor_id"].tolist()
+    start_time = datetime.fromtimestamp(min(temperature_since_ms, door_since_ms) / 1000, tz=timezone.utc).replace(tzinfo=None)
+    readings_df = query_readings(data_path, start_time, sensor_ids=sensor_ids, vehicle_id=vehicle_id)
+    kinds = readings_df["sensor_id"].map(dict(zip(sensors_df["sensor_id"], sensors_df["kind"])))
+    since_ms = np.where((kinds == SensorKinds.DOOR).to_numpy(), door_since_ms, temperature_since_ms)
+    ts_ms = pd.to_datetime(readings_df["ts"], utc=True).to_numpy(dtype="datetime64[ms]").astype(np.int64)
+    return readings_to_plot_frame(readings_df[ts_ms > since_ms], sensors_df)
+
+def pick_series_tier(
+    start_time: datetime, end_time: datetime, requested: str = SeriesTier.AUTO, rollup_dir: str = LOCAL_ROLLUP_DIR,
+) -> str:
+    """Raw rows for short spans, rollups for longer ones, so long views read a bounded number of rows.
+
+    A window starting before the rollups cover every raw reading is served raw, the
+    tiers would leave out the readings stored before them.
+    """
+    span = end_time - start_time
+    if requested != SeriesTier.AUTO:
+        tier = requested
+    elif span <= timedelta(days=RAW_MAX_SPAN_DAYS):
+        tier = SeriesTier.RAW
+    else:
+        tier = SeriesTier.HOURLY if span <= timedelta(days=HOURLY_MAX_SPAN_DAYS) else SeriesTier.DAILY
+    if tier == SeriesTier.RAW:
+        return tier
+    covers_from_ms = rollup_coverage_ms(rollup_dir)
+    # until the handler has written a tier the raw rows are all there is
+    if covers_from_ms is None or not os.path.isdir(rollup_path(tier, rollup_dir)):
+        return SeriesTier.RAW
+    start_ms = int(start_time.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    return tier if start_ms >= covers_from_ms else SeriesTier.RAW
+
+def rollup_coverage_ms(rollup_dir: str = LOCAL_ROLLUP_DIR) -> Optional[int]:
+    """Epoch millis from which the rollup tiers hold every raw reading, None until the handler wrote them."""
+    try:
+        with open(os.path.join(rollup_dir, ROLLUP_COVERAGE_FILE), "r", encoding="utf-8") as coverage_file:
+            return int(json.load(coverage_file)["from_ms"])
+    except FileNotFoundError:
+        return None
+
+def rollup_path(tier: str, rollup_dir: str = LOCAL_ROLLUP_DIR) -> str:
+    return os.path.join(rollup_dir, tier)
+
+def load_rollup_window(
+    tier: str,
+    start_time: datetime,
+    end_time: datetime,
+    vehicle_id: Optional[str] = None,
+    rollup_dir: str = LOCAL_ROLLUP_DIR,
+) -> pd.DataFrame:
+    """Get a rollup tier shaped like the plotted raw columns, one row per bucket across vehicles.
+
+    Temperature is the count weighted mean with its min and max, door state is the
+    fraction of the bucket the door was closed, matching the 'doorClosed' raw values.
+    The returned frame is shared with other requests, do not modify it in place.
+    """
+    data_path = rollup_path(tier, rollup_dir)
+
+    def _load_rollup() -> pd.DataFrame:
+        rollup_df = query_rollup(data_path, ROLLUP_PARTITION_FORMATS[tier], start_time, end_time, vehicle_id)
+        buckets = rollup_df.groupby("bucket_start_ms").agg(
+            temp_min=("temp_min", "min"),
+            temp_max=("temp_max", "max"),
+            temp_sum=("temp_sum", "sum"),
+            temp_count=("temp_count", "sum"),
+            door_open_count=("door_open_count", "sum"),
+            door_open_ms=("door_open_ms", "sum"),
+            door_observed_ms=("door_observed_ms", "sum"),
+        )
+        bucket_starts = pd.to_datetime(buckets.index.to_numpy(), unit="ms", utc=True).as_unit("ms")
+        timeseries_df = pd.DataFrame({
+            TimeseriesKeys.AMBIENT_TEMP_TIMESTAMP: bucket_starts,
+            TimeseriesKeys.AMBIENT_TEMP: (buckets["temp_sum"] / buckets["temp_count"].replace(0, np.nan)).to_numpy(),
+            TimeseriesKeys.AMBIENT_TEMP_MIN: buckets["temp_min"].to_numpy(),
+            TimeseriesKeys.AMBIENT_TEMP_MAX: buckets["temp_max"].to_numpy(),
+            TimeseriesKeys.DOOR_STATE_TIMESTAMP: bucket_starts,
+            TimeseriesKeys.DOOR_STATE: (1 - buckets["door_open_ms"] / buckets["door_observed_ms"].replace(0, np.nan)).to_numpy(),
+            TimeseriesKeys.DOOR_OPEN_COUNT: buckets["door_open_count"].to_numpy(),
+        })
+        print(f"[DATAWAREHOUSE] Loaded {len(timeseries_df)} {tier} buckets for {start_time} - {end_time}.")
+        return timeseries_df
+
+    return frame_cache.get(data_path, _load_rollup, query_key=(start_time, end_time, vehicle_id))
+
+def load_series_window(
+    start_time: datetime,
+    end_time: datetime,
+    vehicle_id: Optional[str] = None,
+    tier: str = SeriesTier.AUTO,
+    max_points: Optional[int] = None,
+) -> tuple[pd.DataFrame, str]:
+    """Get the plotted columns of a window from raw rows or a rollup tier.
+
+    Args:
+        max_points: point budget, sets the resolution door state is rebuilt at from raw change events.
+    Returns:
+        (frame, tier it was read from).
+    """
+    tier = pick_series_tier(start_time, end_time, tier)
+    if tier == SeriesTier.RAW:
+        return load_timeseries_window(start_time, end_time, vehicle_id, max_points=max_points), tier
+    return load_rollup_window(tier, start_time, end_time, vehicle_id), tier
+
+def series_data_path(tier: str) -> str:
+    """File or directory a tier is read from, its signature versions the served series."""
+    return LOCAL_TIME_SERIES_STORAGE_DIR if tier == SeriesTier.RAW else rollup_path(tier)
+
+def series_version(tier: str, end_time: datetime) -> tuple:
+    """Everything besides the tier's data a served series depends on, for its validator."""
+    return timeseries_window_version(end_time) if tier == SeriesTier.RAW else ()
+
+def load_header_info(vehicle_id: Optional[str] = None) -> dict:
+    """Header info of a vehicle from the dimension tables, without reading any readings."""
+    return parse_header_info(load_vehicle_dimension(), load_sensor_dimension(), vehicle_id)
+
+def aggregate_timeseries(timeseries_df: pd.DataFrame, data_key: str, timestamp_key: str) -> tuple[np.ndarray, np.ndarray]:
+    """Time ordered series with readings sharing a timestamp, e.g. across vehicles, averaged.
+
+    Returns:
+        (naive UTC datetime64[ms] timestamps, float values), rows missing either are dropped.
+    """
+    # UTC millis as stored, the timezone tag is dropped once here
+    timestamps = pd.to_datetime(timeseries_df[timestamp_key], utc=True).dt.tz_convert(None).to_numpy(dtype="datetime64[ms]")
+    values = pd.to_numeric(timeseries_df[data_key], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = ~(np.isnat(timestamps) | np.isnan(values))
+    unique_timestamps, inverse = np.unique(timestamps[valid], return_inverse=True)
+    sums = np.bincount(inverse, weights=values[valid], minlength=len(unique_timestamps))
+    counts = np.bincount(inverse, minlength=len(unique_timestamps))
+    return unique_timestamps, sums / np.maximum(counts, 1)
+
+def prepare_plot_series(
+    timeseries_df: pd.DataFrame,
+    data_key: str,
+    timestamp_key: str,
+    downsample_mode: str = DownsampleMode.NONE,
+    max_points: Optional[int] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Series as it is drawn, duplicate timestamps averaged and reduced to what the chart can show."""
+    with metrics.timer("frame_to_series", downsample=downsample_mode):
+        x_data, y_data = aggregate_timeseries(timeseries_df, data_key, timestamp_key)
+        return downsample(x_data, y_data, downsample_mode, max_points or point_budget())
+
+def plot_timeseries(
+    timeseries_df: pd.DataFrame,
+    data_key: str,
+    timestamp_key: str,
+    downsample_mode: str = DownsampleMode.NONE,
+    max_points: Optional[int] = None,
+) -> Figure:
+    """Plot timeseries data onto interactive plot.
+
+    Args:
+        timeseries_df: data to plot.
+        data_key: column of values.
+        timestamp_key: column of timestamps.
+        downsample_mode: how to reduce the series to max_points, one of DownsampleMode.
+        max_points: point budget, see downsampling.point_budget.
+    """
+
+    x_data, y_data = prepare_plot_series(timeseries_df, data_key, timestamp_key, downsample_mode, max_points)
+    with metrics.timer("figure_build", builder="plotly"):
+        trace = go.Scatter(
+                      x=x_data,
+                      y=y_data,
+                      mode='lines+markers',
+                      name=data_key,
+        )
+
+        # create the figure
+        fig = go.Figure(data=[trace])
+        _apply_timeseries_layout(fig, data_key)
+
+    return fig
+
+def _apply_timeseries_layout(fig: Figure, data_key: str) -> None:
+    """Titles and range slider shared by every timeseries chart."""
     x_axis_title = "Time"
     y_axis_title = f"{TimeseriesKeys.AMBIENT_TEMP} (°F)" if "Temp" in data_key else data_key
-    fig = go.Figure(data=[trace])
     fig.update_layout(title=f"{data_key} Over Time")
     fig.update_xaxes(title_text=x_axis_title)
     fig.update_yaxes(title_text=y_axis_title)
     fig.update_xaxes(rangeslider_visible=True)
 
-    return fig
\ No newline at end of file
+@lru_cache(maxsize=None)
+def timeseries_layout_json(data_key: str) -> str:
+    """Layout of a timeseries chart as json, built through plotly once per chart and reused."""
+    fig = go.Figure()
+    _apply_timeseries_layout(fig, data_key)
+    return json.dumps(fig.layout, cls=PlotlyJSONEncoder)
+
+def timeseries_figure_json(
+    timeseries_df: pd.DataFrame,
+    data_key: str,
+    timestamp_key: str,
+    downsample_mode: str = DownsampleMode.NONE,
+    max_points: Optional[int] = None,
+) -> str:
+    """Same json as plot_timeseries serialized with PlotlyJSONEncoder, written directly from the arrays.
+
+    Skips graph_objects validation and copying, the trace is encoded the way plotly
+    encodes it (ISO timestamps, base64 float64 values) and the layout json is prebuilt.
+    """
+    x_data, y_data = prepare_plot_series(timeseries_df, data_key, timestamp_key, downsample_mode, max_points)
+    with metrics.timer("figure_build", builder="direct"):
+        trace = {
+            "mode": "lines+markers",
+            "name": data_key,
+            "x": np.datetime_as_string(x_data).tolist(),
+            # plotly leaves empty arrays as plain lists
+            "y": {"dtype": "f8", "bdata": base64.b64encode(y_data.astype("<f8").tobytes()).decode("ascii")} if len(y_data) else [],
+            "type": "scatter",
+        }
+        return f'{{"data": [{json.dumps(trace)}], "layout": {timeseries_layout_json(data_key)}}}'
\ No newline at end of file
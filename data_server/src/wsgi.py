@@ -0,0 +1,5 @@
+#!/usr/bin/env python3
+"""WSGI entry point of the server app, served by gunicorn with the settings in gunicorn.conf.py."""
+from src.host_local_server import app, warm_caches
+
+application = app
@@ -0,0 +1,6 @@
+"""Make the server importable as under gunicorn, both as src.<module> and as bare <module>."""
+import os
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SERVER_DIR, os.path.join(SERVER_DIR, "src")]
@@ -0,0 +1,44 @@
+"""Door state rebuilt from change events."""
+import numpy as np
+import pandas as pd
+from src.change_events import state_at, state_duration_ms, step_times
+from src.visualization_helpers import rebuild_step_readings
+
+EVENT_MS = np.array([1_000, 5_000, 8_000], dtype=np.int64)
+EVENT_VALUES = np.array([1.0, 0.0, 1.0])
+
+
+def test_state_holds_from_each_event_and_is_unknown_before_the_first():
+    states = state_at(EVENT_MS, EVENT_VALUES, np.array([0, 999, 1_000, 4_999, 5_000, 20_000]))
+    assert np.isnan(states[:2]).all()
+    assert states[2:].tolist() == [1.0, 1.0, 0.0, 1.0]
+
+
+def test_step_times_line_up_on_multiples_of_the_step():
+    assert step_times(1_500, 6_000, 2_000).tolist() == [2_000, 4_000, 6_000]
+    assert step_times(2_000, 5_999, 2_000).tolist() == [2_000, 4_000]
+
+
+def test_state_durations_count_the_event_before_the_window():
+    # closed from 1s, open 5s to 8s, closed again, measured over 3s to 10s
+    assert state_duration_ms(EVENT_MS, EVENT_VALUES, 3_000, 10_000, 0.0) == (3_000, 7_000)
+    assert state_duration_ms(EVENT_MS, EVENT_VALUES, 3_000, 10_000, 1.0) == (4_000, 7_000)
+    # time before the first event is known neither way
+    assert state_duration_ms(EVENT_MS, EVENT_VALUES, 0, 2_000, 1.0) == (1_000, 1_000)
+
+
+def test_rebuilt_series_samples_the_step_and_every_event():
+    events_df = pd.DataFrame({
+        "sensor_id": [7, 7, 7, 9],
+        "ts": pd.to_datetime([1_000, 5_000, 8_000, 6_500], unit="ms", utc=True).as_unit("ms"),
+        "value": [1.0, 0.0, 1.0, 0.0],
+    })
+    readings_df = rebuild_step_readings(events_df, 3_000, 10_000, 4_000)
+
+    sensor_7 = readings_df[readings_df["sensor_id"] == 7]
+    sample_ms = sensor_7["ts"].dt.as_unit("ms").astype("int64").tolist()
+    assert sample_ms == [4_000, 5_000, 6_500, 8_000]
+    assert sensor_7["value"].tolist() == [1.0, 0.0, 0.0, 1.0]
+    # no readings before a sensor's first event
+    sensor_9 = readings_df[readings_df["sensor_id"] == 9]
+    assert sensor_9["ts"].dt.as_unit("ms").astype("int64").tolist() == [6_500, 8_000]
@@ -0,0 +1,36 @@
+"""Queries over a store laid out like the data handler's partitioned dataset."""
+from datetime import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.data_query import READING_SCHEMA, query_last_readings
+
+
+def _write_partition(root, date: str, vehicle: str, sensor_id: int, hours: list[int]) -> None:
+    partition_dir = root / f"date={date}" / f"vehicle={vehicle}"
+    partition_dir.mkdir(parents=True)
+    ts = pd.to_datetime([f"{date} {hour:02d}:00" for hour in hours], utc=True).as_unit("ms")
+    table = pa.Table.from_pandas(
+        pd.DataFrame({"sensor_id": sensor_id, "ts": ts, "value": [float(hour) for hour in hours]}),
+        schema=READING_SCHEMA, preserve_index=False,
+    )
+    pq.write_table(table, partition_dir / "part-0.parquet")
+
+
+def test_last_readings_search_back_from_the_time(tmp_path):
+    _write_partition(tmp_path, "2026-09-01", "10", 1, [3, 5])
+    _write_partition(tmp_path, "2026-10-04", "11", 2, [8])
+    _write_partition(tmp_path, "2026-10-05", "11", 2, [9, 13])
+
+    last_df = query_last_readings(str(tmp_path), datetime(2026, 10, 5, 12), [1, 2, 3])
+    assert dict(zip(last_df["sensor_id"], last_df["value"])) == {1: 5.0, 2: 9.0}
+
+    vehicle_df = query_last_readings(str(tmp_path), datetime(2026, 10, 5, 12), [1, 2], vehicle_id="10")
+    assert vehicle_df["sensor_id"].tolist() == [1]
+
+
+def test_last_readings_skip_newer_partitions_and_missing_sensors(tmp_path):
+    _write_partition(tmp_path, "2026-10-05", "11", 2, [9])
+    # nothing before the time, and a sensor that never reported, give no rows rather than an error
+    assert query_last_readings(str(tmp_path), datetime(2026, 10, 4), [2]).empty
+    assert query_last_readings(str(tmp_path), datetime(2026, 10, 6), [7]).empty
@@ -0,0 +1,51 @@
+"""Point selection of the downsampling modes."""
+import numpy as np
+import pytest
+from src.constants import DownsampleMode
+from src.downsampling import downsample, lttb_indices, minmax_indices, transition_indices
+
+
+def _series(num_points: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(7)
+    x = np.arange(num_points, dtype=np.float64) * 1000
+    y = np.sin(np.arange(num_points) / 50) + rng.normal(0, 0.1, num_points)
+    return x, y
+
+
+def test_lttb_keeps_the_ends_and_exactly_the_budget():
+    x, y = _series(10_000)
+    y[4321] = 50.0
+    indices = lttb_indices(x, y, 200)
+    assert len(indices) == 200
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert np.all(np.diff(indices) > 0)
+    # a lone spike makes the largest triangle of its bucket
+    assert 4321 in indices
+
+
+def test_minmax_keeps_the_envelope_within_the_budget():
+    _, y = _series(10_000)
+    indices = minmax_indices(y, 200)
+    assert len(indices) <= 200
+    assert np.all(np.diff(indices) > 0)
+    assert y[indices].min() == y.min() and y[indices].max() == y.max()
+
+
+def test_transitions_keep_every_change_of_a_step_series():
+    y = np.repeat([0.0, 1.0, 0.0, 1.0], 1000)
+    indices = transition_indices(y, 200)
+    assert indices.tolist() == [0, 1000, 2000, 3000, len(y) - 1]
+
+
+@pytest.mark.parametrize("mode", DownsampleMode.ALL)
+def test_series_within_the_budget_pass_through(mode):
+    x = np.arange(10).astype("datetime64[s]").astype("datetime64[ns]")
+    y = np.arange(10, dtype=np.float64)
+    kept_x, kept_y = downsample(x, y, mode, max_points=50)
+    assert np.array_equal(kept_x, x) and np.array_equal(kept_y, y)
+
+
+def test_unknown_mode_is_rejected():
+    x = np.arange(100).astype("datetime64[s]").astype("datetime64[ns]")
+    with pytest.raises(ValueError):
+        downsample(x, np.zeros(100), "median", max_points=10)
@@ -0,0 +1,42 @@
+"""The figure json written straight from the arrays against the one plotly builds."""
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from plotly.utils import PlotlyJSONEncoder
+from src.constants import DownsampleMode, TimeseriesKeys
+from src.visualization_helpers import plot_timeseries, timeseries_figure_json
+
+PLOTS = [
+    (TimeseriesKeys.AMBIENT_TEMP, TimeseriesKeys.AMBIENT_TEMP_TIMESTAMP),
+    (TimeseriesKeys.DOOR_STATE, TimeseriesKeys.DOOR_STATE_TIMESTAMP),
+]
+
+
+def _timeseries_df(num_rows: int) -> pd.DataFrame:
+    # millisecond timestamps, a gap and a duplicate time across vehicles, and a missing value
+    ts = pd.to_datetime(1_790_812_800_123 + np.arange(num_rows) * 61_007, unit="ms", utc=True).as_unit("ms")
+    if num_rows > 3:
+        ts = ts.delete(2).insert(3, ts[3])
+    temperatures = np.linspace(-3.5, 41.25, num_rows)
+    if num_rows > 5:
+        temperatures[5] = np.nan
+    return pd.DataFrame({
+        TimeseriesKeys.AMBIENT_TEMP_TIMESTAMP: ts,
+        TimeseriesKeys.AMBIENT_TEMP: temperatures,
+        TimeseriesKeys.DOOR_STATE_TIMESTAMP: ts,
+        TimeseriesKeys.DOOR_STATE: np.arange(num_rows) % 2 == 0,
+    })
+
+
+@pytest.mark.parametrize("num_rows", [0, 1, 12, 400])
+@pytest.mark.parametrize("downsample_mode", DownsampleMode.ALL)
+@pytest.mark.parametrize("data_key,timestamp_key", PLOTS)
+def test_direct_figure_json_matches_plotly(num_rows, downsample_mode, data_key, timestamp_key):
+    timeseries_df = _timeseries_df(num_rows)
+    plotly_json = json.dumps(
+        plot_timeseries(timeseries_df, data_key, timestamp_key, downsample_mode, max_points=50), cls=PlotlyJSONEncoder,
+    )
+    direct_json = timeseries_figure_json(timeseries_df, data_key, timestamp_key, downsample_mode, max_points=50)
+    # same trace, axes, titles and range slider, with dates and values serialized the same way
+    assert json.loads(direct_json) == json.loads(plotly_json)
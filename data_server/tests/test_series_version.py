@@ -0,0 +1,33 @@
+"""What besides the stored readings versions a raw window's frame and validator."""
+from datetime import datetime, timedelta, timezone
+import os
+from src.constants import DOOR_STEP_MIN_MS, SeriesTier
+import src.visualization_helpers as visualization_helpers
+
+
+def test_raw_version_follows_the_sensor_dimension(tmp_path, monkeypatch):
+    dimension_path = tmp_path / "sensors.parquet"
+    dimension_path.write_bytes(b"v1")
+    monkeypatch.setattr(visualization_helpers, "LOCAL_SENSOR_DIMENSION_FILE", str(dimension_path))
+    past_end = datetime(2026, 1, 1)
+    before = visualization_helpers.series_version(SeriesTier.RAW, past_end)
+
+    dimension_path.write_bytes(b"v2, rewritten by the handler")
+    os.utime(dimension_path, ns=(0, 1))
+    assert visualization_helpers.series_version(SeriesTier.RAW, past_end) != before
+    # rollup buckets carry no rebuilt door state and no dimension lookups
+    assert visualization_helpers.series_version(SeriesTier.HOURLY, past_end) == ()
+
+
+def test_raw_version_names_the_step_door_state_is_rebuilt_up_to(tmp_path, monkeypatch):
+    monkeypatch.setattr(visualization_helpers, "LOCAL_SENSOR_DIMENSION_FILE", str(tmp_path / "missing.parquet"))
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    _, rebuilt_until_ms = visualization_helpers.timeseries_window_version(now + timedelta(hours=1))
+    now_ms = int(now.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    assert rebuilt_until_ms % DOOR_STEP_MIN_MS == 0
+    assert now_ms - DOOR_STEP_MIN_MS < rebuilt_until_ms <= now_ms
+
+    # a window that ended is rebuilt up to its end, whenever it is requested
+    past_end = datetime(2026, 1, 1, 12, 0, 30)
+    _, past_until_ms = visualization_helpers.timeseries_window_version(past_end)
+    assert past_until_ms == int(past_end.replace(tzinfo=timezone.utc).timestamp() * 1000)
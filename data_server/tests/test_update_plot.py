@@ -0,0 +1,46 @@
+"""Validation of range job requests before anything is queued."""
+import pytest
+import src.host_local_server as host_local_server
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    submitted_ranges = []
+
+    def submit(start_time, end_time):
+        submitted_ranges.append((start_time, end_time))
+        return "job-1"
+
+    monkeypatch.setattr(host_local_server.range_job_queue, "submit", submit)
+    monkeypatch.setattr(host_local_server.range_job_queue, "get", lambda job_id: None)
+    return submitted_ranges
+
+
+@pytest.mark.parametrize("form", [
+    {},
+    {"start_time": "2026-10-01T00:00"},
+    {"start_time": "2026-10-01 00:00", "end_time": "2026-10-02T00:00"},
+    {"start_time": "2026-10-02T00:00", "end_time": "2026-10-01T00:00"},
+    {"start_time": "2026-10-01T00:00", "end_time": "2026-10-01T00:00"},
+    {"start_time": "2026-10-01T00:00", "end_time": "2026-10-02T00:00", "downsample": "median"},
+    {"start_time": "2026-10-01T00:00", "end_time": "2026-10-02T00:00", "width": "wide"},
+])
+def test_bad_ranges_are_rejected_before_queueing(submitted, form):
+    response = host_local_server.app.test_client().post("/api/update_plot", data=form)
+    assert response.status_code == 400
+    assert submitted == []
+
+
+def test_valid_range_is_queued(submitted):
+    form = {"start_time": "2026-10-01T00:00", "end_time": "2026-10-02T06:30", "width": "800"}
+    response = host_local_server.app.test_client().post("/api/update_plot", data=form)
+    assert response.status_code == 202
+    assert response.get_json()["job_id"] == "job-1"
+    assert [(start.isoformat(), end.isoformat()) for start, end in submitted] == [
+        ("2026-10-01T00:00:00", "2026-10-02T06:30:00"),
+    ]
+
+
+def test_unknown_job_is_not_found(submitted):
+    response = host_local_server.app.test_client().get("/api/update_plot/missing")
+    assert response.status_code == 404